@@ -0,0 +1,83 @@
+"""Compares the JSON codecs used for layout upload, download and stores.
+
+Builds a layout with 200 cards (including figure data, as sent in callback
+responses) and times the standard library against orjson (if installed).
+
+    python -m benchmarks.bench_codec
+"""
+
+import json
+import random
+import timeit
+
+from cardcanvas import codec
+
+N_CARDS = 200
+BREAKPOINTS = ["xl", "lg", "md", "sm", "xs", "xxs"]
+
+
+def make_layout(n_cards=N_CARDS):
+    random.seed(0)
+    card_config = {}
+    for i in range(n_cards):
+        card_config[f"card-{i}"] = {
+            "card_class": random.choice(["HistogramCard", "HeatMap", "MarkdownCard"]),
+            "settings": {
+                "title": f"Card {i}",
+                "description": "Some description " * 5,
+                "column": "Age",
+                "bins": random.randint(5, 50),
+                "filter": [random.random() for _ in range(20)],
+            },
+        }
+    card_layouts = {
+        bp: [
+            {"i": f"card-{i}", "x": (i * 4) % 24, "y": i // 6 * 2, "w": 4, "h": 2}
+            for i in range(n_cards)
+        ]
+        for bp in BREAKPOINTS
+    }
+    return {
+        "card_config": card_config,
+        "card_layouts": card_layouts,
+        "global_settings": {"theme": "light"},
+    }
+
+
+def make_figures(n_cards=N_CARDS, n_points=500):
+    return [
+        {
+            "data": [
+                {
+                    "type": "scatter",
+                    "x": list(range(n_points)),
+                    "y": [random.random() for _ in range(n_points)],
+                }
+            ],
+            "layout": {"title": {"text": f"Card {i}"}},
+        }
+        for i in range(n_cards)
+    ]
+
+
+def bench(name, payload, number=20):
+    text = json.dumps(payload)
+    results = {
+        "json.dumps": timeit.timeit(lambda: json.dumps(payload), number=number),
+        "json.loads": timeit.timeit(lambda: json.loads(text), number=number),
+        "codec.dumps": timeit.timeit(lambda: codec.dumps(payload), number=number),
+        "codec.loads": timeit.timeit(lambda: codec.loads(text), number=number),
+    }
+    print(f"{name} ({len(text) / 1024:.0f} KB)")
+    for label, seconds in results.items():
+        print(f"  {label:12} {seconds / number * 1000:8.2f} ms")
+    for op in ("dumps", "loads"):
+        speedup = results[f"json.{op}"] / results[f"codec.{op}"]
+        print(f"  {op} speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    engine = "orjson" if codec.orjson is not None else "json (orjson not installed)"
+    print(f"codec engine: {engine}")
+    bench(f"layout with {N_CARDS} cards", make_layout())
+    bench(f"figures of {N_CARDS} cards", make_figures())
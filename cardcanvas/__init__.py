@@ -1,3 +1,6 @@
 from .main import CardCanvas
 from .card_manager import Card, CardManager, GlobalSettings
+from .data import ColumnInfo, DataFrameSource, DataSource, load_frame
+from .layout import CardLayouts, LayoutItem
 from .settings import DEFAULT_THEME
+from .storage import FileStateStore, MemoryStateStore, SQLiteStateStore, StateStore
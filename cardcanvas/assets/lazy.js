@@ -0,0 +1,64 @@
+// Renders lazily loaded cards once they are scrolled into view.
+//
+// Cards rendered with `lazy_loading` contain a placeholder with the class
+// `cardcanvas-lazy`. When it becomes visible, the `data` of the matching
+// `{"type": "card-visible", "index": <card id>}` store is set, which triggers
+// the callback that renders the content of the card. Browsers without
+// IntersectionObserver render every card right away.
+(function () {
+    // Calls `done` once the card is revealed, Dash may not be loaded yet
+    function reveal(element, done) {
+        if (!window.dash_clientside || !window.dash_clientside.set_props) {
+            setTimeout(function () {
+                reveal(element, done);
+            }, 100);
+            return;
+        }
+        window.dash_clientside.set_props(
+            {type: "card-visible", index: element.dataset.cardId},
+            {data: true}
+        );
+        if (done) {
+            done(element);
+        }
+    }
+
+    let intersectionObserver = null;
+    if ("IntersectionObserver" in window) {
+        intersectionObserver = new IntersectionObserver(
+            function (entries) {
+                entries.forEach(function (entry) {
+                    if (entry.isIntersecting) {
+                        reveal(entry.target, function (element) {
+                            intersectionObserver.unobserve(element);
+                        });
+                    }
+                });
+            },
+            {rootMargin: "200px"}
+        );
+    }
+
+    function observe() {
+        document
+            .querySelectorAll(".cardcanvas-lazy:not([data-observed])")
+            .forEach(function (element) {
+                element.setAttribute("data-observed", "true");
+                if (intersectionObserver) {
+                    intersectionObserver.observe(element);
+                } else {
+                    reveal(element);
+                }
+            });
+    }
+
+    if ("MutationObserver" in window) {
+        new MutationObserver(observe).observe(document.body, {
+            childList: true,
+            subtree: true,
+        });
+    } else {
+        setInterval(observe, 500);
+    }
+    observe();
+})();
@@ -0,0 +1,36 @@
+// Receives the content of streamed cards over server-sent events.
+//
+// The `cardcanvas-stream-store` holds the url of the stream of the current
+// dashboard. Every message contains the id of a card and its new content, which
+// replaces the children of `{"type": "card-content", "index": <card id>}`.
+(function () {
+    window.dash_clientside = window.dash_clientside || {};
+    window.dash_clientside.cardcanvas = window.dash_clientside.cardcanvas || {};
+
+    let source = null;
+
+    window.dash_clientside.cardcanvas.openStream = function (data) {
+        if (source) {
+            source.close();
+            source = null;
+        }
+        if (!data || !data.url || !("EventSource" in window)) {
+            return;
+        }
+        source = new EventSource(data.url);
+        source.onmessage = function (event) {
+            const message = JSON.parse(event.data);
+            window.dash_clientside.set_props(
+                {type: "card-content", index: message.id},
+                {children: message.content}
+            );
+        };
+        source.onerror = function () {
+            // The subscription ends with the connection; the next change of
+            // the dashboard opens a new one.
+            if (source && source.readyState === EventSource.CLOSED) {
+                source = null;
+            }
+        };
+    };
+})();
@@ -1,14 +1,36 @@
 from __future__ import annotations
+import copy
+import functools
 import logging
+import math
+import multiprocessing
+import threading
 import traceback
 
 from abc import ABC, abstractmethod
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from dataclasses import dataclass, field
 from typing import Any, Type
+from uuid import uuid4
 
 import dash_mantine_components as dmc
-from dash import dcc, html
+from dash import Patch, dcc, html
 from dash_iconify import DashIconify
 
+from .cache import CacheStats, LRUCache
+from .data import DataSource, init_worker, worker_state
+from .figures import target_points
+from .helpers import TrackedDict, fingerprint
+from .layout import CardLayouts, LayoutItem
+
+_MISSING = object()
+
 
 class Card(ABC):
     """Class to represent a card on the dashboard. This is an abstract class.
@@ -30,8 +52,22 @@ class Card(ABC):
     icon = "mdi:file-document-edit"
     color: str = "blue"
     interval: int | None = None
+    stream: bool = False  # Push updates from the server instead of polling
+    # The global settings used by render(). If not set, they are recorded while
+    # the card renders.
+    global_settings_keys: list[str] | None = None
     grid_settings: dict[str, int] | None = None
+    cache: bool = True  # Set this to False to always call render() for this card
     debug = False  # Set this to True to display full error traceback on card
+    # The name of the data source registered on the card manager used as self.data
+    data_source: str = "default"
+    data: DataSource | None = None
+    # The number of grid columns the card spans, set by the card manager before
+    # rendering when the layout is known
+    grid_width: int | None = None
+    # Points drawn per grid column, see max_points(). Cards setting this are
+    # rendered again when they are resized.
+    points_per_column: int | None = None
 
     def __init__(
         self,
@@ -50,7 +86,7 @@ class Card(ABC):
                 it gets rendered.
         """
         self.id = card_id
-        self.global_settings = global_settings or {}
+        self.global_settings = TrackedDict(global_settings or {})
         self.settings = card_settings or {}
 
     @abstractmethod
@@ -62,77 +98,189 @@ class Card(ABC):
         """
         pass
 
-    def render_container(self):
+    @property
+    def figure_id(self) -> dict[str, str]:
+        """The id of the graph of the card which is zoomed with `render_relayout`."""
+        return {"type": "card-figure", "index": self.id}
+
+    def max_points(self) -> int:
+        """Return the number of points worth drawing in a figure of the card.
+
+        This grows with the width of the card in grid columns, see
+        `figures.target_points`. Pass it to `figures.downsample` so long series
+        are not sent to the browser point by point.
+        """
+        width = self.grid_width or (self.grid_settings or {}).get("w", 4)
+        return target_points(width, self.points_per_column or 250)
+
+    def render_relayout(self, relayout_data: dict[str, Any]) -> Any:
+        """Update the figure of the card after the user zoomed or panned it.
+
+        Override this to fetch more detail for the visible range, for eg: with
+        `figures.relayout_x_range` and `figures.downsample`. The graph must use
+        `self.figure_id` as its id.
+
+        Args:
+            relayout_data: The `relayoutData` of the graph.
+
+        Returns:
+            The new figure, a `dash.Patch` of it, or None to leave it unchanged.
+        """
+        return None
+
+    def global_settings_dependencies(self) -> frozenset[str] | None:
+        """Return the keys of the global settings this card depends on.
+
+        These are the `global_settings_keys` of the class if set, otherwise the
+        keys read from `self.global_settings` so far.
+
+        Returns:
+            frozenset[str] | None: The keys, or None if the card depends on all
+                the global settings (for eg: it iterated over them).
+        """
+        if self.global_settings_keys is not None:
+            return frozenset(self.global_settings_keys)
+        if not isinstance(self.global_settings, TrackedDict):
+            return None
+        if self.global_settings.accessed_all:
+            return None
+        return frozenset(self.global_settings.accessed)
+
+    def render_content(self):
+        """Render the card, replacing any exception with an error message.
+
+        Returns:
+            The output of `render()` or a component describing the error.
+        """
+        try:
+            return self.render()
+        except Exception as e:
+            return self.render_error(e)
+
+    def render_error(self, e: Exception):
+        """Render the component shown in place of the card when `render()` fails.
+
+        Args:
+            e: The exception raised by `render()`.
+        """
+        logging.error(f"Error rendering card {self.id}: {str(e)}")
+        logging.error(traceback.format_exc())
+        if self.debug:
+            return html.Div(
+                html.Pre(
+                    f"Error rendering card: {str(e)}\n{traceback.format_exc()}",
+                ),
+                style={
+                    "color": "red",
+                    "width": "100%",
+                    "height": "100%",
+                    "overflow": "auto",
+                },
+            )
+        return dmc.Alert(
+            dmc.Text(f"Error rendering card: {str(e)}", ff="Consolas"),
+            color="red",
+            title="Error",
+            h="100%",
+        )
+
+    def render_placeholder(self):
+        """Render the component shown while the content of the card is loading.
+
+        This is only used when the dashboard loads cards progressively. It should
+        be cheap to render.
+        """
+        return dmc.Skeleton(h="100%", w="100%", radius="sm")
+
+    def render_loader(self, lazy: bool = False):
+        """Render a placeholder that is replaced by the card content once loaded.
+
+        Args:
+            lazy: If True, the content is only loaded once the card is scrolled
+                into view.
+
+        Returns:
+            dash.html.Div: A div wrapping the placeholder. Its id (or the
+                `card-visible` store if lazy) triggers the callback which renders
+                the content of the card.
+        """
+        if not lazy:
+            return html.Div(
+                self.render_placeholder(),
+                id={"type": "card-loader", "index": self.id},
+                style={"height": "100%"},
+            )
+        return html.Div(
+            [
+                self.render_placeholder(),
+                dcc.Store(id={"type": "card-visible", "index": self.id}),
+            ],
+            id={"type": "card-loader", "index": self.id},
+            className="cardcanvas-lazy",
+            style={"height": "100%"},
+            **{"data-card-id": self.id},
+        )
+
+    def render_container(self, card_content: Any = None):
         """Renders a card with a menu on the top right corner.
 
+        Args:
+            card_content: The already rendered content of the card. If not given,
+                `render_content()` is called.
+
         Returns:
             dash.html.Div: The card with a menu at the top.
         """
+        select = dmc.Checkbox(
+            id={"type": "card-select", "index": self.id},
+            size="xs",
+            className="no-drag",
+            checked=False,
+        )
+        menu = dmc.Menu(
+            [
+                dmc.MenuTarget(
+                    dmc.ActionIcon(
+                        DashIconify(icon="material-symbols:more-horiz"),
+                        size="xs",
+                        radius="xl",
+                        variant="light",
+                        color="grey",
+                    )
+                ),
+                dmc.MenuDropdown(
+                    [
+                        dmc.MenuItem(
+                            "Settings",
+                            id={"type": "card-settings", "index": self.id},
+                            className="no-drag",
+                            leftSection=DashIconify(icon="mdi:cog-outline"),
+                        ),
+                        dmc.MenuItem(
+                            "Duplicate",
+                            id={"type": "card-duplicate", "index": self.id},
+                            className="no-drag",
+                            leftSection=DashIconify(icon="mdi:content-copy"),
+                        ),
+                        dmc.MenuItem(
+                            "Delete",
+                            id={"type": "card-delete", "index": self.id},
+                            className="no-drag",
+                            leftSection=DashIconify(icon="mdi:trash-can-outline"),
+                            c="red",
+                        ),
+                    ]
+                ),
+            ],
+        )
         buttons = html.Div(
-            dmc.Menu(
-                [
-                    dmc.MenuTarget(
-                        dmc.ActionIcon(
-                            DashIconify(icon="material-symbols:more-horiz"),
-                            size="xs",
-                            radius="xl",
-                            variant="light",
-                            color="grey",
-                        )
-                    ),
-                    dmc.MenuDropdown(
-                        [
-                            dmc.MenuItem(
-                                "Settings",
-                                id={"type": "card-settings", "index": self.id},
-                                className="no-drag",
-                                leftSection=DashIconify(icon="mdi:cog-outline"),
-                            ),
-                            dmc.MenuItem(
-                                "Duplicate",
-                                id={"type": "card-duplicate", "index": self.id},
-                                className="no-drag",
-                                leftSection=DashIconify(icon="mdi:content-copy"),
-                            ),
-                            dmc.MenuItem(
-                                "Delete",
-                                id={"type": "card-delete", "index": self.id},
-                                className="no-drag",
-                                leftSection=DashIconify(icon="mdi:trash-can-outline"),
-                                c="red",
-                            ),
-                        ]
-                    ),
-                ],
-            ),
+            dmc.Group([select, menu], gap=4),
             id={"type": "card-menu", "index": self.id},
             className="no-drag card-menu",
         )
-        try:
-            card_content = self.render()
-        except Exception as e:
-            logging.error(f"Error rendering card {self.id}: {str(e)}")
-            logging.error(traceback.format_exc())
-            if self.debug:
-                card_content = html.Div(
-                    html.Pre(
-                        f"Error rendering card: {str(e)}\n{traceback.format_exc()}",
-                    ),
-                    style={
-                        "color": "red",
-                        "width": "100%",
-                        "height": "100%",
-                        "overflow": "auto",
-                    },
-                )
-            else:
-                card_content = dmc.Alert(
-                    dmc.Text(f"Error rendering card: {str(e)}", ff="Consolas"),
-                    color="red",
-                    title="Error",
-                    h="100%",
-                )
-        children: list[Any] = [
+        if card_content is None:
+            card_content = self.render_content()
+        children = [
             dcc.Loading(
                 html.Div(
                     id={"type": "card-content", "index": self.id},
@@ -142,15 +290,9 @@ class Card(ABC):
                 parent_style={"height": "100%"},
             ),
             buttons,
+            # Set once the content of a progressively loaded card is rendered
+            dcc.Store(id={"type": "card-hash", "index": self.id}),
         ]
-        if self.interval:
-            children.append(
-                dcc.Interval(
-                    id={"type": "card-interval", "index": self.id},
-                    interval=self.interval,
-                )
-            )
-
         return html.Div(
             children,
             style={"position": "relative", "height": "100%"},
@@ -177,6 +319,7 @@ class Card(ABC):
         """
         return dmc.Text("Settings not implemented yet.")
 
+
 class GlobalSettings(ABC):
     """Class to represent the global settings for the dashboard. This is an abstract class.
 
@@ -212,41 +355,727 @@ class GlobalSettings(ABC):
         """
         pass
 
+
+@dataclass
+class CardChanges:
+    """The result of `CardManager.apply_operations`.
+
+    The patches turn the old card config and card layouts into the new ones.
+    They can only be applied to stores which already hold a card config and
+    card layouts.
+    """
+
+    card_config: dict[str, dict[str, Any]]
+    card_layouts: dict[str, list[dict[str, Any]]]
+    config_patch: Patch
+    layouts_patch: Patch
+    added: list[str] = field(default_factory=list)
+
+
+@dataclass
+class CompactionReport:
+    """What `CardManager.compact_state` removed from a dashboard."""
+
+    # Cards whose class is not registered
+    unknown_cards: list[str] = field(default_factory=list)
+    # Layout items of cards which are not in the card config, by breakpoint
+    orphaned_items: dict[str, list[str]] = field(default_factory=dict)
+    # Layout items repeating the item of a card in the same breakpoint
+    duplicate_items: int = 0
+    # Cards with a copy of their own id in their config
+    redundant_ids: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(
+            self.unknown_cards
+            or self.orphaned_items
+            or self.duplicate_items
+            or self.redundant_ids
+        )
+
+    def __str__(self) -> str:
+        orphaned = sum(len(items) for items in self.orphaned_items.values())
+        return (
+            f"removed {len(self.unknown_cards)} card(s) of unknown classes,"
+            f" {orphaned} orphaned and {self.duplicate_items} duplicate layout"
+            f" item(s) and {self.redundant_ids} redundant card id(s)"
+        )
+
+
+def _render_card(card: Card) -> tuple[Any, bool, frozenset[str] | None]:
+    """Render a card and return the content, whether `render()` succeeded and the
+    global settings the card depends on.
+
+    This is a module level function so that it can be sent to a process pool.
+    """
+    try:
+        content = card.render()
+    except Exception as e:
+        return card.render_error(e), False, None
+    return content, True, card.global_settings_dependencies()
+
+
 class CardManager:
     """Class to manage the cards on the dashboard."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        cache_size: int = 256,
+        cache_ttl: float | None = None,
+        executor: str | Executor | None = None,
+        max_workers: int | None = None,
+    ) -> None:
+        """Initialize the card manager.
+
+        Args:
+            cache_size: The maximum number of rendered cards kept in the render
+                cache. Set this to 0 to disable the cache.
+            cache_ttl: The number of seconds a rendered card stays in the cache.
+                `None` keeps it until it is evicted or invalidated.
+            executor: How cards are rendered when the dashboard is loaded.
+                `None` renders them one after the other, "thread" uses a thread
+                pool (for cards waiting on I/O) and "process" uses a process pool
+                (for CPU bound cards; cards and their output must be picklable).
+                An existing `concurrent.futures.Executor` can also be passed.
+            max_workers: The number of workers of the thread or process pool.
+        """
+        if executor not in (None, "thread", "process") and not isinstance(
+            executor, Executor
+        ):
+            raise ValueError(
+                f"Invalid executor: {executor!r}. Use 'thread', 'process' or None."
+            )
         self.card_classes: dict[str, Type[Card]] = {}
         self.global_settings_class: Type[GlobalSettings] | None = None
+        self.data_sources: dict[str, DataSource] = {}
+        self.render_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        # Card instances looked up one at a time by card_object(), by session
+        self.instance_cache = LRUCache(maxsize=max(cache_size, 1), ttl=cache_ttl)
+        # Global settings read by each card, recorded when it is rendered
+        self.global_dependencies = LRUCache(maxsize=4096)
+        self.executor = executor
+        self.max_workers = max_workers
+        self._executor: Executor | None = (
+            executor if isinstance(executor, Executor) else None
+        )
+        # Concurrent requests must not each create a pool
+        self._executor_lock = threading.Lock()
 
     def card_objects(
         self,
         card_config: dict[str, dict[str, Any]],
         global_settings: dict[str, str] | None = None,
+        widths: dict[str, int] | None = None,
     ) -> dict[str, Card]:
         card_config = card_config or {}
+        widths = widths or {}
         global_settings = global_settings or {}
         cards: dict[str, Card] = {}
         for card_id, card_settings in card_config.items():
             card_class = card_settings.get("card_class")
             if not card_class or card_class not in self.card_classes:
                 continue
-            card = self.card_classes[card_class](
-                card_id, global_settings, card_settings.get("settings", {})
+            cards[card_id] = self._create_card(
+                card_class,
+                card_id,
+                global_settings,
+                card_settings.get("settings", {}),
+                widths.get(card_id),
             )
-            cards[card_id] = card
         return cards
 
+    def card_object(
+        self,
+        card_id: str,
+        card_config: dict[str, dict[str, Any]],
+        global_settings: dict[str, str] | None = None,
+        grid_width: int | None = None,
+        session: str | None = None,
+    ) -> Card | None:
+        """Return the card object for a single card of the dashboard.
+
+        Unlike `card_objects`, this only looks at the config of the requested
+        card. Within a session, the card object is reused if it was created
+        before with the same settings. Card objects are never shared between
+        sessions, since rendering may change them.
+
+        Args:
+            card_id: The id of the card.
+            card_config: The card config of the dashboard.
+            global_settings: The global settings for the dashboard.
+            grid_width: The number of grid columns the card spans, if known.
+            session: The key of the browser session. If None, a new card object
+                is returned.
+
+        Returns:
+            Card | None: The card object, or None if the card does not exist or
+                its class is not registered.
+        """
+        card_settings = (card_config or {}).get(card_id)
+        if not card_settings:
+            return None
+        card_class = card_settings.get("card_class")
+        if not card_class or card_class not in self.card_classes:
+            return None
+        global_settings = global_settings or {}
+        settings = card_settings.get("settings", {})
+        if session is None:
+            return self._create_card(
+                card_class, card_id, global_settings, settings, grid_width
+            )
+        key = (
+            card_class,
+            card_id,
+            fingerprint([settings, global_settings, grid_width]),
+            session,
+        )
+        card = self.instance_cache.get(key)
+        if card is None:
+            card = self._create_card(
+                card_class, card_id, global_settings, settings, grid_width
+            )
+            self.instance_cache.set(key, card)
+        return card
+
+    def _create_card(
+        self,
+        card_class: str,
+        card_id: str,
+        global_settings: dict[str, Any],
+        settings: dict[str, Any],
+        grid_width: int | None = None,
+    ) -> Card:
+        card = self.card_classes[card_class](card_id, global_settings, settings)
+        if grid_width is not None:
+            card.grid_width = grid_width
+        data = self.data_sources.get(card.data_source)
+        if data is not None:
+            card.data = data
+        return card
+
+    def apply_operations(
+        self,
+        card_config: dict[str, dict[str, Any]] | None,
+        card_layouts: dict[str, list[dict[str, Any]]] | None,
+        operations: list[dict[str, Any]],
+        grid_cols: dict[str, int] | None = None,
+        compact: bool = False,
+    ) -> CardChanges:
+        """Apply several changes to the cards of a dashboard at once.
+
+        The operations are applied to copies of the card config and card layouts,
+        in order. If one of them is invalid, a ValueError is raised and nothing
+        is changed. Each operation is a dict with an "op" key:
+
+        - `{"op": "add", "card_class": ..., "settings": {...}, "layout": {...}}`
+          adds a card. "settings", "layout" (x, y, w and h) and "card_id" are
+          optional.
+        - `{"op": "duplicate", "card_id": ..., "layout": {...}}` copies a card.
+          "layout" is optional and defaults to the layout of the copied card.
+        - `{"op": "delete", "card_id": ...}` removes a card.
+        - `{"op": "update", "card_id": ..., "settings": {...}}` replaces the
+          settings of a card.
+
+        Args:
+            card_config: The card config of the dashboard.
+            card_layouts: The card layouts of the dashboard.
+            operations: The operations to apply.
+            grid_cols: The number of columns of the grid for each breakpoint. If
+                given, the breakpoints to which cards were added are packed
+                (see `CardLayouts.pack`), so the new cards do not overlap
+                others and fit the width of each breakpoint.
+            compact: Whether packing also removes empty rows.
+
+        Returns:
+            CardChanges: The new card config and card layouts, and the patches
+                to send to the stores instead of the whole values.
+        """
+        card_config = copy.deepcopy(card_config or {})
+        layouts = CardLayouts(card_layouts or {"lg": []})
+        config_patch = Patch()
+        layouts_patch = Patch()
+        added = []
+        # Items are patched by position, which only matches the stored lists
+        # if no card was repeated in them. The changed lists which repeated a
+        # card are sent whole.
+        rewritten = set()
+
+        def patchable(breakpoint):
+            if layouts.is_normalized(breakpoint):
+                return True
+            rewritten.add(breakpoint)
+            return False
+
+        def add_card(card_id, card, layout):
+            card_config[card_id] = card
+            config_patch[card_id] = card
+            added.append(card_id)
+            # The items of new cards are appended to the patch at the end, once
+            # they are packed
+            for breakpoint in layouts.breakpoints:
+                layouts.add(layout(breakpoint), breakpoint)
+
+        def default_item(card_id, breakpoint):
+            return LayoutItem(card_id, x=0, y=layouts.bottom(breakpoint))
+
+        def copy_item(card_id, new_card_id, layout, breakpoint):
+            if layout:
+                return LayoutItem.from_dict({**layout, "i": new_card_id})
+            item = layouts.get(card_id, breakpoint)
+            if item is None:
+                return default_item(new_card_id, breakpoint)
+            return item.copy(new_card_id)
+
+        def new_item(card_id, layout, grid_settings, breakpoint):
+            return LayoutItem.from_dict(
+                {
+                    **(layout or default_item(card_id, breakpoint).to_dict()),
+                    **grid_settings,
+                    "i": card_id,
+                }
+            )
+
+        for operation in operations:
+            op = operation.get("op")
+            card_id = operation.get("card_id")
+            if op != "add" and card_id not in card_config:
+                raise ValueError(f"Unknown card: {card_id!r}")
+            if op == "add":
+                card_class = operation.get("card_class")
+                if card_class not in self.card_classes:
+                    raise ValueError(f"Unknown card class: {card_class!r}")
+                new_card_id = card_id or str(uuid4())
+                grid_settings = self.card_classes[card_class].grid_settings
+                if not isinstance(grid_settings, dict):
+                    grid_settings = {}
+                add_card(
+                    new_card_id,
+                    {
+                        "card_class": card_class,
+                        "settings": copy.deepcopy(operation.get("settings", {})),
+                    },
+                    functools.partial(
+                        new_item, new_card_id, operation.get("layout"), grid_settings
+                    ),
+                )
+            elif op == "duplicate":
+                new_card_id = str(uuid4())
+                add_card(
+                    new_card_id,
+                    copy.deepcopy(card_config[card_id]),
+                    functools.partial(
+                        copy_item, card_id, new_card_id, operation.get("layout")
+                    ),
+                )
+            elif op == "delete":
+                del card_config[card_id]
+                del config_patch[card_id]
+                indices = {
+                    breakpoint: layouts.index(card_id, breakpoint)
+                    for breakpoint in layouts.breakpoints
+                }
+                layouts.delete(card_id)
+                if card_id in added:
+                    # Its items were not sent yet
+                    added.remove(card_id)
+                    continue
+                for breakpoint, index in indices.items():
+                    if index is not None and patchable(breakpoint):
+                        del layouts_patch[breakpoint][index]
+            elif op == "update":
+                settings = copy.deepcopy(operation.get("settings", {}))
+                card_config[card_id]["settings"] = settings
+                config_patch[card_id]["settings"] = settings
+            else:
+                raise ValueError(f"Unknown operation: {op!r}")
+        if grid_cols and added:
+            new_ids = set(added)
+            before = {
+                breakpoint: {
+                    item.i: (item.x, item.y, item.w)
+                    for item in layouts.items(breakpoint)
+                    if item.i not in new_ids
+                }
+                for breakpoint in layouts.breakpoints
+            }
+            for breakpoint in layouts.pack_all(grid_cols, compact):
+                if not patchable(breakpoint):
+                    continue
+                # Only the positions that changed are sent. The items of the
+                # other cards come first, in the order of the stored layout.
+                for index, item in enumerate(layouts.items(breakpoint)):
+                    position = before[breakpoint].get(item.i)
+                    if position is None:
+                        continue
+                    for key, old, new in zip("xyw", position, (item.x, item.y, item.w)):
+                        if old != new:
+                            layouts_patch[breakpoint][index][key] = new
+        for breakpoint in layouts.breakpoints:
+            for card_id in added:
+                item = layouts.get(card_id, breakpoint)
+                if item is not None and patchable(breakpoint):
+                    layouts_patch[breakpoint].append(item.to_dict())
+        for breakpoint in rewritten:
+            layouts_patch[breakpoint] = [
+                item.to_dict() for item in layouts.items(breakpoint)
+            ]
+        return CardChanges(
+            card_config, layouts.to_dict(), config_patch, layouts_patch, added
+        )
+
+    def compact_state(
+        self,
+        card_config: dict[str, dict[str, Any]] | None,
+        card_layouts: dict[str, list[dict[str, Any]]] | None,
+    ) -> tuple[
+        dict[str, dict[str, Any]], dict[str, list[dict[str, Any]]], CompactionReport
+    ]:
+        """Remove the parts of a dashboard that can never be displayed.
+
+        - Cards whose class is not registered, with their layout items.
+        - Layout items of cards that are not in the card config.
+        - Repeated layout items of a card in the same breakpoint (the first
+          one is kept, like the grid does).
+        - The "id" key of card configs, which repeats the key of the card.
+
+        Cards without a layout item are kept, the grid places them itself.
+
+        Args:
+            card_config: The card config of the dashboard.
+            card_layouts: The card layouts of the dashboard.
+
+        Returns:
+            tuple: The compacted card config and card layouts, and a report of
+                what was removed. The arguments are not modified.
+        """
+        report = CompactionReport()
+        new_config = {}
+        for card_id, card in (card_config or {}).items():
+            if card.get("card_class") not in self.card_classes:
+                report.unknown_cards.append(card_id)
+                continue
+            if "id" in card:
+                card = {key: value for key, value in card.items() if key != "id"}
+                report.redundant_ids += 1
+            new_config[card_id] = card
+        new_layouts = {}
+        for breakpoint, items in (card_layouts or {}).items():
+            seen = set()
+            new_items = []
+            for item in items or []:
+                card_id = item.get("i")
+                if card_id not in new_config:
+                    report.orphaned_items.setdefault(breakpoint, []).append(card_id)
+                elif card_id in seen:
+                    report.duplicate_items += 1
+                else:
+                    seen.add(card_id)
+                    new_items.append(item)
+            new_layouts[breakpoint] = new_items
+        if report.changed:
+            logging.info(f"Compacted the dashboard state: {report}")
+        return new_config, new_layouts, report
+
+    def relevant_global_settings(
+        self,
+        card_class: str,
+        card_id: str,
+        settings: dict[str, Any],
+        global_settings: dict[str, Any] | None,
+    ) -> dict[str, Any]:
+        """Return the part of the global settings a card depends on.
+
+        Until the card has been rendered once, it is assumed to depend on all
+        of them.
+        """
+        # Reading a tracked dict here would count as a dependency of the card
+        if isinstance(global_settings, TrackedDict):
+            global_settings = global_settings.untracked()
+        global_settings = global_settings or {}
+        card_type = self.card_classes.get(card_class)
+        keys = card_type.global_settings_keys if card_type else None
+        if keys is None:
+            keys = self.global_dependencies.get(
+                (card_class, card_id, fingerprint(settings))
+            )
+        if keys is None:
+            return global_settings
+        return {key: global_settings[key] for key in keys if key in global_settings}
+
+    def card_hash(
+        self,
+        card_id: str,
+        card_settings: dict[str, Any],
+        global_settings: dict[str, Any] | None = None,
+        grid_width: int | None = None,
+    ) -> str:
+        """Return a hash of everything a rendered card depends on.
+
+        This is the config of the card and the global settings it reads, so
+        changing a global setting only changes the hash of the cards using it.
+        For cards which set `points_per_column`, this includes the width of the
+        card, so they are rendered again when resized.
+        """
+        card_class = card_settings.get("card_class")
+        relevant = self.relevant_global_settings(
+            card_class,
+            card_id,
+            card_settings.get("settings", {}),
+            global_settings,
+        )
+        card_type = self.card_classes.get(card_class)
+        if card_type is not None and card_type.points_per_column:
+            return fingerprint([card_settings, relevant, grid_width])
+        return fingerprint([card_settings, relevant])
+
+    def _record_dependencies(
+        self, card: Card, dependencies: frozenset[str] | None
+    ) -> None:
+        key = (type(card).__name__, card.id, fingerprint(card.settings))
+        if dependencies is None:
+            self.global_dependencies.delete(key)
+        else:
+            self.global_dependencies.set(key, dependencies)
+
+    def cache_key(self, card: Card) -> tuple[str, str, str]:
+        """Return the render cache key of a card.
+
+        The card id is part of the key since `render()` may use it in the ids of
+        the components it returns. Only the global settings the card depends on
+        are part of the key, and the width of the card if it is known.
+        """
+        relevant = self.relevant_global_settings(
+            type(card).__name__, card.id, card.settings, card.global_settings
+        )
+        parts = [card.settings, relevant]
+        if card.grid_width is not None:
+            parts.append(card.grid_width)
+        return (type(card).__name__, card.id, fingerprint(parts))
+
+    def is_cacheable(self, card: Card) -> bool:
+        """Cards that opt out or refresh on an interval are never cached."""
+        return bool(card.cache) and not card.interval
+
+    def render_content(self, card: Card) -> Any:
+        """Render the content of a card, using the render cache when possible.
+
+        Errors raised by `render()` are rendered by the card and never cached.
+        """
+        if not self.is_cacheable(card):
+            content, ok, dependencies = _render_card(card)
+            self._record_dependencies(card, dependencies)
+            return content
+        content = self.render_cache.get(self.cache_key(card), _MISSING)
+        if content is _MISSING:
+            content, ok, dependencies = _render_card(card)
+            self._record_dependencies(card, dependencies)
+            if ok:
+                self.render_cache.set(self.cache_key(card), content)
+        return content
+
+    def _get_executor(self) -> Executor:
+        if self._executor is not None:
+            return self._executor
+        with self._executor_lock:
+            if self._executor is not None:
+                return self._executor
+            if self.executor == "process":
+                # The data sources are sent once to each process, the cards
+                # sent to render only refer to them
+                sources = {id(source): source for source in self.data_sources.values()}
+                # Forking a multithreaded server can copy locks held by other
+                # threads, so the processes are started fresh
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                    initargs=(worker_state(list(sources.values())),),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="cardcanvas-render",
+                )
+            return self._executor
+
+    def _reset_executor(self, executor: Executor | None) -> None:
+        # A pool which was shut down or broke is replaced on the next render,
+        # unless it was passed to the card manager
+        if self.executor not in ("thread", "process"):
+            return
+        with self._executor_lock:
+            if executor is not None and self._executor is executor:
+                executor.shutdown(wait=False)
+                self._executor = None
+
+    def _submit(self, card: Card) -> Future | None:
+        executor = self._get_executor()
+        try:
+            return executor.submit(_render_card, card)
+        except RuntimeError:
+            # The pool was shut down by register_data_source() meanwhile, or a
+            # worker died
+            self._reset_executor(executor)
+        try:
+            return self._get_executor().submit(_render_card, card)
+        except RuntimeError:
+            return None
+
+    def _render_cards(
+        self, cards: list[Card]
+    ) -> list[tuple[Any, bool, frozenset[str] | None]]:
+        if self.executor is None or len(cards) < 2:
+            return [_render_card(card) for card in cards]
+        # The data sources were not sent to the processes of a pool passed to
+        # the card manager, the cards using one are rendered here
+        local = isinstance(self.executor, ProcessPoolExecutor)
+        futures = [
+            None if local and card.data is not None else self._submit(card)
+            for card in cards
+        ]
+        results = []
+        # Each card is collected on its own, so one card failing outside of
+        # render() does not fail the others
+        for card, future in zip(cards, futures):
+            if future is None:
+                results.append(_render_card(card))
+                continue
+            try:
+                results.append(future.result())
+            except BrokenExecutor as e:
+                # A worker died, rendering the card here could take the server
+                # down with it
+                self._reset_executor(self._executor)
+                results.append((card.render_error(e), False, None))
+            except Exception as e:
+                # The card or its content can not be sent to a process
+                logging.warning(f"Rendering card {card.id} in the server: {e}")
+                results.append(_render_card(card))
+        return results
+
     def render(
         self,
         card_config: dict[str, dict[str, Any]],
         global_settings: dict[str, str] | None = None,
         debug=False,
+        progressive=False,
+        lazy=False,
+        widths: dict[str, int] | None = None,
     ) -> list[html.Div]:
-        cards = self.card_objects(card_config, global_settings)
-        for card in cards.values():
+        """Render the cards of a dashboard.
+
+        Args:
+            card_config: The card config of the dashboard.
+            global_settings: The global settings of the dashboard.
+            debug: Whether errors are shown with their full traceback.
+            progressive: If True, cards which are not in the render cache are
+                rendered as a placeholder, and their content is loaded by a
+                separate callback.
+            lazy: If True (and progressive), placeholders are only loaded once
+                they are scrolled into view.
+            widths: The number of grid columns each card spans, by card id. See
+                `Card.max_points`.
+        """
+        cards = list(self.card_objects(card_config, global_settings, widths).values())
+        for card in cards:
             card.debug = debug
-        return [card.render_container() for card in cards.values()]
+        if progressive:
+            contents = [self._cached_content(card) for card in cards]
+            return [
+                card.render_container(
+                    card.render_loader(lazy=lazy) if content is _MISSING else content
+                )
+                for card, content in zip(cards, contents)
+            ]
+        return [
+            card.render_container(content)
+            for card, content in zip(cards, self.render_contents(cards))
+        ]
+
+    def _cached_content(self, card: Card) -> Any:
+        if not self.is_cacheable(card):
+            return _MISSING
+        return self.render_cache.get(self.cache_key(card), _MISSING)
+
+    def render_contents(self, cards: list[Card]) -> list[Any]:
+        """Render the content of several cards, using the executor if configured.
+
+        Cacheable cards are looked up in and added to the render cache.
+
+        Args:
+            cards: The cards to render.
+
+        Returns:
+            list: The content of each card, in the same order as `cards`.
+        """
+        contents = [self._cached_content(card) for card in cards]
+        # Cards missing in the cache are rendered together so that the executor
+        # (if any) can render them in parallel. `map` keeps the order of the cards.
+        missing = [i for i, content in enumerate(contents) if content is _MISSING]
+        results = self._render_cards([cards[i] for i in missing])
+        for i, (content, ok, dependencies) in zip(missing, results):
+            contents[i] = content
+            self._record_dependencies(cards[i], dependencies)
+            if ok and self.is_cacheable(cards[i]):
+                self.render_cache.set(self.cache_key(cards[i]), content)
+        return contents
+
+    def refresh_interval(
+        self,
+        card_config: dict[str, dict[str, Any]],
+        streaming: bool = False,
+        min_interval: int = 250,
+    ) -> int | None:
+        """Return the tick of the dashboard scheduler for the given cards.
+
+        This is the greatest common divisor of the intervals of all cards, so
+        that every card is due on a tick, but not less than `min_interval`.
+        Intervals like 1000 and 999 ms would otherwise tick every millisecond.
+        A card is then refreshed on the first tick after it is due.
+
+        Args:
+            card_config: The card config of the dashboard.
+            streaming: If True, cards which stream their content are left out,
+                since they are not refreshed by the scheduler.
+            min_interval: The shortest tick, in milliseconds.
+
+        Returns:
+            int | None: The interval in milliseconds, or None if no card
+                refreshes on an interval.
+        """
+        intervals = set()
+        for card_settings in (card_config or {}).values():
+            card_class = self.card_classes.get(card_settings.get("card_class"))
+            if card_class and card_class.interval:
+                if streaming and card_class.stream:
+                    continue
+                intervals.add(int(card_class.interval))
+        if not intervals:
+            return None
+        return max(math.gcd(*intervals), min_interval)
+
+    def invalidate_cache(self, card_class: str | Type[Card] | None = None) -> int:
+        """Remove rendered cards from the render cache.
+
+        Args:
+            card_class: The card class (or its name) whose entries are removed.
+                If not given, the whole cache is cleared.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        if card_class is None:
+            self.instance_cache.invalidate()
+            return self.render_cache.invalidate()
+        name = card_class if isinstance(card_class, str) else card_class.__name__
+        self.instance_cache.invalidate(lambda key: key[0] == name)
+        return self.render_cache.invalidate(lambda key: key[0] == name)
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        """Hit, miss and eviction counts of the render cache."""
+        return self.render_cache.stats
 
     def register_card_class(self, card_class: Type[Card]) -> None:
         """Register a card class with the card manager.
@@ -255,6 +1084,30 @@ class CardManager:
             card_class: The class of the card to be registered.
         """
         self.card_classes[card_class.__name__] = card_class
+        self.invalidate_cache(card_class)
+
+    def register_data_source(
+        self, data_source: DataSource, name: str = "default"
+    ) -> None:
+        """Register a data source, available to the cards as `self.data`.
+
+        Registering a data source under the name of an existing one replaces it
+        and clears the render cache, so this is also how the data is updated.
+
+        Args:
+            data_source: The data source.
+            name: The name of the data source. Cards use the data source named
+                by their `data_source` attribute ("default" by default).
+        """
+        self.data_sources[name] = data_source
+        self.invalidate_cache()
+        if self.executor == "process":
+            # The processes hold the previous data sources, new ones are
+            # started with the current ones
+            with self._executor_lock:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
 
     def register_global_settings_class(
         self, global_settings_class: Type[GlobalSettings]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import base64
+import json
+import zlib
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+STORE_FORMAT = "cardcanvas/deflate"
+STORE_VERSION = 1
+
+
+def dumps(data: Any) -> str:
+    """Serialize a value to compact JSON.
+
+    orjson is used when it is installed, and the standard library otherwise.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            # orjson is stricter about types (for eg: subclasses of int)
+            pass
+    return json.dumps(data, separators=(",", ":"))
+
+
+def loads(data: str | bytes) -> Any:
+    """Parse JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_store(data: Any) -> dict[str, Any]:
+    """Compress the value of a store.
+
+    The value is serialized to JSON, compressed with deflate and base64 encoded.
+    The result carries a format and version header so that it can be told apart
+    from uncompressed values.
+
+    Args:
+        data: A JSON serializable value.
+
+    Returns:
+        dict: The encoded value.
+    """
+    payload = dumps(data).encode("utf-8")
+    return {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "data": base64.b64encode(zlib.compress(payload, 6)).decode("ascii"),
+    }
+
+
+def is_encoded(value: Any) -> bool:
+    return isinstance(value, dict) and value.get("format") == STORE_FORMAT
+
+
+def decode_store(value: Any) -> Any:
+    """Decompress the value of a store encoded with `encode_store`.
+
+    Values which are not encoded (for eg: saved before compression was enabled)
+    are returned as they are.
+
+    Raises:
+        ValueError: If the value was encoded with an unknown version.
+    """
+    if not is_encoded(value):
+        return value
+    if value.get("version") != STORE_VERSION:
+        raise ValueError(f"Unsupported store version: {value.get('version')}")
+    payload = zlib.decompress(base64.b64decode(value["data"]))
+    return loads(payload)
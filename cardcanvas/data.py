@@ -0,0 +1,574 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
+from uuid import uuid4
+
+from .cache import CacheStats, LRUCache
+from .figures import Bins, Bins2D, bin_values, bin_values_2d, downsample
+from .helpers import fingerprint
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+_MISSING = object()
+
+# The data sources of this process, by token. A pickled data source only holds
+# its token, so that cards sent to a render process do not carry the data.
+_sources: weakref.WeakValueDictionary[str, DataSource] = weakref.WeakValueDictionary()
+# The data sources sent to this process when it was started, see `init_worker`
+_worker_sources: list[DataSource] = []
+
+
+@dataclass
+class ColumnInfo:
+    """Statistics of a column, used to build settings forms without scanning
+    the data."""
+
+    name: str
+    dtype: str
+    numeric: bool  # Numbers, which are filtered by range
+    categorical: bool  # Strings, booleans and categories
+    count: int  # Values which are not null
+    cardinality: int  # Distinct values which are not null
+    min: Any = None
+    max: Any = None
+    # The sorted distinct values, or None if there are more than the limit of
+    # the data source
+    values: list[Any] | None = None
+
+
+class DataSource(ABC):
+    """A dataset shared by the cards of a dashboard. This is an abstract class.
+
+    Data sources are registered on the card manager and are available to cards
+    as `self.data`. Queries are described by a JSON-like spec, and the result of
+    each spec is kept in a cache shared by all cards. When several cards ask the
+    same question, the data is only queried once.
+
+    The following method must be implemented in the child classes:
+    - run: Compute the result of a query spec.
+
+    Results are shared between cards and must not be modified.
+    """
+
+    def __init__(self, cache_size: int = 128, cache_ttl: float | None = None) -> None:
+        """Initialize the data source.
+
+        Args:
+            cache_size: The maximum number of query results kept.
+            cache_ttl: The number of seconds a result stays valid. `None` keeps
+                it until it is evicted or invalidated.
+        """
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self._init_locks()
+        self.token = uuid4().hex
+        _sources[self.token] = self
+
+    def _init_locks(self) -> None:
+        self._lock = threading.Lock()
+        # One lock per query being computed, so that cards rendered in parallel
+        # wait for the result instead of computing it again
+        self._pending: dict[str, threading.Lock] = {}
+
+    @abstractmethod
+    def run(self, spec: dict[str, Any]) -> Any:
+        """Compute the result of a query spec, without the cache."""
+
+    def query(self, spec: dict[str, Any]) -> Any:
+        """Return the result of a query spec, from the cache if possible."""
+        return self._cached(spec, lambda: self.run(spec))
+
+    def _cached(self, spec: dict[str, Any], compute: Callable[[], Any]) -> Any:
+        key = fingerprint(spec)
+        result = self.cache.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+        with self._lock:
+            pending = self._pending.setdefault(key, threading.Lock())
+        try:
+            with pending:
+                result = self.cache.get(key, _MISSING)
+                if result is _MISSING:
+                    result = compute()
+                    self.cache.set(key, result)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+        return result
+
+    def invalidate(self) -> int:
+        """Drop all cached results, for eg: after the data changed."""
+        return self.cache.invalidate()
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def __reduce__(self) -> tuple[Callable[[str], DataSource], tuple[str]]:
+        # Only the token is pickled, the data is sent once to each render
+        # process by `init_worker` instead of with every card.
+        return _source, (self.token,)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Locks can not be sent to a process pool, the copy gets an empty cache
+        state = self.__dict__.copy()
+        del state["_lock"], state["_pending"]
+        state["cache"] = (self.cache.maxsize, self.cache.ttl)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        maxsize, ttl = state.pop("cache")
+        self.__dict__.update(state)
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._init_locks()
+        _sources[self.token] = self
+
+
+def _source(token: str) -> DataSource:
+    try:
+        return _sources[token]
+    except KeyError:
+        raise LookupError(
+            f"The data source {token} was not sent to this process."
+        ) from None
+
+
+def worker_state(
+    sources: list[DataSource],
+) -> list[tuple[type[DataSource], dict[str, Any]]]:
+    """Return the state of data sources to send to a new render process.
+
+    See `init_worker`.
+    """
+    return [(type(source), source.__getstate__()) for source in sources]
+
+
+def init_worker(states: list[tuple[type[DataSource], dict[str, Any]]]) -> None:
+    """Restore the data sources of the dashboard in a render process.
+
+    This is the initializer of the process pool of the card manager, so the
+    data is sent once to each process, and cards only refer to it.
+
+    Args:
+        states: The data sources, as returned by `worker_state`.
+    """
+    for source_type, state in states:
+        source = source_type.__new__(source_type)
+        source.__setstate__(dict(state))
+        _worker_sources.append(source)
+
+
+class DataFrameSource(DataSource):
+    """A data source for a pandas DataFrame.
+
+    A query spec is a dict with the following optional keys, applied in order:
+    - "filters": A dict mapping columns to the values to keep. For numeric
+      columns, the value is a `[min, max]` range, otherwise a list of values.
+      A list of `[column, values]` pairs can be given instead, to filter a
+      column twice.
+    - "columns": The columns to keep.
+    - "groupby": A column or a list of columns to group by, with "column" (the
+      column to aggregate) and "agg" (the aggregation, default "count").
+    - "value_counts": A column whose values are counted, with "n" to only keep
+      the n most frequent values.
+    - "series": An `[x, y]` pair of columns, sorted by x and downsampled to "n"
+      points with "method", between the values of "x_range" if given.
+
+    The filtered data is cached separately, so queries that only differ in
+    their aggregation share the filtering.
+    """
+
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        cache_size: int = 128,
+        cache_ttl: float | None = None,
+        max_values: int = 1000,
+    ) -> None:
+        """Initialize the data source.
+
+        The statistics of the columns (see `column_info`) are computed here, so
+        creating the data source reads all the data once.
+
+        Args:
+            frame: The data. It must not be modified once registered, register a
+                new data source instead.
+            cache_size: The maximum number of query results kept.
+            cache_ttl: The number of seconds a result stays valid.
+            max_values: The maximum number of distinct values listed in the
+                statistics of a column.
+        """
+        super().__init__(cache_size=cache_size, cache_ttl=cache_ttl)
+        self.frame = frame
+        self.max_values = max_values
+        self.column_info: dict[str, ColumnInfo] = {
+            str(name): self._column_info(str(name), frame[name])
+            for name in frame.columns
+        }
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.column_info)
+
+    def _column_info(self, name: str, series: pd.Series) -> ColumnInfo:
+        from pandas.api.types import is_bool_dtype, is_numeric_dtype, is_string_dtype
+
+        numeric = is_numeric_dtype(series) and not is_bool_dtype(series)
+        # The dtype is checked rather than the values, which pandas would scan.
+        # This also covers the Arrow types of `load_frame`.
+        categorical = not numeric and (
+            is_string_dtype(series.dtype)
+            or is_bool_dtype(series.dtype)
+            or str(series.dtype) == "category"
+        )
+        values = series.dropna()
+        distinct = values.unique()
+        info = ColumnInfo(
+            name=name,
+            dtype=str(series.dtype),
+            numeric=numeric,
+            categorical=categorical,
+            count=len(values),
+            cardinality=len(distinct),
+        )
+        if len(distinct) and numeric:
+            info.min, info.max = _scalar(values.min()), _scalar(values.max())
+        if len(distinct) <= self.max_values:
+            distinct = [_scalar(value) for value in distinct]
+            try:
+                info.values = sorted(distinct)
+            except TypeError:
+                # Columns of mixed types
+                info.values = sorted(distinct, key=str)
+            if info.values and not numeric:
+                info.min, info.max = info.values[0], info.values[-1]
+        return info
+
+    def filter(
+        self,
+        filters: dict[str, Any] | list | None = None,
+        columns: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """Return the rows matching `filters`, with only `columns` if given."""
+        return self.query({"filters": filters, "columns": columns})
+
+    def groupby(
+        self,
+        by: str | list[str],
+        column: str,
+        agg: str = "count",
+        filters: dict[str, Any] | list | None = None,
+    ) -> pd.DataFrame:
+        """Return `column` aggregated with `agg` for each group of `by`.
+
+        Returns:
+            pd.DataFrame: The groups and the aggregated values as columns.
+        """
+        return self.query(
+            {"filters": filters, "groupby": by, "column": column, "agg": agg}
+        )
+
+    def value_counts(
+        self,
+        column: str,
+        n: int | None = None,
+        filters: dict[str, Any] | list | None = None,
+    ) -> pd.DataFrame:
+        """Return the number of rows for each value of `column`, most frequent
+        first.
+
+        Returns:
+            pd.DataFrame: The values and their counts, in a "count" column.
+        """
+        return self.query({"filters": filters, "value_counts": column, "n": n})
+
+    def query(self, spec: dict[str, Any]) -> Any:
+        # Unset filters do not change the result, they should not change the key
+        filters = [
+            [column, values]
+            for column, values in _filter_items(spec.get("filters"))
+            if values is not None
+        ]
+        return super().query({**spec, "filters": filters or None})
+
+    def histogram(
+        self,
+        column: str,
+        nbins: int = 20,
+        color: str | None = None,
+        filters: dict[str, Any] | list | None = None,
+    ) -> Bins | dict[Any, Bins]:
+        """Count the values of `column` in bins, see `figures.bin_values`.
+
+        Args:
+            column: The column to bin.
+            nbins: The number of bins of a numeric column.
+            color: If given, the values are binned for each value of this
+                column, with the same bins.
+            filters: The filters applied first.
+
+        Returns:
+            Bins | dict[Any, Bins]: The bins, or the bins of each group if
+                `color` is given. Use `figures.histogram_figure` to plot them.
+        """
+        return self.query(
+            {"filters": filters, "histogram": column, "nbins": nbins, "color": color}
+        )
+
+    def histogram2d(
+        self,
+        x: str,
+        y: str,
+        nbinsx: int = 20,
+        nbinsy: int = 20,
+        filters: dict[str, Any] | list | None = None,
+    ) -> Bins2D:
+        """Count the pairs of values of `x` and `y` in a grid of bins, see
+        `figures.bin_values_2d`. Use `figures.density_heatmap_figure` to plot
+        them."""
+        return self.query(
+            {"filters": filters, "histogram2d": [x, y], "nbins": [nbinsx, nbinsy]}
+        )
+
+    def series(
+        self,
+        x: str,
+        y: str,
+        n: int,
+        method: str = "lttb",
+        x_range: tuple[Any, Any] | None = None,
+        filters: dict[str, Any] | list | None = None,
+    ) -> pd.DataFrame:
+        """Return `y` against `x`, sorted by x and reduced to about `n` points.
+
+        See `figures.downsample`. Use `Card.max_points()` for `n`, and pass the
+        range from `figures.relayout_x_range` to show the zoomed part in more
+        detail.
+
+        Returns:
+            pd.DataFrame: The x and y columns of the kept rows.
+        """
+        return self.query(
+            {
+                "filters": filters,
+                "series": [x, y],
+                "n": n,
+                "method": method,
+                "x_range": list(x_range) if x_range is not None else None,
+            }
+        )
+
+    def run(self, spec: dict[str, Any]) -> Any:
+        filters = spec.get("filters")
+        columns = spec.get("columns")
+        if spec.get("series") is not None:
+            return self._series(self.filter(filters), spec)
+        if spec.get("histogram") is not None:
+            return self._histogram(self.filter(filters), spec)
+        if spec.get("histogram2d") is not None:
+            x, y = spec["histogram2d"]
+            frame = self.filter(filters, columns=[x, y]).dropna()
+            return bin_values_2d(frame[x], frame[y], *spec["nbins"])
+        if spec.get("groupby") is not None or spec.get("value_counts") is not None:
+            frame = self.filter(filters)
+        else:
+            frame = self._apply_filters(self.frame, filters)
+        if columns:
+            frame = frame.loc[:, columns]
+        if spec.get("groupby") is not None:
+            return (
+                frame.groupby(spec["groupby"])[spec["column"]]
+                .agg(spec.get("agg") or "count")
+                .reset_index()
+            )
+        if spec.get("value_counts") is not None:
+            column = spec["value_counts"]
+            counts = frame[column].value_counts()
+            if spec.get("n") is not None:
+                counts = counts.head(spec["n"])
+            counts = counts.reset_index()
+            counts.columns = [column, "count"]
+            return counts
+        return frame
+
+    @staticmethod
+    def _histogram(frame: pd.DataFrame, spec: dict[str, Any]) -> Any:
+        from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+        column = spec["histogram"]
+        values = frame[column].dropna()
+        color = spec.get("color")
+        if color is None:
+            return bin_values(values, spec["nbins"])
+        # The groups share the bins, so their bars line up
+        bin_range = None
+        if len(values) and is_numeric_dtype(values) and not is_bool_dtype(values):
+            bin_range = (values.min(), values.max())
+        return {
+            group: bin_values(group_values, spec["nbins"], range=bin_range)
+            for group, group_values in values.groupby(frame[color], sort=True)
+        }
+
+    @staticmethod
+    def _series(frame: pd.DataFrame, spec: dict[str, Any]) -> pd.DataFrame:
+        import pandas as pd
+
+        x, y = spec["series"]
+        frame = frame.loc[:, list(dict.fromkeys([x, y]))].dropna()
+        if not frame[x].is_monotonic_increasing:
+            frame = frame.sort_values(x, kind="stable")
+        x_values, y_values = downsample(
+            frame[x].to_numpy(),
+            frame[y].to_numpy(),
+            spec["n"],
+            method=spec.get("method") or "lttb",
+            x_range=spec.get("x_range"),
+        )
+        return pd.DataFrame({x: x_values, y: y_values})
+
+    @staticmethod
+    def _apply_filters(frame: pd.DataFrame, filters: dict[str, Any] | list | None):
+        from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+        for column, values in _filter_items(filters):
+            series = frame[column]
+            if is_numeric_dtype(series) and not is_bool_dtype(series):
+                low, high = (float(value) for value in values)
+                frame = frame[(series >= low) & (series <= high)]
+            else:
+                frame = frame[series.isin(values)]
+        return frame
+
+
+def _filter_items(filters: dict[str, Any] | list | None) -> list:
+    # Filters are a dict, or a list of [column, values] pairs
+    if isinstance(filters, dict):
+        return list(filters.items())
+    return list(filters or [])
+
+
+def _scalar(value: Any) -> Any:
+    # numpy scalars are converted to python values, so they can be sent as JSON
+    return value.item() if hasattr(value, "item") else value
+
+
+def load_frame(
+    source: str | os.PathLike,
+    cache_dir: str | os.PathLike | None = None,
+    read: Callable[[str], pd.DataFrame] | None = None,
+    max_age: float | None = None,
+) -> pd.DataFrame:
+    """Load a table through a local Arrow file shared by the server processes.
+
+    The first call reads `source` and saves it as an uncompressed Arrow IPC
+    file in `cache_dir`. Every call then memory-maps that file, and the columns
+    of the DataFrame point into the mapped file instead of a copy of the data.
+    The server processes (for eg: gunicorn workers) share the same pages of
+    memory, and starting a process only opens the file.
+
+    The columns use the Arrow dtypes of pandas (`pd.ArrowDtype`). Converting
+    them to numpy dtypes (for eg: with `astype`) makes a copy in the process.
+    Requires pyarrow (`pip install cardcanvas[arrow]`).
+
+    Args:
+        source: A path or URL. Arrow and Feather files are memory-mapped
+            directly if they are not compressed.
+        cache_dir: The directory of the cached files. Defaults to the
+            `CARDCANVAS_CACHE_DIR` environment variable, or
+            `~/.cache/cardcanvas`.
+        read: A function reading `source` into a DataFrame. Defaults to
+            `pd.read_parquet` for ".parquet" files and `pd.read_csv` otherwise.
+        max_age: The number of seconds after which `source` is read again.
+            `None` keeps the cached file until it is deleted.
+
+    Returns:
+        pd.DataFrame: The data, backed by the memory-mapped file.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    source = os.fspath(source)
+    path = Path(source)
+    if read is None and path.suffix in (".arrow", ".feather") and path.exists():
+        return _map_frame(path)
+    if cache_dir is None:
+        cache_dir = os.environ.get("CARDCANVAS_CACHE_DIR") or (
+            Path.home() / ".cache" / "cardcanvas"
+        )
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha1(source.encode("utf-8")).hexdigest()
+    cached = cache_dir / f"{name}.arrow"
+
+    def fresh():
+        try:
+            age = time.time() - cached.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return max_age is None or age < max_age
+
+    if not fresh():
+        # Processes starting together wait for the first one to read the source
+        with _file_lock(cache_dir / f"{name}.lock"):
+            if not fresh():
+                if read is None:
+                    read = pd.read_parquet if path.suffix == ".parquet" else pd.read_csv
+                table = pa.Table.from_pandas(read(source))
+                # Write to a temporary file first so readers never see partial files
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+                try:
+                    with (
+                        os.fdopen(fd, "wb") as f,
+                        pa.ipc.new_file(f, table.schema) as writer,
+                    ):
+                        writer.write_table(table)
+                    os.replace(tmp_path, cached)
+                except BaseException:
+                    Path(tmp_path).unlink(missing_ok=True)
+                    raise
+    return _map_frame(cached)
+
+
+def _map_frame(path: Path) -> pd.DataFrame:
+    import pandas as pd
+    import pyarrow as pa
+
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    # ArrowDtype keeps the Arrow arrays, numpy dtypes would copy them
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+class _file_lock:
+    """An exclusive lock on a file, shared with other processes.
+
+    Without `fcntl` (on Windows), this does nothing: processes starting
+    together may then all read the source.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file = None
+
+    def __enter__(self) -> None:
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover - Windows
+            return
+        self._file = open(self.path, "a")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info) -> None:
+        if self._file is not None:
+            # Closing the file releases the lock
+            self._file.close()
+            self._file = None
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+import plotly.graph_objects as go
+
+
+@dataclass
+class Bins:
+    """The counts of values in bins along one axis.
+
+    Numeric values are counted in `nbins` bins of equal width, between the
+    `edges`. Other values are counted for each distinct value, listed in
+    `labels`.
+    """
+
+    counts: list[int]
+    edges: list[float] | None = None
+    labels: list[Any] | None = None
+
+    @property
+    def centers(self) -> list[Any]:
+        if self.edges is None:
+            return self.labels or []
+        return [(low + high) / 2 for low, high in zip(self.edges, self.edges[1:])]
+
+    @property
+    def widths(self) -> list[float] | None:
+        if self.edges is None:
+            return None
+        return [high - low for low, high in zip(self.edges, self.edges[1:])]
+
+
+@dataclass
+class Bins2D:
+    """The counts of pairs of values in a grid of bins.
+
+    `counts[j][i]` is the number of pairs in the i-th bin of x and the j-th bin
+    of y, the layout expected by a heatmap.
+    """
+
+    counts: list[list[int]]
+    x: Bins
+    y: Bins
+
+
+def _axis(values, nbins: int, range: tuple[float, float] | None = None):
+    """Return the values to bin and the bins argument of numpy for an axis."""
+    import numpy as np
+
+    values = np.asarray(values)
+    if values.dtype.kind in "iuf":
+        if range is None:
+            range = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+        low, high = float(range[0]), float(range[1])
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        return values, np.linspace(low, high, nbins + 1), None
+    try:
+        # Much faster than numpy for strings
+        from pandas import factorize
+
+        codes, labels = factorize(values, sort=True)
+    except ImportError:
+        labels, codes = np.unique(values, return_inverse=True)
+    return codes.ravel(), np.arange(len(labels) + 1) - 0.5, labels.tolist()
+
+
+def bin_values(
+    values, nbins: int = 20, range: tuple[float, float] | None = None
+) -> Bins:
+    """Count values in bins, on the server.
+
+    Args:
+        values: An array like of values. Numeric values are counted in bins of
+            equal width, other values are counted for each distinct value. Null
+            values other than NaN must be removed first.
+        nbins: The number of bins for numeric values.
+        range: The lower and upper edge of the bins. Defaults to the minimum and
+            maximum value. Pass the same range to bin groups of the same data.
+
+    Returns:
+        Bins: The edges (or labels) and the counts, whose size only depends on
+            the number of bins.
+    """
+    import numpy as np
+
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        values = values[~np.isnan(values)]
+    values, edges, labels = _axis(values, nbins, range)
+    counts, edges = np.histogram(values, bins=edges)
+    return Bins(
+        counts=counts.tolist(),
+        edges=edges.tolist() if labels is None else None,
+        labels=labels,
+    )
+
+
+def bin_values_2d(x, y, nbinsx: int = 20, nbinsy: int = 20) -> Bins2D:
+    """Count pairs of values in a grid of bins, on the server.
+
+    Args:
+        x: An array like of values for the x axis.
+        y: An array like of values for the y axis, of the same length as x.
+            Pairs with a null value other than NaN must be removed first.
+        nbinsx: The number of bins along x for numeric values.
+        nbinsy: The number of bins along y for numeric values.
+    """
+    import numpy as np
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    # Pairs with a NaN value are not counted
+    keep = np.ones(len(x), dtype=bool)
+    for values in (x, y):
+        if values.dtype.kind == "f":
+            keep &= ~np.isnan(values)
+    x_values, x_edges, x_labels = _axis(x[keep], nbinsx)
+    y_values, y_edges, y_labels = _axis(y[keep], nbinsy)
+    counts, x_edges, y_edges = np.histogram2d(
+        x_values, y_values, bins=[x_edges, y_edges]
+    )
+    return Bins2D(
+        counts=counts.T.astype(int).tolist(),
+        x=Bins(
+            counts=counts.sum(axis=1).astype(int).tolist(),
+            edges=x_edges.tolist() if x_labels is None else None,
+            labels=x_labels,
+        ),
+        y=Bins(
+            counts=counts.sum(axis=0).astype(int).tolist(),
+            edges=y_edges.tolist() if y_labels is None else None,
+            labels=y_labels,
+        ),
+    )
+
+
+def histogram_figure(bins: Bins | dict[Any, Bins], **layout: Any) -> go.Figure:
+    """Create a histogram from values binned with `bin_values`.
+
+    The figure only holds the bins, unlike `px.histogram` which sends every
+    value to the browser.
+
+    Args:
+        bins: The bins, or a dict mapping the name of each group to its bins.
+            The groups are drawn as stacked bars.
+        layout: Passed to `figure.update_layout`, for eg: template.
+    """
+    groups = bins if isinstance(bins, dict) else {None: bins}
+    figure = go.Figure(
+        [
+            go.Bar(
+                x=group.centers,
+                y=group.counts,
+                width=group.widths,
+                name=None if name is None else str(name),
+                showlegend=name is not None,
+            )
+            for name, group in groups.items()
+        ]
+    )
+    figure.update_layout(barmode="stack", bargap=0, **layout)
+    figure.update_yaxes(title_text="count")
+    return figure
+
+
+def density_heatmap_figure(bins: Bins2D, **layout: Any) -> go.Figure:
+    """Create a density heatmap from values binned with `bin_values_2d`.
+
+    Args:
+        bins: The bins.
+        layout: Passed to `figure.update_layout`, for eg: template.
+    """
+    figure = go.Figure(
+        go.Heatmap(
+            x=bins.x.centers,
+            y=bins.y.centers,
+            z=bins.counts,
+            colorbar={"title": {"text": "count"}},
+        )
+    )
+    figure.update_layout(**layout)
+    return figure
+
+
+def _as_float(values):
+    """Return the values as floats to compute with, for numbers and dates."""
+    import numpy as np
+
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        # Dates are compared as nanoseconds
+        values = values.astype("datetime64[ns]").view("int64")
+    elif values.dtype.kind == "m":
+        values = values.astype("timedelta64[ns]").view("int64")
+    return values.astype(float)
+
+
+def lttb_indices(x, y, n_out: int):
+    """Select points with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and the last point are kept, the points between them are split
+    in `n_out - 2` buckets of equal size. From each bucket, the point forming
+    the largest triangle with the point kept from the previous bucket and the
+    mean of the next bucket is kept, which preserves the shape of the line.
+    Each bucket is handled with numpy, so this takes time proportional to the
+    number of points.
+
+    Args:
+        x: The sorted x values, numbers or dates.
+        y: The y values, numbers without NaN.
+        n_out: The number of points to keep, at least 3.
+
+    Returns:
+        np.ndarray: The sorted indices of the kept points.
+    """
+    import numpy as np
+
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+    x = _as_float(x)
+    y = _as_float(y)
+    # Bucket i holds the points edges[i] to edges[i + 1] - 1
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    # The mean of every bucket, followed by the last point
+    means_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1) / sizes, x[-1])
+    means_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1) / sizes, y[-1])
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Twice the area of the triangles, the factor does not change the order
+        area = np.abs(
+            (x[a] - means_x[bucket + 1]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (means_y[bucket + 1] - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[bucket + 1] = a
+    return indices
+
+
+def minmax_indices(y, n_out: int):
+    """Select the lowest and the highest point of `n_out // 2` buckets.
+
+    This is faster than `lttb_indices` since it is fully vectorized, and keeps
+    every peak, which suits noisy signals. The first and the last point are
+    kept too, so the line spans the same range.
+
+    Args:
+        y: The y values, numbers. NaN values are only kept if a whole bucket
+            is NaN.
+        n_out: The number of points to keep, about.
+
+    Returns:
+        np.ndarray: The sorted indices of the kept points.
+    """
+    import numpy as np
+
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    y = _as_float(y)
+    nbuckets = max(n_out // 2, 1)
+    size = -(-n // nbuckets)
+    # The last bucket is padded with NaN, which is never selected
+    padded = np.full(size * nbuckets, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(nbuckets, size)
+    missing = np.isnan(buckets)
+    offsets = np.arange(nbuckets) * size
+    lows = offsets + np.argmin(np.where(missing, np.inf, buckets), axis=1)
+    highs = offsets + np.argmax(np.where(missing, -np.inf, buckets), axis=1)
+    indices = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return indices[indices < n]
+
+
+def target_points(grid_width: int, points_per_column: int = 250) -> int:
+    """Return the number of points worth drawing in a card.
+
+    A line can not show more points than the card has pixels across, so the
+    number of points grows with the width of the card in grid columns.
+    """
+    return max(int(grid_width), 1) * points_per_column
+
+
+def downsample(
+    x,
+    y,
+    n_out: int,
+    method: str = "lttb",
+    x_range: tuple[Any, Any] | None = None,
+):
+    """Reduce a series to about `n_out` points, on the server.
+
+    Args:
+        x: The sorted x values, numbers or dates.
+        y: The y values, numbers.
+        n_out: The number of points to keep.
+        method: "lttb" (see `lttb_indices`) keeps the shape of the line,
+            "minmax" (see `minmax_indices`) keeps every peak and is faster.
+        x_range: If given, only the points between these two x values are
+            kept first, for eg: the range the user zoomed to (see
+            `relayout_x_range`). The zoomed series then shows more detail.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The x and y values of the kept points.
+
+    Raises:
+        ValueError: If the method is unknown.
+    """
+    import numpy as np
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if x_range is not None:
+        low, high = (
+            np.datetime64(value) if x.dtype.kind == "M" else float(value)
+            for value in x_range
+        )
+        start, end = np.searchsorted(x, [low, high], side="left")
+        # Keep one point past each end so the line reaches the edges of the plot
+        start = max(start - 1, 0)
+        end = min(end + 1, len(x))
+        x, y = x[start:end], y[start:end]
+    if method == "lttb":
+        # NaN values would make every triangle NaN
+        if y.dtype.kind == "f":
+            keep = ~np.isnan(y)
+            if not keep.all():
+                x, y = x[keep], y[keep]
+        indices = lttb_indices(x, y, n_out)
+    elif method == "minmax":
+        indices = minmax_indices(y, n_out)
+    else:
+        raise ValueError(f"Invalid method: {method!r}. Use 'lttb' or 'minmax'.")
+    return x[indices], y[indices]
+
+
+def relayout_x_range(relayout_data: dict[str, Any] | None) -> Any:
+    """Read the x axis range from the `relayoutData` of a graph.
+
+    Returns:
+        The `(low, high)` range the user zoomed or panned to, None if the axis
+        was reset to show all the data, or False if the x axis did not change
+        (for eg: only the y axis was zoomed).
+    """
+    relayout_data = relayout_data or {}
+    if relayout_data.get("xaxis.autorange"):
+        return None
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        return relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    if "xaxis.range" in relayout_data:
+        return tuple(relayout_data["xaxis.range"])
+    return False
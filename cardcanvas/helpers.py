@@ -1,3 +1,68 @@
+import hashlib
+import json
+
+
+def fingerprint(obj) -> str:
+    """Returns a canonical hash of a JSON-like object.
+
+    Dict keys are sorted, so two dicts with the same items in a different order
+    have the same fingerprint.
+    """
+    payload = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def combine_fingerprints(fingerprints: dict) -> str:
+    """Combines the fingerprints of the items of a collection into one.
+
+    The result does not depend on the order of the items, since the item
+    fingerprints are combined with xor.
+
+    Args:
+        fingerprints: A dict mapping item ids to their fingerprints.
+    """
+    combined = 0
+    for key, value in fingerprints.items():
+        combined ^= _item_hash(key, value)
+    return f"{combined:040x}"
+
+
+def _item_hash(key, value: str) -> int:
+    return int(hashlib.sha1(f"{key}\0{value}".encode("utf-8")).hexdigest(), 16)
+
+
+def card_fingerprints(card_config) -> dict:
+    """Returns the fingerprint of every card of a card config."""
+    return {card_id: fingerprint(card) for card_id, card in (card_config or {}).items()}
+
+
+def layouts_fingerprint(card_layouts) -> str:
+    """Returns a fingerprint of the card layouts.
+
+    The order of the items in the layout of a breakpoint does not matter, the
+    grid places them by their coordinates.
+    """
+    return combine_fingerprints(
+        {
+            breakpoint: combine_fingerprints(
+                {item.get("i"): fingerprint(item) for item in items or []}
+            )
+            for breakpoint, items in (card_layouts or {}).items()
+        }
+    )
+
+
+def state_fingerprint(card_config, card_layouts, global_settings) -> str:
+    """Returns a fingerprint of the whole state of a dashboard."""
+    return fingerprint(
+        [
+            combine_fingerprints(card_fingerprints(card_config)),
+            layouts_fingerprint(card_layouts),
+            fingerprint(global_settings or {}),
+        ]
+    )
+
+
 def compare_dicts(obj1, obj2):
     """Compares two objects recursively, handling dicts and lists.
     returns True if the objects are equal, False otherwise.
@@ -19,3 +84,157 @@ def compare_dicts(obj1, obj2):
                 return False
         return True
     return False
+
+
+def diff_cards(previous, current):
+    """Compares the cards that were rendered before with the cards to render now.
+
+    Args:
+        previous: A list of `[card_id, hash]` pairs in the order the cards were
+            rendered.
+        current: A dict mapping the card ids to render to their hashes, in the
+            order they should be rendered.
+
+    Returns:
+        A tuple `(removed, replaced, added)` where `removed` is a list of indices
+        (in descending order) into the previous list to delete, `replaced` is a
+        list of `(index, card_id)` pairs to re-render in the remaining list and
+        `added` is a list of card ids to append. Returns None if the cards can not
+        be reached with these operations, for eg: when the order has changed.
+    """
+    previous_ids = [card_id for card_id, _ in previous]
+    removed = [
+        index for index, card_id in enumerate(previous_ids) if card_id not in current
+    ]
+    remaining = [card_id for card_id in previous_ids if card_id in current]
+    previous_ids_set = set(previous_ids)
+    added = [card_id for card_id in current if card_id not in previous_ids_set]
+    if remaining + added != list(current):
+        return None
+    previous_hashes = dict(previous)
+    replaced = [
+        (index, card_id)
+        for index, card_id in enumerate(remaining)
+        if previous_hashes[card_id] != current[card_id]
+    ]
+    return removed[::-1], replaced, added
+
+
+class TrackedDict(dict):
+    """A dict which records the keys that are read from it.
+
+    `accessed` holds the keys read with `[]`, `get` or `in`. Anything else that
+    depends on more than one key (iterating, `keys()`, `len()`, `bool()`,
+    `str()`, `|`, ...) sets `accessed_all`, and so do the methods changing the
+    dict. `untracked()` returns a plain copy without recording anything.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accessed: set = set()
+        self.accessed_all = False
+
+    def __getitem__(self, key):
+        self.accessed.add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed.add(key)
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        self.accessed.add(key)
+        return super().__contains__(key)
+
+    def _read_all(self):
+        self.accessed_all = True
+
+    def __iter__(self):
+        self._read_all()
+        return super().__iter__()
+
+    def keys(self):
+        self._read_all()
+        return super().keys()
+
+    def values(self):
+        self._read_all()
+        return super().values()
+
+    def items(self):
+        self._read_all()
+        return super().items()
+
+    def copy(self):
+        self._read_all()
+        return super().copy()
+
+    def __eq__(self, other):
+        self._read_all()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        self._read_all()
+        return super().__ne__(other)
+
+    def __len__(self):
+        self._read_all()
+        return super().__len__()
+
+    def __bool__(self):
+        self._read_all()
+        return super().__len__() > 0
+
+    def __repr__(self):
+        self._read_all()
+        return super().__repr__()
+
+    def __str__(self):
+        self._read_all()
+        return super().__repr__()
+
+    def __or__(self, other):
+        self._read_all()
+        return super().__or__(other)
+
+    def __ror__(self, other):
+        self._read_all()
+        return super().__ror__(other)
+
+    def __ior__(self, other):
+        self._read_all()
+        return super().__ior__(other)
+
+    def __reversed__(self):
+        self._read_all()
+        return super().__reversed__()
+
+    def setdefault(self, key, default=None):
+        self._read_all()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._read_all()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._read_all()
+        return super().popitem()
+
+    def update(self, *args, **kwargs):
+        self._read_all()
+        return super().update(*args, **kwargs)
+
+    def clear(self):
+        self._read_all()
+        return super().clear()
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Pickling would read all items, copies start without recorded keys
+        return (type(self), (self.untracked(),))
+
+    def untracked(self) -> dict:
+        # dict.copy() would go through the overridden keys() of a subclass
+        return {key: dict.__getitem__(self, key) for key in dict.__iter__(self)}
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import copy
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+from dash import Patch
+
+from . import codec
+
+# A delta is a list of operations, each a dict with a "path" (the keys leading
+# to the changed value) and an "op":
+# - "set": set the value at the path to "value".
+# - "remove": remove the key at the end of the path.
+# - "splice": replace "remove" items of the list at the path, starting at
+#   "index", with the items of "insert".
+Delta = list[dict[str, Any]]
+
+
+def diff(old: Any, new: Any, path: tuple = ()) -> tuple[Delta, Delta]:
+    """Compute the changes between two JSON-like values.
+
+    Dicts are compared key by key and lists item by item, so the delta only
+    holds the values that changed. For lists, the items common to the start and
+    the end of both lists are skipped.
+
+    Returns:
+        tuple[Delta, Delta]: The operations turning `old` into `new`, and the
+            operations turning `new` back into `old`.
+    """
+    forward: Delta = []
+    backward: Delta = []
+    _diff(old, new, list(path), forward, backward)
+    # Undoing applies the inverse operations in the reverse order
+    backward.reverse()
+    return forward, backward
+
+
+def _diff(old, new, path, forward, backward):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                forward.append({"op": "set", "path": path + [key], "value": value})
+                backward.append({"op": "remove", "path": path + [key]})
+            else:
+                _diff(old[key], value, path + [key], forward, backward)
+        for key, value in old.items():
+            if key not in new:
+                forward.append({"op": "remove", "path": path + [key]})
+                backward.append({"op": "set", "path": path + [key], "value": value})
+        return
+    if isinstance(old, list) and isinstance(new, list):
+        start = 0
+        limit = min(len(old), len(new))
+        while start < limit and old[start] == new[start]:
+            start += 1
+        end = 0
+        while end < limit - start and old[-end - 1] == new[-end - 1]:
+            end += 1
+        old_middle = old[start : len(old) - end]
+        new_middle = new[start : len(new) - end]
+        if len(old_middle) == len(new_middle):
+            for index, (old_item, new_item) in enumerate(zip(old_middle, new_middle)):
+                _diff(old_item, new_item, path + [start + index], forward, backward)
+            return
+        forward.append(
+            {
+                "op": "splice",
+                "path": path,
+                "index": start,
+                "remove": len(old_middle),
+                "insert": new_middle,
+            }
+        )
+        backward.append(
+            {
+                "op": "splice",
+                "path": path,
+                "index": start,
+                "remove": len(new_middle),
+                "insert": old_middle,
+            }
+        )
+        return
+    forward.append({"op": "set", "path": path, "value": new})
+    backward.append({"op": "set", "path": path, "value": old})
+
+
+def apply(doc: Any, delta: Delta) -> Any:
+    """Apply a delta to a JSON-like value, in place.
+
+    Only the changed values are visited, so this takes time proportional to the
+    size of the change (and the depth of the paths).
+
+    Returns:
+        Any: The changed value. It is a new object only if the delta replaces
+            the value itself (an operation with an empty path).
+    """
+    for operation in delta:
+        path = operation["path"]
+        if operation["op"] == "splice":
+            target = _walk(doc, path)
+            index = operation["index"]
+            target[index : index + operation["remove"]] = copy.deepcopy(
+                operation["insert"]
+            )
+        elif not path:
+            doc = copy.deepcopy(operation["value"])
+        elif operation["op"] == "set":
+            _walk(doc, path[:-1])[path[-1]] = copy.deepcopy(operation["value"])
+        else:
+            del _walk(doc, path[:-1])[path[-1]]
+    return doc
+
+
+def _walk(doc, path):
+    for key in path:
+        doc = doc[key]
+    return doc
+
+
+def to_patch(delta: Delta) -> Patch | None:
+    """Turn a delta into a `dash.Patch`, so only the change is sent to a store.
+
+    Returns:
+        Patch | None: The patch, or None if the delta replaces the whole value,
+            which a patch can not do.
+    """
+    patch = Patch()
+    for operation in delta:
+        path = operation["path"]
+        if operation["op"] == "splice":
+            target = _walk(patch, path)
+            index = operation["index"]
+            for _ in range(operation["remove"]):
+                del target[index]
+            for offset, item in enumerate(operation["insert"]):
+                target.insert(index + offset, item)
+        elif not path:
+            return None
+        elif operation["op"] == "set":
+            _walk(patch, path[:-1])[path[-1]] = operation["value"]
+        else:
+            del _walk(patch, path[:-1])[path[-1]]
+    return patch
+
+
+@dataclass
+class HistoryStep:
+    """A change recorded in the history."""
+
+    forward: Delta
+    backward: Delta
+    size: int
+
+
+class History:
+    """The undo and redo history of a dashboard.
+
+    The history keeps the current state and, for each change, the delta between
+    the states before and after it, instead of a copy of every state. The
+    oldest steps are dropped once there are more than `max_steps` of them or
+    the encoded size of the current state and the steps exceeds `max_bytes`. A
+    state larger than `max_bytes` is not kept at all.
+    """
+
+    def __init__(self, max_steps: int = 100, max_bytes: int = 256_000) -> None:
+        """Initialize the history.
+
+        Args:
+            max_steps: The maximum number of steps that can be undone.
+            max_bytes: The maximum total size of the current state and the
+                deltas, in bytes of JSON.
+        """
+        self.max_steps = max_steps
+        self.max_bytes = max_bytes
+        self.current: Any = None
+        self._undo: deque[HistoryStep] = deque()
+        self._redo: list[HistoryStep] = []
+        self._size = 0
+        self._current_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    @property
+    def size(self) -> int:
+        """The total size of the current state and the recorded deltas, in bytes."""
+        return self._current_size + self._size + sum(step.size for step in self._redo)
+
+    def __len__(self) -> int:
+        return len(self._undo)
+
+    def record(self, state: Any) -> bool:
+        """Record the new state of the dashboard.
+
+        The first recorded state is the starting point of the history. Recording
+        a change clears the steps that could be redone.
+
+        Returns:
+            bool: True if a step was added.
+        """
+        with self._lock:
+            if self.current is None:
+                self.current = copy.deepcopy(state)
+                self._trim()
+                return False
+            forward, backward = diff(self.current, state)
+            if not forward:
+                return False
+            self.current = copy.deepcopy(state)
+            self._add_step(forward, backward)
+            return True
+
+    def record_values(
+        self, values: dict[str, Any], previous: dict[str, Any] | None = None
+    ) -> bool:
+        """Record the new values of some keys of the state, as one step.
+
+        Only these values are compared and copied, so the other parts of the
+        state do not need to be sent to the server, or kept before they change.
+        A key which is not in the current state yet starts from its value in
+        `previous`; without one, its new value is the starting point and no
+        change is recorded for it.
+
+        Args:
+            values: The new values, by key of the state, for eg: "config".
+            previous: The values of the keys before the change, used for the
+                keys which are not in the current state yet.
+
+        Returns:
+            bool: True if a step was added.
+        """
+        with self._lock:
+            if self.current is None:
+                self.current = {}
+            if not isinstance(self.current, dict):
+                return False
+            for key, value in (previous or {}).items():
+                if key in values and key not in self.current:
+                    self.current[key] = copy.deepcopy(value)
+            forward: Delta = []
+            backward: Delta = []
+            for key, value in values.items():
+                if key not in self.current:
+                    continue
+                key_forward, key_backward = diff(self.current[key], value, (key,))
+                forward.extend(key_forward)
+                # Undoing applies the inverse operations in the reverse order
+                backward[:0] = key_backward
+            for key, value in values.items():
+                if forward or key not in self.current:
+                    self.current[key] = copy.deepcopy(value)
+            if not forward:
+                self._trim()
+                return False
+            self._add_step(forward, backward)
+            return True
+
+    def _add_step(self, forward: Delta, backward: Delta) -> None:
+        self._redo.clear()
+        step = HistoryStep(forward, backward, len(codec.dumps([forward, backward])))
+        self._undo.append(step)
+        self._size += step.size
+        self._trim()
+
+    def _trim(self) -> None:
+        self._current_size = len(codec.dumps(self.current))
+        while self._undo and (
+            len(self._undo) > self.max_steps
+            or self._current_size + self._size > self.max_bytes
+        ):
+            self._size -= self._undo.popleft().size
+        if self._current_size > self.max_bytes:
+            # Nothing could be undone, the state is recorded again on the next
+            # change
+            self.current = None
+            self._current_size = 0
+            self._redo.clear()
+
+    def undo(self) -> Delta | None:
+        """Go back to the state before the last change.
+
+        Returns:
+            Delta | None: The operations applied to the current state, or None
+                if there is nothing to undo.
+        """
+        with self._lock:
+            if not self._undo:
+                return None
+            step = self._undo.pop()
+            self._size -= step.size
+            self._redo.append(step)
+            self.current = apply(self.current, step.backward)
+            self._current_size = len(codec.dumps(self.current))
+            return step.backward
+
+    def redo(self) -> Delta | None:
+        """Apply the last undone change again.
+
+        Returns:
+            Delta | None: The operations applied to the current state, or None
+                if there is nothing to redo.
+        """
+        with self._lock:
+            if not self._redo:
+                return None
+            step = self._redo.pop()
+            self._undo.append(step)
+            self._size += step.size
+            self.current = apply(self.current, step.forward)
+            self._current_size = len(codec.dumps(self.current))
+            return step.forward
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import copy
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+_POSITION_KEYS = ("x", "y", "w", "h")
+
+
+@dataclass
+class LayoutItem:
+    """The position and size of a card in the grid of one breakpoint."""
+
+    i: str
+    x: int = 0
+    y: int = 0
+    w: int = 4
+    h: int = 4
+    # Other grid settings of the item, for eg: minW or static
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, item: dict[str, Any]) -> LayoutItem:
+        extra = {
+            key: value
+            for key, value in item.items()
+            if key != "i" and key not in _POSITION_KEYS
+        }
+        return cls(
+            i=item["i"],
+            **{key: item[key] for key in _POSITION_KEYS if key in item},
+            extra=copy.deepcopy(extra),
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the item in the format of the `ResponsiveGrid` layouts."""
+        return {
+            "i": self.i,
+            "x": self.x,
+            "y": self.y,
+            "w": self.w,
+            "h": self.h,
+            **copy.deepcopy(self.extra),
+        }
+
+    @property
+    def bottom(self) -> int:
+        return self.y + self.h
+
+    def copy(self, card_id: str) -> LayoutItem:
+        """Return a copy of the item for another card."""
+        return LayoutItem(
+            card_id, self.x, self.y, self.w, self.h, copy.deepcopy(self.extra)
+        )
+
+
+class CardLayouts:
+    """The layouts of the cards for every breakpoint, indexed by card id.
+
+    The items of each breakpoint are kept in a dict, so looking up, moving,
+    deleting and duplicating a card does not scan the layout lists. The order
+    of the items is preserved.
+    """
+
+    def __init__(self, layouts: dict[str, list[dict[str, Any]]] | None = None) -> None:
+        """Initialize the layouts.
+
+        Args:
+            layouts: The layouts in the format of the `ResponsiveGrid` layouts,
+                a dict mapping each breakpoint to a list of items.
+        """
+        self._items: dict[str, dict[str, LayoutItem]] = {}
+        # Breakpoints whose list repeated a card
+        self._repeated: set[str] = set()
+        for breakpoint, items in (layouts or {}).items():
+            self._items[breakpoint] = {
+                item["i"]: LayoutItem.from_dict(item) for item in items or []
+            }
+            if len(self._items[breakpoint]) != len(items or []):
+                self._repeated.add(breakpoint)
+
+    @property
+    def breakpoints(self) -> list[str]:
+        return list(self._items)
+
+    def add_breakpoint(self, breakpoint: str) -> None:
+        self._items.setdefault(breakpoint, {})
+
+    def __contains__(self, card_id: str) -> bool:
+        return any(card_id in items for items in self._items.values())
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the ids of the cards in any of the breakpoints."""
+        seen = set()
+        for items in self._items.values():
+            for card_id in items:
+                if card_id not in seen:
+                    seen.add(card_id)
+                    yield card_id
+
+    def items(self, breakpoint: str) -> list[LayoutItem]:
+        """Return the items of a breakpoint, in order."""
+        return list(self._items.get(breakpoint, {}).values())
+
+    def get(self, card_id: str, breakpoint: str) -> LayoutItem | None:
+        """Return the item of a card in a breakpoint, or None."""
+        return self._items.get(breakpoint, {}).get(card_id)
+
+    def index(self, card_id: str, breakpoint: str) -> int | None:
+        """Return the position of the item of a card in a breakpoint, or None."""
+        items = self._items.get(breakpoint, {})
+        if card_id not in items:
+            return None
+        return list(items).index(card_id)
+
+    def is_normalized(self, breakpoint: str) -> bool:
+        """Return False if the list of the breakpoint repeated a card.
+
+        The positions of the items then differ from the positions in the list
+        the layouts were created from.
+        """
+        return breakpoint not in self._repeated
+
+    def widths(self, breakpoint: str) -> dict[str, int]:
+        """Return the number of columns each card spans in a breakpoint."""
+        return {
+            card_id: item.w for card_id, item in self._items.get(breakpoint, {}).items()
+        }
+
+    def bottom(self, breakpoint: str) -> int:
+        """Return the first free row below all the items of a breakpoint."""
+        return max(
+            (item.bottom for item in self._items.get(breakpoint, {}).values()),
+            default=0,
+        )
+
+    def add(self, item: LayoutItem, breakpoint: str) -> None:
+        """Add an item to the end of a breakpoint, replacing the card's item."""
+        items = self._items.setdefault(breakpoint, {})
+        items.pop(item.i, None)
+        items[item.i] = item
+
+    def move(
+        self,
+        card_id: str,
+        breakpoint: str,
+        x: int | None = None,
+        y: int | None = None,
+        w: int | None = None,
+        h: int | None = None,
+    ) -> LayoutItem:
+        """Change the position or size of a card in a breakpoint.
+
+        Raises:
+            KeyError: If the card has no item in the breakpoint.
+        """
+        item = self._items[breakpoint][card_id]
+        item.x = item.x if x is None else x
+        item.y = item.y if y is None else y
+        item.w = item.w if w is None else w
+        item.h = item.h if h is None else h
+        return item
+
+    def delete(self, card_id: str) -> dict[str, LayoutItem]:
+        """Remove a card from all breakpoints.
+
+        Returns:
+            dict[str, LayoutItem]: The removed items, by breakpoint.
+        """
+        removed = {}
+        for breakpoint, items in self._items.items():
+            item = items.pop(card_id, None)
+            if item is not None:
+                removed[breakpoint] = item
+        return removed
+
+    def duplicate(self, card_id: str, new_card_id: str) -> dict[str, LayoutItem]:
+        """Copy the items of a card to a new card, in all breakpoints.
+
+        Returns:
+            dict[str, LayoutItem]: The new items, by breakpoint.
+        """
+        added = {}
+        for breakpoint, items in self._items.items():
+            if card_id in items:
+                added[breakpoint] = items[new_card_id] = items[card_id].copy(
+                    new_card_id
+                )
+        return added
+
+    def pack(self, breakpoint: str, cols: int, compact: bool = False) -> bool:
+        """Move the items of a breakpoint so that no two of them overlap.
+
+        The items are visited from top to bottom, then left to right. Each one
+        is moved down just enough to clear the items visited before it, or, with
+        `compact`, moved up as far as it can go. The height of the columns
+        reached so far is tracked, so for n items this only takes the time of
+        sorting them (plus the width of each item).
+        Items wider than the grid are narrowed to `cols` columns.
+
+        Args:
+            breakpoint: The breakpoint to pack.
+            cols: The number of columns of the grid at this breakpoint.
+            compact: If True, remove the empty rows above the items, like the
+                vertical compaction of the grid.
+
+        Returns:
+            bool: True if an item was moved or resized.
+        """
+        items = sorted(
+            self._items.get(breakpoint, {}).values(), key=lambda item: (item.y, item.x)
+        )
+        heights = [0] * cols
+        changed = False
+        for item in items:
+            w = min(max(item.w, 1), cols)
+            x = min(max(item.x, 0), cols - w)
+            top = max(heights[x : x + w])
+            y = top if compact else max(item.y, top)
+            if (item.x, item.y, item.w) != (x, y, w):
+                item.x, item.y, item.w = x, y, w
+                changed = True
+            heights[x : x + w] = [y + item.h] * w
+        return changed
+
+    def pack_all(self, grid_cols: dict[str, int], compact: bool = False) -> list[str]:
+        """Pack every breakpoint which has a number of columns in `grid_cols`.
+
+        Returns:
+            list[str]: The breakpoints in which items were moved.
+        """
+        return [
+            breakpoint
+            for breakpoint in self.breakpoints
+            if breakpoint in grid_cols
+            and self.pack(breakpoint, grid_cols[breakpoint], compact)
+        ]
+
+    def to_dict(self) -> dict[str, list[dict[str, Any]]]:
+        """Return the layouts in the format of the `ResponsiveGrid` layouts."""
+        return {
+            breakpoint: [item.to_dict() for item in items.values()]
+            for breakpoint, items in self._items.items()
+        }
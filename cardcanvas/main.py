@@ -1,7 +1,6 @@
 import base64
-import copy
-import json
 import logging
+import time
 from typing import Any
 from uuid import uuid4
 
@@ -9,9 +8,11 @@ import dash_mantine_components as dmc
 from dash import (
     ALL,
     MATCH,
+    ClientsideFunction,
     Dash,
     Input,
     Output,
+    Patch,
     State,
     ctx,
     dcc,
@@ -23,8 +24,17 @@ from dash_snap_grid import ResponsiveGrid
 from dash_iconify import DashIconify
 
 from . import ui
+from .cache import LRUCache
 from .card_manager import CardManager
+from . import codec
+from .codec import decode_store, encode_store
+from .layout import CardLayouts
+from .helpers import combine_fingerprints, diff_cards, state_fingerprint
+from .history import History, to_patch
 from .settings import DEFAULT_THEME
+from .storage import MissingStateError, ServerState
+from .refresh import BackgroundRefresher
+from .streaming import StreamHub
 
 _dash_renderer._set_react_version("18.2.0")
 dmc.add_figure_templates()
@@ -35,8 +45,20 @@ class CardCanvas:
         self, settings: dict[str, Any], dash_options: dict[str, Any] | None = None
     ):
         self.settings = settings
-        self.card_manager = CardManager()
+        self.card_manager = CardManager(
+            cache_size=settings.get("render_cache_size", 256),
+            cache_ttl=settings.get("render_cache_ttl", None),
+            executor=settings.get("render_executor", None),
+            max_workers=settings.get("render_workers", None),
+        )
         self.dash_options = dash_options or {}
+        self.stream_hub: StreamHub | None = None
+        self.refresher: BackgroundRefresher | None = None
+        # The undo history of each browser session
+        self.histories = LRUCache(
+            maxsize=settings.get("undo_sessions", 100),
+            ttl=settings.get("undo_ttl", 24 * 3600),
+        )
 
     def run(self):
         self.app.run_server(debug=True)
@@ -60,6 +82,132 @@ class CardCanvas:
         theme = settings.get("theme", DEFAULT_THEME)
 
         show_global_settings = settings.get("show_global_settings", True)
+        lazy_loading = settings.get("lazy_loading", False)
+        progressive_loading = lazy_loading or settings.get("progressive_loading", False)
+        streaming = settings.get("streaming", False)
+        # Reads and writes the config, layout and global stores, which only hold
+        # a reference when the state is kept on the server.
+        state = ServerState(
+            settings.get("state_store"),
+            max_age=settings.get("state_max_age", 7 * 24 * 3600),
+        )
+        compress_main_store = settings.get("compress_main_store", False)
+
+        def read_main_store(main_store):
+            try:
+                return decode_store(main_store)
+            except Exception as e:
+                logging.error(f"Could not read the saved layout: {e}")
+                return None
+
+        grid_cols = settings.get(
+            "grid_cols",
+            {"xl": 24, "lg": 18, "md": 12, "sm": 6, "xs": 4, "xxs": 2},
+        )
+        compact_type = settings.get("grid_compact_type", None)
+
+        compact_state = settings.get("compact_state", True)
+
+        def compact(card_config, card_layouts):
+            if not compact_state:
+                return card_config, card_layouts, None
+            return self.card_manager.compact_state(card_config, card_layouts)
+
+        def card_widths(card_layouts):
+            # Figures are sized for the widest breakpoint of the layout
+            layouts = CardLayouts(card_layouts)
+            breakpoints = [bp for bp in layouts.breakpoints if bp in grid_cols]
+            if not breakpoints:
+                return None
+            return layouts.widths(max(breakpoints, key=grid_cols.get))
+
+        undo_steps = settings.get("undo_steps", 100)
+        undo_max_bytes = settings.get("undo_max_bytes", 256_000)
+
+        def record_history(session, values, previous):
+            # Changes are recorded in the undo history here, on the server, so
+            # the stores are not sent back just to record them. The history of
+            # a page starts with its first change, and a store is only copied
+            # into it when it first changes.
+            if not session or not undo_steps:
+                return
+            history = self.histories.get(session)
+            if history is None:
+                history = History(max_steps=undo_steps, max_bytes=undo_max_bytes)
+                self.histories.set(session, history)
+            known = history.current if isinstance(history.current, dict) else {}
+            history.record_values(
+                values,
+                {
+                    kind: state.read(value)
+                    for kind, value in (previous or {}).items()
+                    if kind in values and kind not in known
+                },
+            )
+
+        def write_stores(session, values, patches=None, previous=None):
+            # `previous` holds the stores before the change, as they are in the
+            # browser. The stores written by a callback are one undo step.
+            record_history(session, values, previous)
+            patches = patches or {}
+            return tuple(
+                state.write_patch(session, kind, value, patches.get(kind))
+                for kind, value in values.items()
+            )
+
+        def main_store_fingerprint(data):
+            return state_fingerprint(
+                data.get("card_config"),
+                data.get("card_layouts"),
+                data.get("global_settings"),
+            )
+
+        def write_main_store(data, fingerprint=None):
+            # The fingerprint lets a save skip rewriting an unchanged layout
+            data = {**data, "fingerprint": fingerprint or main_store_fingerprint(data)}
+            return encode_store(data) if compress_main_store else data
+
+        def apply_operations(session, config_store, layout_store, operations):
+            card_config = state.read(config_store)
+            card_layouts = state.read(layout_store)
+            try:
+                changes = self.card_manager.apply_operations(
+                    card_config,
+                    card_layouts,
+                    operations,
+                    grid_cols=grid_cols,
+                    compact=compact_type == "vertical",
+                )
+            except ValueError as e:
+                logging.error(e)
+                return no_update, no_update
+            # Only the changes are sent back, unless the stores were empty
+            return write_stores(
+                session,
+                {"config": changes.card_config, "layouts": changes.card_layouts},
+                {
+                    "config": changes.config_patch if card_config else None,
+                    "layouts": changes.layouts_patch if card_layouts else None,
+                },
+                {"config": config_store, "layouts": layout_store},
+            )
+
+        def duplicate_operations(card_ids, card_layout):
+            # The copies are placed where the cards are shown in the grid, which
+            # may differ from the layouts in the store
+            grid = CardLayouts({"grid": card_layout})
+            operations = []
+            for card_id in card_ids:
+                item = grid.get(card_id, "grid")
+                operations.append(
+                    {
+                        "op": "duplicate",
+                        "card_id": card_id,
+                        "layout": item.to_dict() if item else None,
+                    }
+                )
+            return operations
+
         app = Dash(
             __name__,
             **self.dash_options,
@@ -67,6 +215,14 @@ class CardCanvas:
             suppress_callback_exceptions=True,
         )
         app.title = f"{title}: {subtitle}" if subtitle else title
+        if settings.get("background_refresh", False):
+            self.refresher = BackgroundRefresher(
+                self.card_manager,
+                idle_timeout=settings.get("background_refresh_timeout", 60),
+            )
+        if streaming:
+            self.stream_hub = StreamHub(self.card_manager, refresher=self.refresher)
+            self.stream_hub.init_app(app.server, app.config.routes_pathname_prefix)
 
         title_layout = dmc.Group(
             [
@@ -103,10 +259,7 @@ class CardCanvas:
             ResponsiveGrid(
                 id="card-grid",
                 children=[],
-                cols=settings.get(
-                    "grid_cols",
-                    {"xl": 24, "lg": 18, "md": 12, "sm": 6, "xs": 4, "xxs": 2},
-                ),
+                cols=grid_cols,
                 breakpoints=settings.get(
                     "grid_breakpoints",
                     {
@@ -119,7 +272,7 @@ class CardCanvas:
                     },
                 ),
                 rowHeight=settings.get("grid_row_height", 50),
-                compactType=settings.get("grid_compact_type", None),
+                compactType=compact_type,
                 draggableCancel=".no-drag *",
                 isDroppable=True,
                 layouts={"lg": []},
@@ -153,6 +306,29 @@ class CardCanvas:
                     id="cardcanvas-global-store",
                     storage_type="memory",
                 ),
+                # The key of the state of this page on the server (if a state
+                # store is configured)
+                dcc.Store(
+                    id="cardcanvas-session-store",
+                    storage_type="memory",
+                ),
+                # Set when the state of the page is no longer on the server, to
+                # load the saved layout again
+                dcc.Store(
+                    id="cardcanvas-reload-store",
+                    storage_type="memory",
+                ),
+                # Hashes of the cards currently in the grid, used to only send
+                # the cards that changed.
+                dcc.Store(
+                    id="cardcanvas-rendered-store",
+                    storage_type="memory",
+                ),
+                # A single timer refreshing all the cards with an interval
+                dcc.Interval(id="cardcanvas-scheduler", interval=1000, disabled=True),
+                # When each card is due next, in milliseconds since the epoch
+                dcc.Store(id="cardcanvas-schedule-store", storage_type="memory"),
+                dcc.Store(id="cardcanvas-stream-store", storage_type="memory"),
                 dcc.Download(id="download-layout-data"),
                 dmc.NotificationContainer(id="notification-container"),
             ],
@@ -180,68 +356,315 @@ class CardCanvas:
             Output("cardcanvas-config-store", "data"),
             Output("cardcanvas-layout-store", "data"),
             Output("cardcanvas-global-store", "data"),
+            Output("cardcanvas-session-store", "data"),
             Input(app.layout, "layout"),
+            Input("cardcanvas-reload-store", "data"),
             State("cardcanvas-main-store", "data"),
         )
-        def load_layout(layout, main_store):
+        def load_layout(layout, reload, main_store):
+            main_store = read_main_store(main_store)
             if not main_store:
                 main_store = {}
 
-            card_config = main_store.get("card_config", start_card_config)
-            card_layouts = main_store.get("card_layouts", start_card_layout)
+            card_config, card_layouts, _ = compact(
+                main_store.get("card_config", start_card_config),
+                main_store.get("card_layouts", start_card_layout),
+            )
             global_settings = main_store.get("global_settings", {})
-            return card_config, card_layouts, global_settings
+            # Identifies the page for the state store and the undo history
+            session = uuid4().hex
+            state.prune()
+            return (
+                state.write(session, "config", card_config),
+                state.write(session, "layouts", card_layouts),
+                state.write(session, "global", global_settings),
+                session,
+            )
 
         @app.callback(
             Output("card-grid", "children"),
             Output("card-grid", "layouts"),
+            Output("cardcanvas-rendered-store", "data"),
+            Output("cardcanvas-scheduler", "interval"),
+            Output("cardcanvas-scheduler", "disabled"),
+            Output("cardcanvas-reload-store", "data"),
             Input("cardcanvas-config-store", "data"),
             Input("cardcanvas-layout-store", "data"),
             Input("cardcanvas-global-store", "data"),
+            State("cardcanvas-rendered-store", "data"),
+            State({"type": "card-hash", "index": ALL}, "id"),
+            State({"type": "card-hash", "index": ALL}, "data"),
             prevent_initial_call=True,
         )
         def load_cards(
             card_config_store,
             card_layout_store,
             global_settings,
+            rendered,
+            hash_ids,
+            loaded_hashes,
         ):
-            new_children = self.card_manager.render(
-                card_config_store,
+            try:
+                card_config = state.read(card_config_store) or {}
+                card_layout_store = state.read(card_layout_store)
+                global_settings = state.read(global_settings)
+            except MissingStateError as e:
+                # The state expired on the server, the saved layout is loaded
+                # again instead of showing an empty dashboard
+                logging.warning(f"The state {e} is missing, reloading the layout")
+                return (*[no_update] * 5, uuid4().hex)
+
+            widths = card_widths(card_layout_store) or {}
+
+            def card_hashes(card_ids):
+                return {
+                    card_id: self.card_manager.card_hash(
+                        card_id,
+                        card_config[card_id],
+                        global_settings,
+                        widths.get(card_id),
+                    )
+                    for card_id in card_ids
+                }
+
+            card_ids = [
+                card_id
+                for card_id, card in card_config.items()
+                if card.get("card_class") in self.card_manager.card_classes
+            ]
+            hashes = card_hashes(card_ids)
+            combined = combine_fingerprints(hashes)
+            # The hash of a card rendered as a placeholder is replaced once its
+            # content is loaded, when the global settings it reads are known
+            loaded = {
+                card_id["index"]: card_hash
+                for card_id, card_hash in zip(hash_ids or [], loaded_hashes or [])
+                if card_hash
+            }
+            if rendered and loaded:
+                cards = [
+                    [card_id, loaded.get(card_id, card_hash)]
+                    for card_id, card_hash in rendered.get("cards", [])
+                ]
+                rendered = {
+                    "cards": cards,
+                    "fingerprint": combine_fingerprints(dict(cards)),
+                }
+            if rendered and rendered.get("fingerprint") == combined:
+                # Nothing that affects the cards changed, only the layout may have
+                return no_update, card_layout_store, *[no_update] * 4
+            debug = self.app.server.debug
+            refresh_interval = self.card_manager.refresh_interval(
+                card_config,
+                streaming=streaming,
+                min_interval=settings.get("refresh_min_interval", 250),
+            )
+            scheduler = (refresh_interval or no_update, refresh_interval is None)
+
+            # The hashes include the global settings each card depends on, so a
+            # change of the global settings only re-renders the cards using it.
+            diff = None
+            if rendered:
+                diff = diff_cards(rendered.get("cards", []), hashes)
+            if diff is None:
+                new_children = self.card_manager.render(
+                    card_config,
+                    global_settings=global_settings,
+                    debug=debug,
+                    progressive=progressive_loading,
+                    lazy=lazy_loading,
+                    widths=widths,
+                )
+                # Rendering records the dependencies, which changes the hashes
+                hashes = card_hashes(card_ids)
+                new_rendered = {
+                    "cards": list(hashes.items()),
+                    "fingerprint": combine_fingerprints(hashes),
+                }
+                return (
+                    new_children,
+                    card_layout_store,
+                    new_rendered,
+                    *scheduler,
+                    no_update,
+                )
+
+            removed, replaced, added = diff
+            if not removed and not replaced and not added:
+                return no_update, card_layout_store, *[no_update] * 4
+            changed_ids = [card_id for _, card_id in replaced] + added
+            rendered_cards = self.card_manager.render(
+                {card_id: card_config[card_id] for card_id in changed_ids},
                 global_settings=global_settings,
-                debug=self.app.server.debug,
+                debug=debug,
+                progressive=progressive_loading,
+                lazy=lazy_loading,
+                widths=widths,
             )
-            new_layout = card_layout_store
+            hashes.update(card_hashes(changed_ids))
+            new_rendered = {
+                "cards": list(hashes.items()),
+                "fingerprint": combine_fingerprints(hashes),
+            }
+            rendered_by_id = dict(zip(changed_ids, rendered_cards))
+            new_children = Patch()
+            for index in removed:
+                del new_children[index]
+            for index, card_id in replaced:
+                new_children[index] = rendered_by_id[card_id]
+            if added:
+                new_children.extend([rendered_by_id[card_id] for card_id in added])
             return (
                 new_children,
-                new_layout,
+                card_layout_store,
+                new_rendered,
+                *scheduler,
+                no_update,
+            )
+
+        # In lazy mode, the content is loaded when the card becomes visible
+        # (see assets/lazy.js), otherwise as soon as the placeholder is displayed.
+        @app.callback(
+            Output({"type": "card-loader", "index": MATCH}, "children"),
+            Output({"type": "card-hash", "index": MATCH}, "data"),
+            Input(
+                {"type": "card-visible", "index": MATCH}
+                if lazy_loading
+                else {"type": "card-loader", "index": MATCH},
+                "data" if lazy_loading else "id",
+            ),
+            State("cardcanvas-config-store", "data"),
+            State("cardcanvas-global-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-session-store", "data"),
+        )
+        def load_card_content(
+            trigger, card_config, global_settings, card_layouts, session
+        ):
+            card_config = state.read(card_config)
+            if not trigger or not card_config:
+                return no_update, no_update
+            global_settings = state.read(global_settings)
+            # triggered_id is not set on the initial call, the output id always is
+            card_id = ctx.outputs_list[0]["id"]["index"]
+            widths = card_widths(state.read(card_layouts)) or {}
+            card = self.card_manager.card_object(
+                card_id, card_config, global_settings, widths.get(card_id), session
+            )
+            if card is None:
+                return no_update, no_update
+            card.debug = self.app.server.debug
+            content = self.card_manager.render_content(card)
+            # Rendering recorded the global settings the card reads, so its hash
+            # only changes with them from now on
+            card_hash = self.card_manager.card_hash(
+                card_id, card_config[card_id], global_settings, widths.get(card_id)
             )
+            return content, card_hash
+
+        # Cards fetch more detail for the range the user zoomed to, see
+        # Card.render_relayout
+        @app.callback(
+            Output({"type": "card-figure", "index": MATCH}, "figure"),
+            Input({"type": "card-figure", "index": MATCH}, "relayoutData"),
+            State("cardcanvas-config-store", "data"),
+            State("cardcanvas-global-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-session-store", "data"),
+            prevent_initial_call=True,
+        )
+        def relayout_card(
+            relayout_data, card_config, global_settings, card_layouts, session
+        ):
+            card_config = state.read(card_config)
+            if not relayout_data or not card_config:
+                return no_update
+            card_id = ctx.outputs_list["id"]["index"]
+            widths = card_widths(state.read(card_layouts)) or {}
+            card = self.card_manager.card_object(
+                card_id,
+                card_config,
+                state.read(global_settings),
+                widths.get(card_id),
+                session,
+            )
+            if card is None:
+                return no_update
+            try:
+                figure = card.render_relayout(relayout_data)
+            except Exception as e:
+                logging.error(f"Could not update the figure of card {card_id}: {e}")
+                return no_update
+            return no_update if figure is None else figure
 
         @app.callback(
             Output("cardcanvas-main-store", "data", allow_duplicate=True),
             Output("cardcanvas-layout-store", "data", allow_duplicate=True),
+            Output("cardcanvas-config-store", "data", allow_duplicate=True),
             Output("notification-container", "sendNotifications"),
             Input("save-layout", "n_clicks"),
             State("card-grid", "layouts"),
             State("cardcanvas-config-store", "data"),
             State("cardcanvas-global-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-session-store", "data"),
+            State("cardcanvas-main-store", "data"),
             prevent_initial_call=True,
         )
-        def save_reset_cards(nclicks, card_layouts, card_config, global_settings):
+        def save_reset_cards(
+            nclicks,
+            card_layouts,
+            config_store,
+            global_settings,
+            layout_store,
+            session,
+            main_store,
+        ):
             if not nclicks:
-                return no_update, no_update, no_update
+                return no_update, no_update, no_update, no_update
+            stored_config = state.read(config_store) or {}
+            card_config, card_layouts, report = compact(stored_config, card_layouts)
+            data = {
+                "card_layouts": card_layouts,
+                "card_config": card_config,
+                "global_settings": state.read(global_settings),
+            }
+            fingerprint = main_store_fingerprint(data)
+            saved = read_main_store(main_store) or {}
+            if saved.get("fingerprint") == fingerprint:
+                # The saved layout is unchanged, don't rewrite the local storage
+                new_main_store = no_update
+            else:
+                new_main_store = write_main_store(data, fingerprint)
+            message = "The layout has been saved"
+            if report is not None and report.changed:
+                message += f" ({report})"
+            # This is required since there may be changes in the layout which
+            # are not reflected in the cardcanvas_layout_store
+            values = {"layouts": card_layouts}
+            previous = {"layouts": layout_store}
+            patches = {}
+            if report is not None and (report.unknown_cards or report.redundant_ids):
+                # The compacted config is what was saved, only the removed
+                # cards and ids are sent
+                config_patch = Patch()
+                for card_id, card in stored_config.items():
+                    if card_id not in card_config:
+                        del config_patch[card_id]
+                    elif "id" in card and "id" not in card_config[card_id]:
+                        del config_patch[card_id]["id"]
+                values["config"] = card_config
+                previous["config"] = config_store
+                patches["config"] = config_patch
+            stores = write_stores(session, values, patches, previous)
             return (
-                {
-                    "card_layouts": card_layouts,
-                    "card_config": card_config,
-                    "global_settings": global_settings,
-                },
-                # This is required since there may be changes in the layout which
-                # are not reflected in the cardcanvas_layout_store
-                card_layouts,
+                new_main_store,
+                *stores,
+                *[no_update] * (2 - len(stores)),
                 [
                     dict(
                         title="Layout Saved",
-                        message="The layout has been saved",
+                        message=message,
                         color="teal",
                         action="show",
                     )
@@ -255,15 +678,34 @@ class CardCanvas:
             Output("notification-container", "sendNotifications", allow_duplicate=True),
             Input("restore-layout", "n_clicks"),
             State("cardcanvas-main-store", "data"),
+            State("cardcanvas-config-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-global-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def reset_layouts(nclicks, main_store):
+        def reset_layouts(
+            nclicks, main_store, config_store, layout_store, global_store, session
+        ):
+            main_store = read_main_store(main_store)
             if not nclicks or not main_store or not isinstance(main_store, dict):
                 return no_update, no_update, no_update
             return (
-                main_store.get("card_layouts", start_card_layout),
-                main_store.get("card_config", start_card_config),
-                main_store.get("global_settings", start_global_settings),
+                *write_stores(
+                    session,
+                    {
+                        "layouts": main_store.get("card_layouts", start_card_layout),
+                        "config": main_store.get("card_config", start_card_config),
+                        "global": main_store.get(
+                            "global_settings", start_global_settings
+                        ),
+                    },
+                    previous={
+                        "config": config_store,
+                        "layouts": layout_store,
+                        "global": global_store,
+                    },
+                ),
                 [
                     dict(
                         title="Layout Reset",
@@ -291,7 +733,7 @@ class CardCanvas:
             ]
             if show_global_settings and self.card_manager.global_settings_class:
                 global_settings = self.card_manager.global_settings_class(
-                    global_settings
+                    state.read(global_settings)
                 )
                 children.extend(
                     [
@@ -309,9 +751,13 @@ class CardCanvas:
             State({"type": "global-settings", "setting": ALL}, "id"),
             State({"type": "global-settings", "setting": ALL}, "value"),
             State({"type": "global-settings", "setting": ALL}, "checked"),
+            State("cardcanvas-global-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def save_global_settings(nclicks, ids, values, checked_values):
+        def save_global_settings(
+            nclicks, ids, values, checked_values, global_store, session
+        ):
             if not nclicks or not ctx.triggered:
                 return no_update, no_update
             global_settings = {}
@@ -320,7 +766,14 @@ class CardCanvas:
                 if value is None and (checked in [True, False]):
                     value = checked
                 global_settings[setting] = value
-            return global_settings, False
+            return (
+                *write_stores(
+                    session,
+                    {"global": global_settings},
+                    previous={"global": global_store},
+                ),
+                False,
+            )
 
         @app.callback(
             Output("settings-layout", "opened", allow_duplicate=True),
@@ -356,34 +809,27 @@ class CardCanvas:
             Input("card-grid", "droppedItem"),
             State("cardcanvas-config-store", "data"),
             State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def add_new_card(dropped_item, card_config, card_layouts):
+        def add_new_card(dropped_item, card_config, card_layouts, session):
             if not dropped_item:
                 return no_update, no_update
-            card_id = str(uuid4())
-            new_layout_item = {
-                "i": card_id,
-                "x": dropped_item["x"],
-                "y": dropped_item["y"],
-                "w": dropped_item["w"],
-                "h": dropped_item["h"],
-            }
             # dropped_item["i"] returns the id of dropped object. In this case, it is the card class.
-            card_class = dropped_item["i"]
-            card_config[card_id] = {"card_class": card_class, "settings": {}}
-            card_class_obj = self.card_manager.card_classes.get(card_class)
-            if (
-                card_class_obj
-                and hasattr(card_class_obj, "grid_settings")
-                and isinstance(card_class_obj.grid_settings, dict)
-            ):
-                new_layout_item.update(card_class_obj.grid_settings)
-            if not card_layouts:
-                card_layouts = {"lg": []}
-            for key in card_layouts.keys():
-                card_layouts[key].append(new_layout_item)
-            return card_config, card_layouts
+            return apply_operations(
+                session,
+                card_config,
+                card_layouts,
+                [
+                    {
+                        "op": "add",
+                        "card_class": dropped_item["i"],
+                        "layout": {
+                            key: dropped_item[key] for key in ("x", "y", "w", "h")
+                        },
+                    }
+                ],
+            )
 
         @app.callback(
             Output("cardcanvas-config-store", "data", allow_duplicate=True),
@@ -392,27 +838,21 @@ class CardCanvas:
             State("cardcanvas-config-store", "data"),
             State("cardcanvas-layout-store", "data"),
             State("card-grid", "layout"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def duplicate_card(nclicks, card_config, card_layouts, card_layout):
-            if not card_config:
-                return no_update, no_update
+        def duplicate_card(nclicks, card_config, card_layouts, card_layout, session):
             if not any(nclicks) or not ctx.triggered:
                 return no_update, no_update
             if not ctx.triggered_id or not isinstance(ctx.triggered_id, dict):
                 return no_update, no_update
             card_id = ctx.triggered_id.get("index")
-            new_card_id = str(uuid4())
-            new_card_layout = copy.deepcopy(
-                next((item for item in card_layout if item["i"] == card_id))
+            return apply_operations(
+                session,
+                card_config,
+                card_layouts,
+                duplicate_operations([card_id], card_layout),
             )
-            new_card = copy.deepcopy(card_config.get(card_id, None))
-            new_card["id"] = new_card_id
-            new_card_layout["i"] = new_card_id
-            card_config[new_card_id] = new_card
-            for key in card_layouts.keys():
-                card_layouts[key].append(new_card_layout)
-            return card_config, card_layouts
 
         @app.callback(
             Output("cardcanvas-config-store", "data", allow_duplicate=True),
@@ -420,22 +860,65 @@ class CardCanvas:
             Input({"type": "card-delete", "index": ALL}, "n_clicks"),
             State("cardcanvas-config-store", "data"),
             State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def delete_card(nclicks, card_config, card_layouts):
-            if not card_config:
-                return no_update, no_update
+        def delete_card(nclicks, card_config, card_layouts, session):
             if not any(nclicks) or not ctx.triggered:
                 return no_update, no_update
             if not ctx.triggered_id or not isinstance(ctx.triggered_id, dict):
                 return no_update, no_update
             card_id = ctx.triggered_id.get("index")
-            card_config.pop(card_id, None)
-            for key in card_layouts.keys():
-                card_layouts[key] = [
-                    item for item in card_layouts[key] if item["i"] != card_id
+            return apply_operations(
+                session,
+                card_config,
+                card_layouts,
+                [{"op": "delete", "card_id": card_id}],
+            )
+
+        @app.callback(
+            Output("cardcanvas-config-store", "data", allow_duplicate=True),
+            Output("cardcanvas-layout-store", "data", allow_duplicate=True),
+            Output({"type": "card-select", "index": ALL}, "checked"),
+            Input("duplicate-selected", "n_clicks"),
+            Input("delete-selected", "n_clicks"),
+            State({"type": "card-select", "index": ALL}, "checked"),
+            State("cardcanvas-config-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("card-grid", "layout"),
+            State("cardcanvas-session-store", "data"),
+            prevent_initial_call=True,
+        )
+        def edit_selected_cards(
+            duplicate_clicks,
+            delete_clicks,
+            checked,
+            card_config,
+            card_layouts,
+            card_layout,
+            session,
+        ):
+            selected = [
+                item["id"]["index"]
+                for item, is_checked in zip(ctx.states_list[0], checked)
+                if is_checked
+            ]
+            if not selected or ctx.triggered_id not in (
+                "duplicate-selected",
+                "delete-selected",
+            ):
+                return no_update, no_update, [no_update] * len(checked)
+            if ctx.triggered_id == "duplicate-selected":
+                operations = duplicate_operations(selected, card_layout)
+            else:
+                operations = [
+                    {"op": "delete", "card_id": card_id} for card_id in selected
                 ]
-            return card_config, card_layouts
+            # All the cards change in one callback, so the grid is updated once
+            return (
+                *apply_operations(session, card_config, card_layouts, operations),
+                [False] * len(checked),
+            )
 
         @app.callback(
             Output("settings-layout", "children", allow_duplicate=True),
@@ -443,20 +926,24 @@ class CardCanvas:
             Input({"type": "card-settings", "index": ALL}, "n_clicks"),
             State("cardcanvas-config-store", "data"),
             State("cardcanvas-global-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def open_card_settings(nclicks, card_config, global_settings):
+        def open_card_settings(nclicks, card_config, global_settings, session):
             if not any(nclicks) or not ctx.triggered or not ctx.triggered_id:
                 return no_update, no_update
+            card_config = state.read(card_config)
+            global_settings = state.read(global_settings)
             if not card_config:
                 card_config = start_card_config
             card_id = ctx.triggered_id.get("index")
-            card_objects = self.card_manager.card_objects(card_config, global_settings)
-            if card_id not in card_objects:
+            card = self.card_manager.card_object(
+                card_id, card_config, global_settings, session=session
+            )
+            if card is None:
                 return dmc.Alert(
                     f"Card with id: {card_id} not found", color="red"
                 ), True
-            card = card_objects[card_id]
             return dmc.Stack(
                 [
                     dmc.Stack(
@@ -487,11 +974,18 @@ class CardCanvas:
             State({"type": "card-settings", "id": ALL, "setting": ALL}, "value"),
             State({"type": "card-settings", "id": ALL, "setting": ALL}, "checked"),
             State("cardcanvas-config-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def save_card_settings(nclicks, ids, values, checked_values, card_config):
+        def save_card_settings(
+            nclicks, ids, values, checked_values, config_store, session
+        ):
             if not nclicks or not ctx.triggered:
                 return no_update, no_update
+            # The changed cards are copied, the history may still need the
+            # store as it was
+            card_config = dict(state.read(config_store) or {})
+            config_patch = Patch()
             for idx, value, checked in zip(ids, values, checked_values):
                 card_id = idx.get("id")
                 setting = idx.get("setting")
@@ -499,35 +993,176 @@ class CardCanvas:
                     continue
                 if value is None and (checked in [True, False]):
                     value = checked
-                card_config[card_id]["settings"][setting] = value
-            return card_config, False
+                card = card_config[card_id]
+                card_config[card_id] = {
+                    **card,
+                    "settings": {**card["settings"], setting: value},
+                }
+                config_patch[card_id]["settings"][setting] = value
+            return (
+                *write_stores(
+                    session,
+                    {"config": card_config},
+                    {"config": config_patch},
+                    {"config": config_store},
+                ),
+                False,
+            )
+
+        # The history is recorded by the callbacks changing the stores, only
+        # the time of the change is sent here
+        @app.callback(
+            Output("undo", "disabled"),
+            Output("redo", "disabled"),
+            Input("cardcanvas-config-store", "modified_timestamp"),
+            Input("cardcanvas-layout-store", "modified_timestamp"),
+            Input("cardcanvas-global-store", "modified_timestamp"),
+            State("cardcanvas-session-store", "data"),
+            prevent_initial_call=True,
+        )
+        def update_history_buttons(config_time, layouts_time, global_time, session):
+            history = self.histories.get(session) if session else None
+            if history is None:
+                return True, True
+            return not history.can_undo, not history.can_redo
+
+        @app.callback(
+            Output("cardcanvas-config-store", "data", allow_duplicate=True),
+            Output("cardcanvas-layout-store", "data", allow_duplicate=True),
+            Output("cardcanvas-global-store", "data", allow_duplicate=True),
+            Input("undo", "n_clicks"),
+            Input("redo", "n_clicks"),
+            State("cardcanvas-session-store", "data"),
+            prevent_initial_call=True,
+        )
+        def undo_redo(undo_clicks, redo_clicks, session):
+            history = self.histories.get(session) if session else None
+            if history is None:
+                return no_update, no_update, no_update
+            delta = history.undo() if ctx.triggered_id == "undo" else history.redo()
+            if not delta:
+                return no_update, no_update, no_update
+            # Only the stores touched by the change are sent, as patches
+            outputs = []
+            for kind in ("config", "layouts", "global"):
+                kind_delta = [
+                    {**operation, "path": operation["path"][1:]}
+                    for operation in delta
+                    if operation["path"][0] == kind
+                ]
+                if not kind_delta:
+                    outputs.append(no_update)
+                    continue
+                outputs.append(
+                    state.write_patch(
+                        session, kind, history.current[kind], to_patch(kind_delta)
+                    )
+                )
+            return tuple(outputs)
 
         @app.callback(
             Output("card-grid", "isDraggable"),
             Output("card-grid", "isResizable"),
             Output({"type": "card-menu", "index": ALL}, "style"),
+            Output("selection-actions", "style"),
             Input({"type": "card-menu", "index": ALL}, "id"),
             Input("edit-layout", "checked"),
             prevent_initial_call=True,
         )
         def toggle_edit_mode(ids, checked):
             if checked:
-                return True, True, [{"display": "block"}] * len(ids)
-            return False, False, [{"display": "none"}] * len(ids)
+                return True, True, [{"display": "block"}] * len(ids), {}
+            return False, False, [{"display": "none"}] * len(ids), {"display": "none"}
 
         @app.callback(
-            Output({"type": "card-content", "index": MATCH}, "children"),
-            Input({"type": "card-interval", "index": MATCH}, "n_intervals"),
+            Output({"type": "card-content", "index": ALL}, "children"),
+            Output("cardcanvas-schedule-store", "data"),
+            Input("cardcanvas-scheduler", "n_intervals"),
+            State("cardcanvas-scheduler", "interval"),
             State("cardcanvas-config-store", "data"),
             State("cardcanvas-global-store", "data"),
+            State("cardcanvas-schedule-store", "data"),
+            State("cardcanvas-session-store", "data"),
+            prevent_initial_call=True,
         )
-        def update_card(n_intervals, cards_config, global_settings):
-            if not ctx.triggered_id or not cards_config:
-                return no_update
-            card_objects = self.card_manager.card_objects(cards_config, global_settings)
-            card_id = ctx.triggered_id.get("index")
-            card = card_objects[card_id]
-            return card.render()
+        def update_cards(
+            n_intervals, tick, cards_config, global_settings, schedule, session
+        ):
+            # Each card is refreshed on the first tick after its due time, so
+            # the tick can change without shifting the schedule.
+            card_ids = [output["id"]["index"] for output in ctx.outputs_list[0]]
+            cards_config = state.read(cards_config)
+            global_settings = state.read(global_settings)
+            if not n_intervals or not tick or not cards_config:
+                return [no_update] * len(card_ids), no_update
+            now = time.time() * 1000
+            schedule = schedule or {}
+            new_schedule = {}
+            due_cards = {}
+            for card_id in card_ids:
+                # The interval is read from the class, so only the cards which
+                # are due are created
+                card_class = self.card_manager.card_classes.get(
+                    (cards_config.get(card_id) or {}).get("card_class")
+                )
+                if card_class is None or not card_class.interval:
+                    continue
+                if streaming and card_class.stream:
+                    continue
+                interval = card_class.interval
+                # Cards without a due time were rendered at most a tick ago
+                due = schedule.get(card_id, now - tick + interval)
+                # Ticks are not exact, a card due within half a tick is refreshed
+                if due - tick / 2 <= now:
+                    card = self.card_manager.card_object(
+                        card_id, cards_config, global_settings, session=session
+                    )
+                    card.debug = self.app.server.debug
+                    due_cards[card_id] = card
+                    due = now + interval
+                new_schedule[card_id] = due
+            if self.refresher is not None:
+                contents = {
+                    card_id: self.refresher.get(card)
+                    for card_id, card in due_cards.items()
+                }
+            else:
+                contents = dict(
+                    zip(
+                        due_cards,
+                        self.card_manager.render_contents(list(due_cards.values())),
+                    )
+                )
+            return (
+                [contents.get(card_id, no_update) for card_id in card_ids],
+                new_schedule,
+            )
+
+        if streaming:
+
+            @app.callback(
+                Output("cardcanvas-stream-store", "data"),
+                Input("cardcanvas-config-store", "data"),
+                Input("cardcanvas-global-store", "data"),
+                State("cardcanvas-stream-store", "data"),
+                prevent_initial_call=True,
+            )
+            def subscribe_stream(card_config, global_settings, stream):
+                if stream:
+                    self.stream_hub.unsubscribe(stream["token"])
+                token = self.stream_hub.subscribe(
+                    state.read(card_config), state.read(global_settings)
+                )
+                if token is None:
+                    return None
+                url = f"{app.config.requests_pathname_prefix}{StreamHub.url_path}"
+                return {"token": token, "url": f"{url}{token}"}
+
+            # Opens the event source, see assets/stream.js
+            app.clientside_callback(
+                ClientsideFunction(namespace="cardcanvas", function_name="openStream"),
+                Input("cardcanvas-stream-store", "data"),
+            )
 
         @app.callback(
             Output("download-layout-data", "data"),
@@ -536,10 +1171,12 @@ class CardCanvas:
             prevent_initial_call=True,
         )
         def download_layout(nclicks, main_store):
+            main_store = read_main_store(main_store)
             if not nclicks or not main_store:
                 return no_update
+            main_store.pop("fingerprint", None)
             return dict(
-                content=json.dumps(main_store), filename="layout.json", type="json"
+                content=codec.dumps(main_store), filename="layout.json", type="json"
             )
 
         @app.callback(
@@ -547,21 +1184,37 @@ class CardCanvas:
             Output("cardcanvas-config-store", "data", allow_duplicate=True),
             Output("cardcanvas-layout-store", "data", allow_duplicate=True),
             Input("upload-layout", "contents"),
+            State("cardcanvas-config-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def upload_layout(contents):
+        def upload_layout(contents, config_store, layout_store, session):
             if not contents:
                 return no_update
             try:
                 content_type, content_string = contents.split(",")
-                decoded = base64.b64decode(content_string)
-                content = decoded.decode("utf-8")
-                data = json.loads(content)
-                return (
-                    data,
+                data = codec.loads(base64.b64decode(content_string))
+                card_config, card_layouts, _ = compact(
                     data.get("card_config", start_card_config),
                     data.get("card_layouts", start_card_layout),
                 )
+                # Uploaded layouts may come from a grid with other columns
+                card_layouts = CardLayouts(card_layouts)
+                card_layouts.pack_all(grid_cols, compact=compact_type == "vertical")
+                data["card_config"] = card_config
+                data["card_layouts"] = card_layouts.to_dict()
+                return (
+                    write_main_store(data),
+                    *write_stores(
+                        session,
+                        {
+                            "config": data["card_config"],
+                            "layouts": data["card_layouts"],
+                        },
+                        previous={"config": config_store, "layouts": layout_store},
+                    ),
+                )
             except Exception as e:
                 logging.error(e)
             return {}
@@ -572,15 +1225,25 @@ class CardCanvas:
             Output("cardcanvas-global-store", "data", allow_duplicate=True),
             Output("notification-container", "sendNotifications", allow_duplicate=True),
             Input("clear-layout", "n_clicks"),
+            State("cardcanvas-config-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-global-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def clear_layout(nclicks):
+        def clear_layout(nclicks, config_store, layout_store, global_store, session):
             if not nclicks:
                 return no_update, no_update, no_update, no_update
             return (
-                {},
-                {},
-                {},
+                *write_stores(
+                    session,
+                    {"config": {}, "layouts": {}, "global": {}},
+                    previous={
+                        "config": config_store,
+                        "layouts": layout_store,
+                        "global": global_store,
+                    },
+                ),
                 [
                     dict(
                         title="Layout Cleared",
@@ -600,14 +1263,20 @@ class CardCanvas:
             Output("cardcanvas-layout-store", "data", allow_duplicate=True),
             Output("notification-container", "sendNotifications", allow_duplicate=True),
             Input("reset-layout", "n_clicks"),
+            State("cardcanvas-config-store", "data"),
+            State("cardcanvas-layout-store", "data"),
+            State("cardcanvas-session-store", "data"),
             prevent_initial_call=True,
         )
-        def reset_layout(nclicks):
+        def reset_layout(nclicks, config_store, layout_store, session):
             if not nclicks:
                 return no_update, no_update, no_update
             return (
-                start_card_config,
-                start_card_layout,
+                *write_stores(
+                    session,
+                    {"config": start_card_config, "layouts": start_card_layout},
+                    previous={"config": config_store, "layouts": layout_store},
+                ),
                 [
                     dict(
                         title="Layout Reset",
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Hashable
+
+if TYPE_CHECKING:
+    from .card_manager import Card, CardManager
+
+
+@dataclass
+class RefreshJob:
+    """A card that is re-rendered in the background and its latest content."""
+
+    card: Card
+    content: Any
+    next_due: float
+    last_access: float
+
+
+class BackgroundRefresher:
+    """Re-renders interval cards in a background thread.
+
+    Every distinct card (card class, id, settings and global settings) is
+    rendered once per interval, no matter how many browsers show it. Callbacks
+    read the latest content with `get()` instead of rendering the card
+    themselves. Cards which are not read for `idle_timeout` seconds stop being
+    refreshed.
+    """
+
+    def __init__(self, card_manager: CardManager, idle_timeout: float = 60) -> None:
+        """Initialize the refresher.
+
+        Args:
+            card_manager: The card manager, used for the cache keys of the cards
+                and to render due cards (with its executor, if any).
+            idle_timeout: Seconds after the last read after which a card is no
+                longer refreshed.
+        """
+        self.card_manager = card_manager
+        self.idle_timeout = idle_timeout
+        self._jobs: dict[Hashable, RefreshJob] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def get(self, card: Card) -> Any:
+        """Return the latest content of a card.
+
+        The first call for a card renders it in the calling thread and schedules
+        it for background refreshes.
+        """
+        key = self.card_manager.cache_key(card)
+        now = time.monotonic()
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                job.last_access = now
+                return job.content
+        content = card.render_content()
+        with self._lock:
+            self._jobs[key] = RefreshJob(
+                card=card,
+                content=content,
+                next_due=now + card.interval / 1000,
+                last_access=now,
+            )
+            self._start()
+        self._wakeup.set()
+        return content
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="cardcanvas-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                wait = self.refresh()
+            except Exception:
+                logging.exception("Error refreshing cards in the background")
+                wait = 1.0
+            self._wakeup.wait(wait)
+
+    def refresh(self) -> float:
+        """Render all due cards and drop idle ones.
+
+        Returns:
+            float: The number of seconds until the next card is due.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key, job in list(self._jobs.items()):
+                if now - job.last_access > self.idle_timeout:
+                    del self._jobs[key]
+            due = {key: job for key, job in self._jobs.items() if job.next_due <= now}
+        if due:
+            contents = self.card_manager.render_contents(
+                [job.card for job in due.values()]
+            )
+            now = time.monotonic()
+            with self._lock:
+                for job, content in zip(due.values(), contents):
+                    job.content = content
+                    job.next_due = now + job.card.interval / 1000
+        with self._lock:
+            if not self._jobs:
+                return self.idle_timeout
+            return max(min(job.next_due for job in self._jobs.values()) - now, 0)
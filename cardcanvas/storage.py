@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any
+
+from dash.exceptions import PreventUpdate
+
+from . import codec
+from .cache import LRUCache
+
+
+class MissingStateError(PreventUpdate):
+    """Raised when a dashboard store references a state that no longer exists.
+
+    The state was pruned or evicted from the state store. Callbacks raising it
+    do not update their outputs, so the missing state is never overwritten.
+    """
+
+
+class StateStore(ABC):
+    """Keeps the state of dashboards on the server. This is an abstract class.
+
+    When a state store is configured, the browser only holds a reference
+    (`{"key": ..., "version": ...}`) to the card config, the card layouts and
+    the global settings, instead of sending them with every callback.
+
+    The following methods must be implemented in the child classes:
+    - load: Return the value stored under a key.
+    - save: Store a value under a key and return its new version.
+    - delete: Remove a key.
+    """
+
+    @abstractmethod
+    def load(self, key: str) -> Any:
+        """Return the value stored under `key`, or None if there is none."""
+
+    @abstractmethod
+    def save(self, key: str, value: Any) -> int:
+        """Store `value` under `key`.
+
+        Returns:
+            int: The new version of the value. Every save returns a higher
+                version than the one before for the same key.
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the value stored under `key`."""
+
+    def prune(self, max_age: float) -> int:
+        """Remove states which were not saved for `max_age` seconds.
+
+        Stores which expire their states by themselves do not need to override
+        this.
+
+        Returns:
+            int: The number of removed states.
+        """
+        return 0
+
+
+class MemoryStateStore(StateStore):
+    """Keeps the state in the memory of the server process.
+
+    This only works when the app is served by a single process. The least
+    recently used states are dropped once `maxsize` keys are stored.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float | None = None) -> None:
+        self._data = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def load(self, key: str) -> Any:
+        entry = self._data.get(key)
+        # Callbacks modify the values they load, the stored value must not change
+        return copy.deepcopy(entry[1]) if entry else None
+
+    def save(self, key: str, value: Any) -> int:
+        with self._lock:
+            entry = self._data.get(key)
+            version = entry[0] + 1 if entry else 1
+            self._data.set(key, (version, value))
+        return version
+
+    def delete(self, key: str) -> None:
+        self._data.delete(key)
+
+
+class SQLiteStateStore(StateStore):
+    """Keeps the state in a SQLite database, shared by all server processes."""
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        """Initialize the store.
+
+        Args:
+            path: The path of the database file. It is created if needed.
+        """
+        self.path = str(path)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cardcanvas_state ("
+                " key TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " value TEXT NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def load(self, key: str) -> Any:
+        row = (
+            self._connection()
+            .execute("SELECT value FROM cardcanvas_state WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return codec.loads(row[0]) if row else None
+
+    def save(self, key: str, value: Any) -> int:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO cardcanvas_state (key, version, value, updated)"
+                " VALUES (?, 1, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET version = version + 1,"
+                " value = excluded.value, updated = excluded.updated",
+                (key, codec.dumps(value), time.time()),
+            )
+            row = connection.execute(
+                "SELECT version FROM cardcanvas_state WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0]
+
+    def delete(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM cardcanvas_state WHERE key = ?", (key,))
+
+    def prune(self, max_age: float) -> int:
+        """Remove states which were not saved for `max_age` seconds.
+
+        Returns:
+            int: The number of removed states.
+        """
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "DELETE FROM cardcanvas_state WHERE updated < ?",
+                (time.time() - max_age,),
+            )
+        return cursor.rowcount
+
+
+class FileStateStore(StateStore):
+    """Keeps the state as JSON files in a directory, one file per key."""
+
+    def __init__(self, directory: str | os.PathLike) -> None:
+        """Initialize the store.
+
+        Args:
+            directory: The directory of the files. It is created if needed.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.directory / f"{name}.json"
+
+    def _read(self, key: str) -> dict[str, Any] | None:
+        try:
+            return codec.loads(self._path(key).read_bytes())
+        except FileNotFoundError:
+            return None
+
+    def load(self, key: str) -> Any:
+        entry = self._read(key)
+        return entry["value"] if entry else None
+
+    def save(self, key: str, value: Any) -> int:
+        with self._lock:
+            entry = self._read(key)
+            version = entry["version"] + 1 if entry else 1
+            # Write to a temporary file first so readers never see partial files
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(codec.dumps({"key": key, "version": version, "value": value}))
+            os.replace(tmp_path, self._path(key))
+        return version
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def prune(self, max_age: float) -> int:
+        """Remove states which were not saved for `max_age` seconds.
+
+        Returns:
+            int: The number of removed states.
+        """
+        count = 0
+        limit = time.time() - max_age
+        for path in self.directory.glob("*.json"):
+            if path.stat().st_mtime < limit:
+                path.unlink(missing_ok=True)
+                count += 1
+        return count
+
+
+class ServerState:
+    """Translates between the values of the dashboard stores and a state store.
+
+    Without a state store, the stores hold the values themselves and this
+    class does nothing. With a state store, the stores hold references and the
+    values are read from and written to the state store.
+    """
+
+    def __init__(
+        self,
+        store: StateStore | None = None,
+        max_age: float | None = None,
+        prune_interval: float = 3600,
+    ) -> None:
+        """Initialize the state.
+
+        Args:
+            store: The state store, or None to keep the state in the browser.
+            max_age: States which were not saved for this many seconds are
+                removed from the store. If None, states are never removed.
+            prune_interval: The minimum time between two prunes, in seconds.
+        """
+        self.store = store
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._last_prune: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    def read(self, value: Any) -> Any:
+        """Return the value of a dashboard store.
+
+        Raises:
+            MissingStateError: If the store references a state which is no
+                longer in the state store.
+        """
+        if self.store is None:
+            return value
+        if not isinstance(value, dict) or "key" not in value:
+            return None
+        result = self.store.load(value["key"])
+        if result is None:
+            raise MissingStateError(value["key"])
+        return result
+
+    def prune(self) -> int:
+        """Remove the expired states, at most once every `prune_interval`.
+
+        Every page load starts a new session, so without pruning the states
+        of closed pages are kept forever.
+
+        Returns:
+            int: The number of removed states.
+        """
+        if self.store is None or self.max_age is None:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._last_prune is not None
+                and now - self._last_prune < self.prune_interval
+            ):
+                return 0
+            self._last_prune = now
+        return self.store.prune(self.max_age)
+
+    def write(self, session: str | None, kind: str, value: Any) -> Any:
+        """Return what should be written to a dashboard store for `value`.
+
+        Args:
+            session: The key of the browser session.
+            kind: The name of the store, for eg: "config".
+            value: The new value of the store.
+        """
+        if self.store is None:
+            return value
+        key = f"{session}:{kind}"
+        return {"key": key, "version": self.store.save(key, value)}
+
+    def write_patch(
+        self, session: str | None, kind: str, value: Any, patch: Any = None
+    ) -> Any:
+        """Like `write()`, but without a state store the change is sent as a patch.
+
+        Args:
+            session: The key of the browser session.
+            kind: The name of the store, for eg: "config".
+            value: The new value of the store.
+            patch: A `dash.Patch` turning the current value of the store into
+                `value`. If None, the whole value is sent.
+        """
+        if self.store is None and patch is not None:
+            return patch
+        return self.write(session, kind, value)
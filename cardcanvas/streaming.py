@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Iterator
+from uuid import uuid4
+
+from flask import Flask, Response, stream_with_context
+from plotly.io.json import to_json_plotly
+
+if TYPE_CHECKING:
+    from .card_manager import Card, CardManager
+    from .refresh import BackgroundRefresher
+
+
+@dataclass
+class Subscription:
+    """The cards a browser receives updates for over one stream."""
+
+    cards: dict[str, Card]
+    created: float = field(default_factory=time.monotonic)
+    connected: bool = False
+
+
+class StreamHub:
+    """Pushes the content of live cards to the browser with server-sent events.
+
+    Cards with `stream = True` are re-rendered on the server every `interval`
+    milliseconds. Their content is only sent to the browser when it differs from
+    the content sent before, so unchanged cards cost no request at all.
+
+    Each open stream holds a server thread, so the server should be run with
+    enough threads (or an async worker) for the expected number of viewers.
+    """
+
+    url_path = "_cardcanvas/stream/"
+
+    def __init__(
+        self,
+        card_manager: CardManager,
+        heartbeat: float = 15,
+        connect_timeout: float = 60,
+        refresher: BackgroundRefresher | None = None,
+    ) -> None:
+        """Initialize the hub.
+
+        Args:
+            card_manager: The card manager used to create the cards.
+            heartbeat: Seconds between keep-alive messages, which is also how
+                long it takes to notice a closed connection.
+            connect_timeout: Seconds after which a subscription that was never
+                connected to is dropped.
+            refresher: If given, the content of the cards is read from this
+                background refresher instead of rendering it for every stream.
+        """
+        self.card_manager = card_manager
+        self.heartbeat = heartbeat
+        self.connect_timeout = connect_timeout
+        self.refresher = refresher
+        self._subscriptions: dict[str, Subscription] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, server: Flask, routes_pathname_prefix: str = "/") -> None:
+        """Register the stream endpoint on the flask server."""
+        server.add_url_rule(
+            f"{routes_pathname_prefix}{self.url_path}<token>",
+            "cardcanvas_stream",
+            self._response,
+        )
+
+    def subscribe(
+        self,
+        card_config: dict[str, dict[str, Any]],
+        global_settings: dict[str, str] | None = None,
+    ) -> str | None:
+        """Create a subscription for the streamed cards of a dashboard.
+
+        Returns:
+            str | None: The token of the subscription, or None if no card on the
+                dashboard streams its content.
+        """
+        cards = {
+            card_id: card
+            for card_id, card in self.card_manager.card_objects(
+                card_config, global_settings
+            ).items()
+            if card.stream and card.interval
+        }
+        if not cards:
+            return None
+        token = uuid4().hex
+        with self._lock:
+            self._drop_stale()
+            self._subscriptions[token] = Subscription(cards)
+        return token
+
+    def unsubscribe(self, token: str) -> None:
+        with self._lock:
+            self._subscriptions.pop(token, None)
+
+    def _drop_stale(self) -> None:
+        now = time.monotonic()
+        for token, subscription in list(self._subscriptions.items()):
+            if (
+                not subscription.connected
+                and now - subscription.created > self.connect_timeout
+            ):
+                del self._subscriptions[token]
+
+    def _response(self, token: str) -> Response:
+        with self._lock:
+            subscription = self._subscriptions.get(token)
+            if subscription is None or subscription.connected:
+                return Response(status=404)
+            subscription.connected = True
+        return Response(
+            stream_with_context(self.stream(token, subscription)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    def stream(self, token: str, subscription: Subscription) -> Iterator[str]:
+        """Yield server-sent events with the content of the cards that changed.
+
+        The first render of each card is only used as a reference, since the
+        browser already shows the content rendered when the grid was loaded.
+        """
+        hashes: dict[str, str] = {}
+        next_due = dict.fromkeys(subscription.cards, 0.0)
+        last_message = time.monotonic()
+        try:
+            while token in self._subscriptions:
+                for card_id, card in subscription.cards.items():
+                    now = time.monotonic()
+                    if now < next_due[card_id]:
+                        continue
+                    next_due[card_id] = now + card.interval / 1000
+                    content = to_json_plotly(self.render(card))
+                    content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()
+                    previous_hash = hashes.get(card_id)
+                    hashes[card_id] = content_hash
+                    if previous_hash is None or previous_hash == content_hash:
+                        continue
+                    last_message = time.monotonic()
+                    # The content is already serialized, so the message is built
+                    # around it instead of encoding it a second time.
+                    yield f'data: {{"id": {json.dumps(card_id)}, "content": {content}}}\n\n'
+                now = time.monotonic()
+                if now - last_message >= self.heartbeat:
+                    last_message = now
+                    yield ": keep-alive\n\n"
+                wait = min(next_due.values()) - time.monotonic()
+                time.sleep(min(max(wait, 0), self.heartbeat))
+        finally:
+            self.unsubscribe(token)
+
+    def render(self, card: Card) -> Any:
+        """Render the content of a streamed card."""
+        if self.refresher is not None:
+            return self.refresher.get(card)
+        return card.render_content()
@@ -55,6 +55,26 @@ def main_buttons(global_settings: bool = False):
                 tooltip="Add new cards to the layout",
                 **button_settings,
             ),
+            dmc.ActionIconGroup(
+                children=[
+                    icon_with_tooltip(
+                        id="undo",
+                        icon="mdi:undo",
+                        title="Undo",
+                        tooltip="Undo the last change.",
+                        disabled=True,
+                        **button_settings,
+                    ),
+                    icon_with_tooltip(
+                        id="redo",
+                        icon="mdi:redo",
+                        title="Redo",
+                        tooltip="Redo the last undone change.",
+                        disabled=True,
+                        **button_settings,
+                    ),
+                ]
+            ),
             dmc.ActionIconGroup(
                 children=[
                     dcc.Upload(
@@ -117,6 +137,28 @@ def main_buttons(global_settings: bool = False):
                 ),
                 label="Toggle edit mode to modify, remove or move cards",
             ),
+            # Only displayed in edit mode, when the cards can be selected
+            dmc.ActionIconGroup(
+                id="selection-actions",
+                children=[
+                    icon_with_tooltip(
+                        id="duplicate-selected",
+                        icon="mdi:content-copy",
+                        title="Duplicate Selected",
+                        tooltip="Duplicate the selected cards.",
+                        **button_settings,
+                    ),
+                    icon_with_tooltip(
+                        id="delete-selected",
+                        icon="mdi:trash-can-outline",
+                        title="Delete Selected",
+                        tooltip="Delete the selected cards.",
+                        color="red",
+                        **button_settings,
+                    ),
+                ],
+                style={"display": "none"},
+            ),
             dmc.Switch(
                 id="color-scheme-toggle",
                 offLabel=DashIconify(icon="radix-icons:moon", width=20),
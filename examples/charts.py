@@ -1,6 +1,11 @@
 from pathlib import Path
 import json
-from cardcanvas import CardCanvas, Card
+from cardcanvas import CardCanvas, Card, ColumnInfo, DataFrameSource
+from cardcanvas.figures import (
+    density_heatmap_figure,
+    histogram_figure,
+    relayout_x_range,
+)
 from dash import (
     html,
     dcc,
@@ -22,6 +27,9 @@ from dash_iconify import DashIconify
 
 from data import nea_data as data
 
+# The statistics of the columns used by the settings forms are computed once here
+data_source = DataFrameSource(data)
+
 settings = {
     "title": "The National Endowment for the Arts Creative Writing Fellowships",
     "subtitle": "Writers sponsored by NEA fellowships from the organization’s founding in 1965 to 2024",
@@ -43,16 +51,17 @@ class HistogramCard(Card):
     def render(self):
         column = self.settings.get("column", None)
         color = self.settings.get("color", None)
-        nbins = self.settings.get("bins", 20)
+        # A cleared NumberInput gives None or ""
+        nbins = int(self.settings.get("bins") or 20)
         title = self.settings.get("title", "Histogram")
         description = self.settings.get("description", f"Histogram of {column}")
 
-        figure = px.histogram(
-            data,
-            x=column,
-            color=color,
-            nbins=nbins,
+        # The bins are computed on the server, only the counts are sent
+        figure = histogram_figure(
+            self.data.histogram(column, nbins, color=color) if column else {},
             template="mantine_light",
+            xaxis_title=column,
+            legend_title=color,
         )
         figure.update_layout(margin=dict(l=0, r=0, t=15, b=0))
         return dmc.Card(
@@ -98,7 +107,8 @@ class HistogramCard(Card):
                     # numeric columns in data
                     data=[
                         {"label": column, "value": column}
-                        for column in data.select_dtypes(include="number").columns
+                        for column in data_source.columns
+                        if data_source.column_info[column].numeric
                     ],
                 ),
                 dmc.Select(
@@ -112,7 +122,8 @@ class HistogramCard(Card):
                     searchable=True,
                     data=[
                         {"label": i, "value": i}
-                        for i in data.select_dtypes(exclude="number").columns
+                        for i in data_source.columns
+                        if not data_source.column_info[i].numeric
                     ],
                 ),
                 dmc.NumberInput(
@@ -143,20 +154,18 @@ class HistogramCard(Card):
         )
 
 
-def generate_filter(column: pd.Series, input_id, default_value=None):
+def generate_filter(column: ColumnInfo, input_id, default_value=None):
     """Creating a filter based on the column type and it's unique values
     Used in heatmap card to filter the data based on the column values
     """
-    column = column.dropna()
     card_id = input_id["id"]
     filter_type = input_id["setting"]
-    if column.unique().shape[0] == 0:
+    if column.cardinality == 0:
         return dmc.Text("No data to filter", fz="14px", fw=600, c="red")
-    elif column.unique().shape[0] == 1:
+    elif column.cardinality == 1:
         return dmc.Text("Only one value, no need to filter", fz="14px", fw=600)
-    if column.dtype in ["object", "string", "bool", "category"] or len(column.unique()) < 5:
-        sorted_unique = sorted(column.unique().tolist())
-        if len(sorted_unique) > 100:
+    if column.categorical or column.cardinality < 5:
+        if column.values is None or len(column.values) > 100:
             return dmc.Text(
                 "Too many unique values to show filter", fz="14px", fw=600, c="red"
             )
@@ -169,9 +178,9 @@ def generate_filter(column: pd.Series, input_id, default_value=None):
                         "id": card_id,
                         "setting": f"{filter_type}-filter",
                     },
-                    value=default_value or sorted_unique,
+                    value=default_value or column.values,
                     children=dmc.Stack(
-                        [dmc.Checkbox(label=str(x), value=str(x)) for x in sorted_unique]
+                        [dmc.Checkbox(label=str(x), value=str(x)) for x in column.values]
                     ),
                 ),
                 style={"maxHeight": "250px", "overflowY": "auto"},
@@ -185,10 +194,10 @@ def generate_filter(column: pd.Series, input_id, default_value=None):
                 "id": card_id,
                 "setting": f"{filter_type}-filter",
             },
-            value=default_value or [column.min(), column.max()],
-            min=column.min(),
-            max=column.max(),
-            minRange=(column.max() - column.min()) / 100,
+            value=default_value or [column.min, column.max],
+            min=column.min,
+            max=column.max,
+            minRange=(column.max - column.min) / 100,
         ),
     ]
 
@@ -204,35 +213,20 @@ class HeatMap(Card):
         x_filter = self.settings.get("x-filter", None)
         y = self.settings.get("y", None)
         y_filter = self.settings.get("y-filter", None)
-        nbinsx = self.settings.get("nbinsx", 20)
-        nbinsy = self.settings.get("nbinsy", 20)
+        nbinsx = int(self.settings.get("nbinsx") or 20)
+        nbinsy = int(self.settings.get("nbinsy") or 20)
         title = self.settings.get("title", "Heatmap")
         description = self.settings.get("description", f"Heatmap of {x} vs {y}")
 
-        filtered_data = data.loc[:, [x, y]]
-        if x_filter is not None:
-            if filtered_data[x].dtype in ["object", "string", "bool", "category"]:
-                filtered_data = filtered_data[filtered_data[x].isin(x_filter)]
-            else:
-                filtered_data = filtered_data[
-                    (filtered_data[x] >= x_filter[0])
-                    & (filtered_data[x] <= x_filter[1])
-                ]
-        if y_filter is not None:
-            if filtered_data[y].dtype in ["object", "string", "bool", "category"]:
-                filtered_data = filtered_data[filtered_data[y].isin(y_filter)]
-            else:
-                filtered_data = filtered_data[
-                    (filtered_data[y] >= y_filter[0])
-                    & (filtered_data[y] <= y_filter[1])
-                ]
-        figure = px.density_heatmap(
-            filtered_data,
-            x=x,
-            y=y,
-            nbinsx=nbinsx,
-            nbinsy=nbinsy,
+        if not x or not y:
+            return dmc.Text("Select the x and y columns in the settings")
+        figure = density_heatmap_figure(
+            self.data.histogram2d(
+                x, y, nbinsx, nbinsy, filters=[[x, x_filter], [y, y_filter]]
+            ),
             template="mantine_light",
+            xaxis_title=x,
+            yaxis_title=y,
         )
         figure.update_layout(margin=dict(l=0, r=0, t=15, b=0))
         return dmc.Card(
@@ -271,14 +265,14 @@ class HeatMap(Card):
         x_filter_children = None
         if x is not None:
             x_filter_children = generate_filter(
-                data[x],
+                self.data.column_info[x],
                 {"type": "card-settings", "id": self.id, "setting": "x"},
                 default_value=x_filter,
             )
         y_filter_children = None
         if y is not None:
             y_filter_children = generate_filter(
-                data[y],
+                self.data.column_info[y],
                 {"type": "card-settings", "id": self.id, "setting": "y"},
                 default_value=y_filter,
             )
@@ -296,7 +290,7 @@ class HeatMap(Card):
                     searchable=True,
                     # numeric columns in data
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 html.Div(
@@ -316,7 +310,7 @@ class HeatMap(Card):
                     label="Y",
                     value=y,
                     searchable=True,
-                    data=[{"label": i, "value": i} for i in data.columns],
+                    data=[{"label": i, "value": i} for i in data_source.columns],
                 ),
                 html.Div(
                     id={
@@ -374,7 +368,7 @@ class HeatMap(Card):
         else if data is numeric, show a slider to filter the data"""
         if value is None:
             return no_update
-        column = data[value]
+        column = data_source.column_info[value]
         # get the input id
         ctx = callback_context
         if not ctx.triggered_id:
@@ -391,7 +385,7 @@ class HeatMap(Card):
     def update_filter_y(value):
         if value is None:
             return no_update
-        column = data[value]
+        column = data_source.column_info[value]
         ctx = callback_context
         if not ctx.triggered_id:
             return no_update
@@ -411,7 +405,7 @@ class ViolinCard(Card):
         title = self.settings.get("title", "Violin plot")
         description = self.settings.get("description", f"Violin plot of {y} by {x}")
         fig = px.violin(
-            data,
+            self.data.frame,
             x=x,
             y=y,
             template="mantine_light",
@@ -419,7 +413,7 @@ class ViolinCard(Card):
         fig.update_layout(margin=dict(l=0, r=0, t=15, b=0))
         fig.update_xaxes(
             categoryorder="array",
-            categoryarray=data[x].unique(),
+            categoryarray=self.data.frame[x].unique(),
         )
         return dmc.Card(
             [
@@ -464,7 +458,7 @@ class ViolinCard(Card):
                     value=x,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 dmc.Select(
@@ -479,7 +473,8 @@ class ViolinCard(Card):
                     # numeric columns in data
                     data=[
                         {"label": column, "value": column}
-                        for column in data.select_dtypes(include="number").columns
+                        for column in data_source.columns
+                        if data_source.column_info[column].numeric
                     ],
                 ),
                 dmc.TextInput(
@@ -517,35 +512,17 @@ class BarChartCard(Card):
         title = self.settings.get("title", "Bar Chart")
         description = self.settings.get("description", f"Bar chart of {y} by {x}")
 
-        # apply filters
-        filtered_data = data
-        if x_filter is not None:
-            if filtered_data[x].dtype in ["object", "string", "bool", "category"]:
-                filtered_data = filtered_data[filtered_data[x].isin(x_filter)]
-            else:
-                filtered_data = filtered_data[
-                    (filtered_data[x] >= x_filter[0])
-                    & (filtered_data[x] <= x_filter[1])
-                ]
-        if y_filter is not None:
-            if filtered_data[y].dtype in ["object", "string", "bool", "category"]:
-                filtered_data = filtered_data[filtered_data[y].isin(y_filter)]
-            else:
-                filtered_data = filtered_data[
-                    (filtered_data[y] >= y_filter[0])
-                    & (filtered_data[y] <= y_filter[1])
-                ]
+        # Both filters apply when x and y are the same column
+        filters = [[x, x_filter], [y, y_filter]]
         if color is None:
             if x and y:
-                grouped_data = (
-                    filtered_data.groupby(x)[y].agg(aggregation).reset_index()
-                )
+                grouped_data = self.data.groupby(x, y, aggregation, filters=filters)
             else:
                 grouped_data = pd.DataFrame()
         else:
             if x and color and y:
-                grouped_data = (
-                    filtered_data.groupby([x, color])[y].agg(aggregation).reset_index()
+                grouped_data = self.data.groupby(
+                    [x, color], y, aggregation, filters=filters
                 )
             else:
                 grouped_data = pd.DataFrame()
@@ -600,7 +577,7 @@ class BarChartCard(Card):
         x_filter_children = None
         if x is not None:
             x_filter_children = generate_filter(
-                data[x],
+                self.data.column_info[x],
                 {"type": "card-settings", "id": self.id, "setting": "x"},
                 default_value=x_filter,
             )
@@ -608,7 +585,7 @@ class BarChartCard(Card):
         y_filter_children = None
         if y is not None:
             y_filter_children = generate_filter(
-                data[y],
+                self.data.column_info[y],
                 {"type": "card-settings", "id": self.id, "setting": "y"},
                 default_value=y_filter,
             )
@@ -624,7 +601,7 @@ class BarChartCard(Card):
                     value=x,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 html.Div(
@@ -645,7 +622,7 @@ class BarChartCard(Card):
                     value=y,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 html.Div(
@@ -682,7 +659,7 @@ class BarChartCard(Card):
                     value=color,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 dmc.Select(
@@ -729,26 +706,15 @@ class TopNBarChartCard(Card):
         title = self.settings.get("title", "Top N Bar Chart")
         description = self.settings.get("description", f"Top {n} entries of {column}")
 
-        filtered_data = data
-        if column_filter is not None:
-            if filtered_data[column].dtype in ["object", "string", "bool", "category"]:
-                filtered_data = filtered_data[filtered_data[column].isin(column_filter)]
-            else:
-                column_filter = [float(x) for x in column_filter]
-                filtered_data = filtered_data[
-                    (filtered_data[column] >= column_filter[0])
-                    & (filtered_data[column] <= column_filter[1])
-                ]
-
-        top_n = filtered_data[column].value_counts().head(n).reset_index()
-        top_n.columns = [column, "count"]
+        top_n = self.data.value_counts(column, n=n, filters={column: column_filter})
         fig = px.bar(
             top_n,
             x=column,
             y="count",
             template="mantine_light",
         )
-        fig.update_layout(margin=dict(l=0, r=0, t=15, b=0))
+        # The zoom is kept when render_relayout() replaces the points
+        fig.update_layout(margin=dict(l=0, r=0, t=15, b=0), uirevision=self.id)
         return dmc.Card(
             [
                 dmc.Text(
@@ -785,7 +751,7 @@ class TopNBarChartCard(Card):
         filter_children = None
         if column is not None:
             filter_children = generate_filter(
-                data[column],
+                self.data.column_info[column],
                 {"type": "card-settings", "id": self.id, "setting": "column"},
                 default_value=column_filter,
             )
@@ -802,7 +768,7 @@ class TopNBarChartCard(Card):
                     value=column,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 html.Div(
@@ -841,6 +807,127 @@ class TopNBarChartCard(Card):
         )
 
 
+class LineChartCard(Card):
+    title = "Line Chart"
+    description = "Show a numeric column against another, downsampled on the server"
+    icon = "mdi:chart-line"
+    grid_settings = {"w": 4, "h": 2, "minW": 4, "minH": 2}
+    points_per_column = 250
+
+    def series(self, x_range=None):
+        # At most a few points per pixel are sent, whatever the size of the data
+        return self.data.series(
+            self.settings["x"],
+            self.settings["y"],
+            self.max_points(),
+            method=self.settings.get("method", "lttb"),
+            x_range=x_range,
+        )
+
+    def render(self):
+        x = self.settings.get("x", None)
+        y = self.settings.get("y", None)
+        title = self.settings.get("title", "Line Chart")
+        description = self.settings.get("description", f"{y} by {x}")
+
+        fig = px.line(
+            self.series() if x and y else None,
+            x=x,
+            y=y,
+            template="mantine_light",
+        )
+        fig.update_layout(margin=dict(l=0, r=0, t=15, b=0))
+        return dmc.Card(
+            [
+                dmc.Text(
+                    title,
+                    fz="30px",
+                    fw=600,
+                    c="blue",
+                ),
+                dmc.Text(
+                    description,
+                    fw=600,
+                    c="dimmed",
+                ),
+                dcc.Graph(
+                    figure=fig,
+                    id=self.figure_id,
+                    className="no-drag",
+                    responsive=True,
+                    style={"height": "100%"},
+                ),
+            ],
+            style={"height": "100%"},
+            withBorder=True,
+            shadow="xs",
+        )
+
+    def render_relayout(self, relayout_data):
+        x_range = relayout_x_range(relayout_data)
+        if x_range is False or not self.settings.get("x") or not self.settings.get("y"):
+            return None
+        # Only the points of the line change, the layout (and its uirevision)
+        # is left alone so the zoom is kept
+        series = self.series(x_range)
+        patched_figure = Patch()
+        patched_figure["data"][0]["x"] = series[self.settings["x"]].tolist()
+        patched_figure["data"][0]["y"] = series[self.settings["y"]].tolist()
+        return patched_figure
+
+    def render_settings(self):
+        x = self.settings.get("x", None)
+        y = self.settings.get("y", None)
+        method = self.settings.get("method", "lttb")
+        title = self.settings.get("title", "Line Chart")
+        description = self.settings.get("description", "Line Chart description")
+        numeric_columns = [
+            {"label": column, "value": column}
+            for column in data_source.columns
+            if data_source.column_info[column].numeric
+        ]
+        return dmc.Stack(
+            [
+                dmc.Select(
+                    id={"type": "card-settings", "id": self.id, "setting": "x"},
+                    label="X",
+                    value=x,
+                    searchable=True,
+                    data=numeric_columns,
+                ),
+                dmc.Select(
+                    id={"type": "card-settings", "id": self.id, "setting": "y"},
+                    label="Y",
+                    value=y,
+                    searchable=True,
+                    data=numeric_columns,
+                ),
+                dmc.SegmentedControl(
+                    id={"type": "card-settings", "id": self.id, "setting": "method"},
+                    value=method,
+                    data=[
+                        {"label": "Keep the shape", "value": "lttb"},
+                        {"label": "Keep the peaks", "value": "minmax"},
+                    ],
+                ),
+                dmc.TextInput(
+                    id={"type": "card-settings", "id": self.id, "setting": "title"},
+                    label="Title",
+                    value=title,
+                ),
+                dmc.TextInput(
+                    id={
+                        "type": "card-settings",
+                        "id": self.id,
+                        "setting": "description",
+                    },
+                    label="Description",
+                    value=description,
+                ),
+            ]
+        )
+
+
 class HightlightCard(Card):
     title = "Highlight"
     description = "This card shows a highlight of a given dataset"
@@ -850,16 +937,7 @@ class HightlightCard(Card):
         column = self.settings.get("column", None)
         aggregation = self.settings.get("aggregation", "count")
         filter_value = self.settings.get("column-filter", None)
-        filtered_data = data
-        if filter_value is not None:
-            if filtered_data[column].dtype in ["object", "string", "bool", "category"]:
-                filtered_data = filtered_data[filtered_data[column].isin(filter_value)]
-            else:
-                filter_value = [float(x) for x in filter_value]
-                filtered_data = filtered_data[
-                    (filtered_data[column] >= filter_value[0])
-                    & (filtered_data[column] <= filter_value[1])
-                ]
+        filtered_data = self.data.filter({column: filter_value})
         highlight_value = filtered_data[column].agg(aggregation)
         if isinstance(highlight_value, float):
             highlight_value = round(highlight_value, 2)
@@ -909,7 +987,7 @@ class HightlightCard(Card):
         filter_children = None
         if column is not None:
             filter_children = generate_filter(
-                data[column],
+                self.data.column_info[column],
                 {"type": "card-settings", "id": self.id, "setting": "column"},
                 default_value=column_filter,
             )
@@ -925,7 +1003,7 @@ class HightlightCard(Card):
                     value=column,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 html.Div(
@@ -990,7 +1068,7 @@ class HightlightCard(Card):
         else if data is numeric, show a slider to filter the data"""
         if value is None:
             return no_update
-        column = data[value]
+        column = data_source.column_info[value]
         # get the input id
         ctx = callback_context
         if not ctx.triggered_id:
@@ -1050,9 +1128,7 @@ class MapCard(Card):
         )
 
         if location and value:
-            aggregated_data = (
-                data.groupby(location)[value].agg(aggregation).reset_index()
-            )
+            aggregated_data = self.data.groupby(location, value, aggregation)
         else:
             aggregated_data = pd.DataFrame()
 
@@ -1126,7 +1202,7 @@ class MapCard(Card):
                     value=location,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 dmc.Select(
@@ -1139,7 +1215,7 @@ class MapCard(Card):
                     value=value,
                     searchable=True,
                     data=[
-                        {"label": column, "value": column} for column in data.columns
+                        {"label": column, "value": column} for column in data_source.columns
                     ],
                 ),
                 dmc.Select(
@@ -1196,6 +1272,8 @@ def update_color_scheme(color_scheme, figure_ids):
 
 
 canvas = CardCanvas(settings)
+# The cards query the data through canvas.card_manager, which caches the results
+canvas.card_manager.register_data_source(data_source)
 canvas.card_manager.register_card_class(HistogramCard)
 canvas.card_manager.register_card_class(HeatMap)
 canvas.card_manager.register_card_class(ViolinCard)
@@ -1203,6 +1281,7 @@ canvas.card_manager.register_card_class(HightlightCard)
 canvas.card_manager.register_card_class(BarChartCard)
 canvas.card_manager.register_card_class(MarkdownCard)
 canvas.card_manager.register_card_class(TopNBarChartCard)
+canvas.card_manager.register_card_class(LineChartCard)
 canvas.card_manager.register_card_class(MapCard)
 server = canvas.app.server
 
@@ -1,6 +1,9 @@
-import pandas as pd
+from cardcanvas import load_frame
 
-nea_data = pd.read_csv(
+# The CSV is downloaded and parsed once, then cached as an Arrow file which
+# every server process (for eg: gunicorn workers) memory-maps, sharing the same
+# memory instead of holding a copy each.
+nea_data = load_frame(
     "https://raw.githubusercontent.com/plotly/Figure-Friday/refs/heads/main/2025/week-4/Post45_NEAData_Final.csv"
 )
 nea_data["Age"] = nea_data["nea_grant_year"] - nea_data["birth_year"]
@@ -0,0 +1,590 @@
+import base64
+
+import pytest
+from dash import Patch, dcc
+
+from cardcanvas import Card, CardCanvas, DataFrameSource, MemoryStateStore, codec
+from cardcanvas.figures import relayout_x_range
+from cardcanvas.storage import ServerState
+
+from .utils import NO_UPDATE, patch_value, run_callback
+
+
+class TextCard(Card):
+    def render(self):
+        return self.settings.get("text", "Hello")
+
+    def render_settings(self):
+        return None
+
+
+class ClockCard(TextCard):
+    interval = 1000
+
+
+class ColorCard(TextCard):
+    def render(self):
+        return f"{self.settings.get('text')} in {self.global_settings.get('color')}"
+
+
+START_CONFIG = {
+    "card_config": {
+        "a": {"card_class": "TextCard", "settings": {"text": "A"}},
+        "b": {"card_class": "TextCard", "settings": {"text": "B"}},
+    },
+    "card_layouts": {
+        "lg": [
+            {"i": "a", "x": 0, "y": 0, "w": 4, "h": 4},
+            {"i": "b", "x": 4, "y": 0, "w": 4, "h": 4},
+        ]
+    },
+}
+
+
+class Browser:
+    """Holds the stores of a page, and runs callbacks with them."""
+
+    def __init__(self, server_state=False, **settings):
+        if server_state:
+            settings["state_store"] = MemoryStateStore()
+        self.state = ServerState(settings.get("state_store"))
+        self.canvas = CardCanvas(
+            {"title": "Test", "start_config": START_CONFIG, **settings}
+        )
+        self.canvas.card_manager.register_card_class(TextCard)
+        self.canvas.card_manager.register_card_class(ClockCard)
+        self.canvas.card_manager.register_card_class(ColorCard)
+        self.app = self.canvas.app
+        self.stores = {"main": None}
+        config, layouts, global_settings, session = self.run(
+            "load_layout", [None, None], self.values("main")
+        )
+        self.stores.update(
+            config=config, layouts=layouts, global_=global_settings, session=session
+        )
+
+    def run(self, name, inputs, state=(), **kwargs):
+        return run_callback(self.app, name, inputs, state, **kwargs)
+
+    def values(self, *stores):
+        return [self.stores[store] for store in stores]
+
+    def update(self, **updates):
+        for store, update in updates.items():
+            self.stores[store] = patch_value(self.stores[store], update)
+
+    def read(self, store):
+        return self.state.read(self.stores[store])
+
+    def load_cards(self, rendered=None, loaded=None):
+        """Run `load_cards`, `loaded` holds the hashes set by `load_card_content`."""
+        hash_ids = [{"type": "card-hash", "index": i} for i in loaded or {}]
+        return self.run(
+            "load_cards",
+            self.values("config", "layouts", "global_"),
+            [
+                rendered,
+                [(i, i) for i in hash_ids],
+                list(zip(hash_ids, (loaded or {}).values())),
+            ],
+        )
+
+    def delete(self, card_id):
+        config, layouts = self.run(
+            "delete_card",
+            [[({"type": "card-delete", "index": card_id}, 1)]],
+            self.values("config", "layouts", "session"),
+        )
+        self.update(config=config, layouts=layouts)
+        return config, layouts
+
+
+@pytest.fixture(params=[False, True], ids=["client", "server"])
+def browser(request):
+    return Browser(server_state=request.param)
+
+
+def test_history_is_recorded_on_the_server(browser):
+    # Loading a page does not start a history, its first change does
+    [session] = browser.values("session")
+    assert browser.canvas.histories.get(session) is None
+    browser.delete("b")
+    assert browser.canvas.histories.get(session).current.keys() == {
+        "config",
+        "layouts",
+    }
+    # Only the time of the change is sent to update the buttons
+    undo_disabled, redo_disabled = browser.run(
+        "update_history_buttons", [1, 1, 1], browser.values("session")
+    )
+    assert (undo_disabled, redo_disabled) == (False, True)
+
+    config, layouts, _ = browser.run("undo_redo", [1, None], browser.values("session"))
+    browser.update(config=config, layouts=layouts)
+    assert browser.read("config") == START_CONFIG["card_config"]
+    assert browser.read("layouts") == START_CONFIG["card_layouts"]
+    assert browser.run(
+        "update_history_buttons", [2, 2, 2], browser.values("session")
+    ) == [True, False]
+
+
+def test_update_cards_schedule(browser, monkeypatch):
+    config, layouts = browser.run(
+        "add_new_card",
+        [{"i": "ClockCard", "x": 0, "y": 8, "w": 4, "h": 2}],
+        browser.values("config", "layouts", "session"),
+    )
+    browser.update(config=config, layouts=layouts)
+    clock_id = next(
+        card_id
+        for card_id, card in browser.read("config").items()
+        if card["card_class"] == "ClockCard"
+    )
+    card_ids = ["a", "b", clock_id]
+    outputs = {0: [{"type": "card-content", "index": i} for i in card_ids]}
+
+    def tick(schedule, tick=1000):
+        return browser.run(
+            "update_cards",
+            [1],
+            [
+                tick,
+                *browser.values("config", "global_"),
+                schedule,
+                browser.stores["session"],
+            ],
+            outputs=outputs,
+        )
+
+    # Without a schedule, the card is assumed to be rendered a tick ago
+    contents, schedule = tick(None)
+    assert contents[:2] == [NO_UPDATE, NO_UPDATE]
+    assert contents[2] is not NO_UPDATE
+    assert list(schedule) == [clock_id]
+    # Only the cards which are due are created
+    manager = browser.canvas.card_manager
+    created = []
+    card_object = manager.card_object
+
+    def counting_card_object(card_id, *args, **kwargs):
+        created.append(card_id)
+        return card_object(card_id, *args, **kwargs)
+
+    monkeypatch.setattr(manager, "card_object", counting_card_object)
+    # It is not due again until its interval elapsed, whatever the tick
+    contents, _ = tick(schedule, tick=250)
+    assert contents[2] is NO_UPDATE
+    assert created == []
+    contents, _ = tick({clock_id: schedule[clock_id] - 1000}, tick=250)
+    assert contents[2] is not NO_UPDATE
+    assert created == [clock_id]
+
+
+def test_missing_server_state_is_reloaded():
+    browser = Browser(server_state=True)
+    store = browser.canvas.settings["state_store"]
+    store.delete(browser.stores["config"]["key"])
+    # A change does not overwrite the missing state with only the new card
+    assert browser.run(
+        "add_new_card",
+        [{"i": "TextCard", "x": 0, "y": 8, "w": 4, "h": 2}],
+        browser.values("config", "layouts", "session"),
+    ) == [NO_UPDATE, NO_UPDATE]
+    *_, reload = browser.load_cards()
+    assert reload is not NO_UPDATE
+    # The saved layout is loaded again, in a new session
+    config, layouts, _, session = browser.run(
+        "load_layout", [None, reload], browser.values("main"), triggered=1
+    )
+    assert session != browser.stores["session"]
+    assert browser.state.read(config) == START_CONFIG["card_config"]
+    assert browser.state.read(layouts) == START_CONFIG["card_layouts"]
+
+
+def operations(update):
+    return [(op["operation"], op["location"]) for op in update["operations"]]
+
+
+def test_card_changes_are_patched(browser):
+    server_state = browser.state.enabled
+
+    def change(name, inputs, state):
+        config, layouts = browser.run(name, inputs, state)
+        if server_state:
+            # The stores only hold a reference to the new version
+            assert config["key"].endswith(":config")
+            assert layouts["key"].endswith(":layouts")
+        browser.update(config=config, layouts=layouts)
+        return config, layouts
+
+    config, layouts = change(
+        "add_new_card",
+        [{"i": "TextCard", "x": 0, "y": 8, "w": 4, "h": 2}],
+        browser.values("config", "layouts", "session"),
+    )
+    new_id = next(iter(browser.read("config").keys() - {"a", "b"}))
+    if not server_state:
+        assert operations(config) == [("Assign", [new_id])]
+        assert operations(layouts) == [("Append", ["lg"])]
+
+    grid_layout = browser.read("layouts")["lg"]
+    config, layouts = change(
+        "duplicate_card",
+        [[({"type": "card-duplicate", "index": "a"}, 1)]],
+        [*browser.values("config", "layouts"), grid_layout, browser.stores["session"]],
+    )
+    copy_id = next(iter(browser.read("config").keys() - {"a", "b", new_id}))
+    if not server_state:
+        assert operations(config) == [("Assign", [copy_id])]
+        assert operations(layouts) == [("Append", ["lg"])]
+    assert browser.read("config")[copy_id] == START_CONFIG["card_config"]["a"]
+
+    config, layouts = change(
+        "delete_card",
+        [[({"type": "card-delete", "index": "b"}, 1)]],
+        browser.values("config", "layouts", "session"),
+    )
+    if not server_state:
+        assert operations(config) == [("Delete", ["b"])]
+        assert operations(layouts) == [("Delete", ["lg", 1])]
+
+    setting_id = {"type": "card-settings", "id": "a", "setting": "text"}
+    config, opened = browser.run(
+        "save_card_settings",
+        [1],
+        [
+            [(setting_id, setting_id)],
+            [(setting_id, "Changed")],
+            [(setting_id, None)],
+            *browser.values("config", "session"),
+        ],
+    )
+    assert opened is False
+    if not server_state:
+        assert operations(config) == [("Assign", ["a", "settings", "text"])]
+    browser.update(config=config)
+
+    assert browser.read("config") == {
+        "a": {"card_class": "TextCard", "settings": {"text": "Changed"}},
+        new_id: {"card_class": "TextCard", "settings": {}},
+        copy_id: START_CONFIG["card_config"]["a"],
+    }
+    assert [item["i"] for item in browser.read("layouts")["lg"]] == [
+        "a",
+        new_id,
+        copy_id,
+    ]
+
+
+def find_component(tree, component_id):
+    """Return the JSON of the component with `component_id` in a layout."""
+    if isinstance(tree, list):
+        children = tree
+    elif isinstance(tree, dict) and "props" in tree:
+        if tree["props"].get("id") == component_id:
+            return tree
+        children = [tree["props"].get("children")]
+    else:
+        return None
+    for child in children:
+        found = find_component(child, component_id)
+        if found is not None:
+            return found
+    return None
+
+
+def test_progressive_loading():
+    browser = Browser(progressive_loading=True)
+    children, *_ = browser.load_cards()
+    # The cards are first rendered as placeholders
+    loader_id = {"type": "card-loader", "index": "a"}
+    loader = find_component(children, loader_id)
+    assert loader["props"]["children"]["type"] == "Skeleton"
+    assert find_component(children, {"type": "card-visible", "index": "a"}) is None
+
+    # Each placeholder then loads the content of its card
+    hash_id = {"type": "card-hash", "index": "a"}
+    content, card_hash = browser.run(
+        "load_card_content",
+        [(loader_id, loader_id)],
+        browser.values("config", "global_", "layouts", "session"),
+        outputs={0: loader_id, 1: hash_id},
+    )
+    assert content == "A"
+    assert card_hash
+    # Once in the render cache, the card is rendered without a placeholder
+    children, *_ = browser.load_cards()
+    assert find_component(children, loader_id) is None
+
+
+def test_lazy_loading():
+    browser = Browser(lazy_loading=True)
+    children, *_ = browser.load_cards()
+    loader_id = {"type": "card-loader", "index": "b"}
+    visible_id = {"type": "card-visible", "index": "b"}
+    loader = find_component(children, loader_id)
+    assert loader["props"]["className"] == "cardcanvas-lazy"
+    assert find_component(children, visible_id) is not None
+
+    def load(visible):
+        return browser.run(
+            "load_card_content",
+            [(visible_id, visible)],
+            browser.values("config", "global_", "layouts", "session"),
+            outputs={0: loader_id, 1: {"type": "card-hash", "index": "b"}},
+        )
+
+    # The content is only loaded once assets/lazy.js marks the card as visible
+    assert load(None) == [NO_UPDATE, NO_UPDATE]
+    assert load(True)[0] == "B"
+
+
+@pytest.mark.parametrize("server_state", [False, True], ids=["client", "server"])
+def test_progressive_cards_depend_on_global_settings(server_state):
+    start_config = {
+        **START_CONFIG,
+        "card_config": {
+            **START_CONFIG["card_config"],
+            "a": {"card_class": "ColorCard", "settings": {"text": "A"}},
+        },
+    }
+    browser = Browser(
+        server_state=server_state, progressive_loading=True, start_config=start_config
+    )
+
+    def save_global_settings(**values):
+        setting_ids = [{"type": "global-settings", "setting": key} for key in values]
+        global_settings, _ = browser.run(
+            "save_global_settings",
+            [1],
+            [
+                [(i, i) for i in setting_ids],
+                list(zip(setting_ids, values.values())),
+                [(i, None) for i in setting_ids],
+                *browser.values("global_", "session"),
+            ],
+        )
+        browser.update(global_=global_settings)
+
+    save_global_settings(size="small", color="blue")
+    _, _, rendered, *_ = browser.load_cards()
+    # The global settings read by a card are known once its content is loaded
+    loaded = {}
+    for card_id in ("a", "b"):
+        loader_id = {"type": "card-loader", "index": card_id}
+        hash_id = {"type": "card-hash", "index": card_id}
+        _, loaded[card_id] = browser.run(
+            "load_card_content",
+            [(loader_id, loader_id)],
+            browser.values("config", "global_", "layouts", "session"),
+            outputs={0: loader_id, 1: hash_id},
+        )
+
+    # No card reads this setting
+    save_global_settings(size="large", color="blue")
+    children, *_ = browser.load_cards(rendered, loaded)
+    assert children is NO_UPDATE
+    # Only the card reading this one is rendered again
+    save_global_settings(size="large", color="red")
+    children, *_ = browser.load_cards(rendered, loaded)
+    assert operations(children) == [("Assign", [0])]
+
+
+def test_grid_changes_are_patched(browser):
+    _, _, rendered, *_ = browser.load_cards()
+    # Deleting a card only removes it from the grid
+    browser.delete("b")
+    children, _, rendered, *_ = browser.load_cards(rendered)
+    assert operations(children) == [("Delete", [1])]
+
+    # Changing the settings of a card only replaces it
+    setting_id = {"type": "card-settings", "id": "a", "setting": "text"}
+    config, _ = browser.run(
+        "save_card_settings",
+        [1],
+        [
+            [(setting_id, setting_id)],
+            [(setting_id, "Changed")],
+            [(setting_id, None)],
+            *browser.values("config", "session"),
+        ],
+    )
+    browser.update(config=config)
+    children, _, rendered, *_ = browser.load_cards(rendered)
+    assert operations(children) == [("Assign", [0])]
+    assert find_component(children["operations"][0]["params"]["value"], "a")
+
+    # A new card is added at the end
+    config, layouts = browser.run(
+        "add_new_card",
+        [{"i": "TextCard", "x": 0, "y": 8, "w": 4, "h": 2}],
+        browser.values("config", "layouts", "session"),
+    )
+    browser.update(config=config, layouts=layouts)
+    children, _, rendered, *_ = browser.load_cards(rendered)
+    assert operations(children) == [("Extend", [])]
+    assert [card_id for card_id, _ in rendered["cards"]] == [
+        "a",
+        *browser.read("config").keys() - {"a"},
+    ]
+
+
+def test_save_compacts_the_config(browser):
+    [session] = browser.values("session")
+    config = {
+        **START_CONFIG["card_config"],
+        "a": {**START_CONFIG["card_config"]["a"], "id": "a"},
+        "x": {"card_class": "RemovedCard", "settings": {}},
+    }
+    browser.stores["config"] = browser.state.write(session, "config", config)
+    main, layouts, config, _ = browser.run(
+        "save_reset_cards",
+        [1],
+        [
+            START_CONFIG["card_layouts"],
+            *browser.values("config", "global_", "layouts", "session", "main"),
+        ],
+    )
+    # The config store keeps the config that was saved
+    if not browser.state.enabled:
+        assert operations(config) == [("Delete", ["a", "id"]), ("Delete", ["x"])]
+    browser.update(config=config)
+    assert browser.read("config") == START_CONFIG["card_config"]
+    assert main["card_config"] == START_CONFIG["card_config"]
+
+
+@pytest.mark.parametrize("server_state", [False, True], ids=["client", "server"])
+def test_compressed_main_store(server_state):
+    browser = Browser(server_state=server_state, compress_main_store=True)
+    browser.delete("b")
+    saved_config = {"a": START_CONFIG["card_config"]["a"]}
+    saved_layouts = {"lg": START_CONFIG["card_layouts"]["lg"][:1]}
+
+    main, layouts, config, _ = browser.run(
+        "save_reset_cards",
+        [1],
+        [
+            saved_layouts,
+            *browser.values("config", "global_", "layouts", "session", "main"),
+        ],
+    )
+    assert codec.is_encoded(main)
+    assert config is NO_UPDATE
+    browser.update(main=main, layouts=layouts)
+    assert codec.decode_store(main)["card_config"] == saved_config
+    # Saving an unchanged layout does not rewrite it
+    main, *_ = browser.run(
+        "save_reset_cards",
+        [2],
+        [
+            saved_layouts,
+            *browser.values("config", "global_", "layouts", "session", "main"),
+        ],
+    )
+    assert main is NO_UPDATE
+
+    # A new page loads the encoded layout
+    config, layouts, _, _ = browser.run(
+        "load_layout", [None, None], browser.values("main")
+    )
+    assert browser.state.read(config) == saved_config
+    assert browser.state.read(layouts) == saved_layouts
+
+    # Downloaded layouts are plain JSON, and can be uploaded again
+    [download] = browser.run("download_layout", [1], browser.values("main"))
+    downloaded = codec.loads(download["content"])
+    assert downloaded["card_config"] == saved_config
+    assert "fingerprint" not in downloaded
+    contents = base64.b64encode(download["content"].encode("utf-8")).decode("ascii")
+    main, config, layouts = browser.run(
+        "upload_layout",
+        [f"data:application/json;base64,{contents}"],
+        browser.values("config", "layouts", "session"),
+    )
+    assert codec.decode_store(main)["card_config"] == saved_config
+    browser.update(main=main, config=config, layouts=layouts)
+    assert browser.read("config") == saved_config
+
+    # Clearing the layout keeps the saved one, which can be restored
+    config, layouts, global_settings, _ = browser.run(
+        "clear_layout", [1], browser.values("config", "layouts", "global_", "session")
+    )
+    browser.update(config=config, layouts=layouts, global_=global_settings)
+    assert browser.read("config") == {}
+    layouts, config, global_settings, _ = browser.run(
+        "reset_layouts",
+        [1],
+        browser.values("main", "config", "layouts", "global_", "session"),
+    )
+    browser.update(config=config, layouts=layouts, global_=global_settings)
+    assert browser.read("config") == saved_config
+    assert browser.read("layouts") == saved_layouts
+
+
+class SeriesCard(TextCard):
+    points_per_column = 2
+
+    def render(self):
+        series = self.data.series("t", "v", self.max_points())
+        figure = {
+            "data": [{"x": series["t"].tolist(), "y": series["v"].tolist()}],
+            # Plotly keeps the zoom while the uirevision does not change
+            "layout": {"uirevision": self.id},
+        }
+        return dcc.Graph(figure=figure, id=self.figure_id)
+
+    def render_relayout(self, relayout_data):
+        x_range = relayout_x_range(relayout_data)
+        if x_range is False:
+            return None
+        series = self.data.series("t", "v", self.max_points(), x_range=x_range)
+        figure = Patch()
+        figure["data"][0]["x"] = series["t"].tolist()
+        figure["data"][0]["y"] = series["v"].tolist()
+        return figure
+
+
+def test_series_card_zoom_and_resize():
+    pd = pytest.importorskip("pandas")
+    browser = Browser()
+    manager = browser.canvas.card_manager
+    manager.register_card_class(SeriesCard)
+    manager.register_data_source(
+        DataFrameSource(pd.DataFrame({"t": range(1000), "v": range(1000)}))
+    )
+    layouts = {
+        "lg": [
+            {"i": "a", "x": 0, "y": 0, "w": 4, "h": 4},
+            {"i": "s", "x": 4, "y": 0, "w": 4, "h": 4},
+        ]
+    }
+    browser.stores.update(
+        config={
+            "a": START_CONFIG["card_config"]["a"],
+            "s": {"card_class": "SeriesCard", "settings": {}},
+        },
+        layouts=layouts,
+    )
+    children, _, rendered, *_ = browser.load_cards()
+    figure = find_component(children, {"type": "card-figure", "index": "s"})
+    assert figure["props"]["figure"]["layout"]["uirevision"] == "s"
+    assert len(figure["props"]["figure"]["data"][0]["x"]) == 4 * 2
+
+    # Zooming only replaces the points, Plotly keeps the axes
+    figure_id = {"type": "card-figure", "index": "s"}
+    [patch] = browser.run(
+        "relayout_card",
+        [(figure_id, {"xaxis.range[0]": 100, "xaxis.range[1]": 200})],
+        browser.values("config", "global_", "layouts", "session"),
+        outputs={0: figure_id},
+    )
+    assert {tuple(op["location"][:2]) for op in patch["operations"]} == {("data", 0)}
+
+    # A wider card draws more points, other cards are left alone
+    wider = {**layouts["lg"][1], "w": 6}
+    browser.update(layouts={"lg": [layouts["lg"][0], wider]})
+    children, *_ = browser.load_cards(rendered)
+    [replaced] = [op for op in children["operations"] if op["operation"] == "Assign"]
+    assert replaced["location"] == [1]
+    figure = find_component(replaced["params"]["value"], figure_id)
+    assert len(figure["props"]["figure"]["data"][0]["x"]) == 6 * 2
@@ -0,0 +1,414 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cardcanvas import Card, CardLayouts, CardManager
+
+from .utils import apply_patch, patch_operations
+
+
+class CountingCard(Card):
+    calls = 0
+
+    def render(self):
+        CountingCard.calls += 1
+        return self.settings.get("text", "Hello")
+
+
+class UncachedCard(CountingCard):
+    cache = False
+
+
+def test_render_cache():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    CountingCard.calls = 0
+    config = {"a": {"card_class": "CountingCard", "settings": {"text": "A"}}}
+    manager.render(config)
+    manager.render(config)
+    assert CountingCard.calls == 1
+    assert manager.cache_stats.hits == 1
+
+    config["a"]["settings"]["text"] = "B"
+    manager.render(config)
+    assert CountingCard.calls == 2
+
+    assert manager.invalidate_cache(CountingCard) == 2
+    manager.render(config)
+    assert CountingCard.calls == 3
+
+
+def test_render_cache_opt_out():
+    manager = CardManager()
+    manager.register_card_class(UncachedCard)
+    CountingCard.calls = 0
+    config = {"a": {"card_class": "UncachedCard", "settings": {}}}
+    manager.render(config)
+    manager.render(config)
+    assert CountingCard.calls == 2
+
+
+class SlowCard(Card):
+    cache = False
+
+    def render(self):
+        time.sleep(0.2)
+        return self.settings["text"]
+
+
+class FailingCard(Card):
+    def render(self):
+        raise ValueError("broken")
+
+
+def test_render_thread_executor():
+    manager = CardManager(executor="thread", max_workers=4)
+    manager.register_card_class(SlowCard)
+    manager.register_card_class(FailingCard)
+    config = {
+        str(i): {"card_class": "SlowCard", "settings": {"text": str(i)}}
+        for i in range(4)
+    }
+    config["failing"] = {"card_class": "FailingCard", "settings": {}}
+    start = time.perf_counter()
+    children = manager.render(config)
+    assert time.perf_counter() - start < 0.6
+    assert [child.id for child in children] == ["0", "1", "2", "3", "failing"]
+    assert len(manager.render_cache) == 0
+
+
+class LockedCard(CountingCard):
+    cache = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+
+
+class LockCard(CountingCard):
+    cache = False
+
+    def render(self):
+        return threading.Lock()
+
+
+class CrashingCard(CountingCard):
+    cache = False
+
+    def render(self):
+        os._exit(1)
+
+
+def test_process_executor_errors():
+    manager = CardManager(executor="process", max_workers=1)
+    for card_class in (CountingCard, LockedCard, LockCard, CrashingCard):
+        manager.register_card_class(card_class)
+    config = {
+        "a": {"card_class": "CountingCard", "settings": {"text": "A"}},
+        "locked": {"card_class": "LockedCard", "settings": {"text": "L"}},
+        "lock": {"card_class": "LockCard", "settings": {}},
+    }
+    cards = list(manager.card_objects(config).values())
+    # Cards which can not be sent to a process are rendered here
+    contents = manager.render_contents(cards)
+    assert contents[:2] == ["A", "L"]
+    assert isinstance(contents[2], type(threading.Lock()))
+
+    # A worker dying only fails the cards it was rendering
+    config["crash"] = {"card_class": "CrashingCard", "settings": {}}
+    cards = list(manager.card_objects(config).values())
+    contents = manager.render_contents(cards)
+    assert contents[3].__class__.__name__ == "Alert"
+    # The broken pool is replaced
+    del config["crash"]
+    cards = list(manager.card_objects(config).values())
+    assert manager.render_contents(cards)[1] == "L"
+
+    # So is a pool which was shut down
+    manager._executor.shutdown()
+    assert manager.render_contents(cards)[1] == "L"
+    manager._executor.shutdown()
+
+
+def test_executor_created_once():
+    manager = CardManager(executor="process", max_workers=1)
+    with ThreadPoolExecutor(max_workers=8) as threads:
+        executors = list(threads.map(lambda _: manager._get_executor(), range(8)))
+    assert len({id(executor) for executor in executors}) == 1
+    # Processes are not forked from the multithreaded server
+    assert executors[0]._mp_context.get_start_method() == "spawn"
+    executors[0].shutdown()
+
+
+def test_card_object():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    config = {
+        "a": {"card_class": "CountingCard", "settings": {"text": "A"}},
+        "b": {"card_class": "Unknown", "settings": {}},
+    }
+    card = manager.card_object("a", config, session="1")
+    assert card.id == "a" and card.settings == {"text": "A"}
+    assert manager.card_object("a", config, session="1") is card
+    assert manager.card_object("b", config) is None
+    assert manager.card_object("c", config) is None
+    # Card objects are not shared between sessions
+    assert manager.card_object("a", config, session="2") is not card
+    assert manager.card_object("a", config) is not manager.card_object("a", config)
+    config["a"]["settings"]["text"] = "B"
+    assert manager.card_object("a", config, session="1") is not card
+
+
+def test_grid_width():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    config = {"a": {"card_class": "CountingCard", "settings": {}}}
+    assert manager.card_object("a", config).max_points() == 4 * 250
+    card = manager.card_object("a", config, grid_width=2)
+    assert card.grid_width == 2 and card.max_points() == 2 * 250
+    CountingCard.calls = 0
+    manager.render(config, widths={"a": 2})
+    manager.render(config, widths={"a": 3})
+    # The content depends on the width, so it is cached for each width
+    assert CountingCard.calls == 2
+
+
+def test_refresh_interval():
+    class FastCard(CountingCard):
+        interval = 1000
+
+    class SlowRefreshCard(CountingCard):
+        interval = 1500
+
+    manager = CardManager()
+    manager.register_card_class(FastCard)
+    manager.register_card_class(SlowRefreshCard)
+    assert manager.refresh_interval({"a": {"card_class": "CountingCard"}}) is None
+    config = {
+        "a": {"card_class": "FastCard"},
+        "b": {"card_class": "SlowRefreshCard"},
+    }
+    assert manager.refresh_interval(config) == 500
+
+    class OddRefreshCard(CountingCard):
+        interval = 999
+
+    manager.register_card_class(OddRefreshCard)
+    config["c"] = {"card_class": "OddRefreshCard"}
+    # The gcd is 1 ms, the tick is clamped
+    assert manager.refresh_interval(config) == 250
+    assert manager.refresh_interval(config, min_interval=100) == 100
+
+
+class GlobalTextCard(Card):
+    def render(self):
+        return self.global_settings.get("text", "")
+
+
+def test_global_settings_dependencies():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    manager.register_card_class(GlobalTextCard)
+    config = {
+        "a": {"card_class": "CountingCard", "settings": {}},
+        "b": {"card_class": "GlobalTextCard", "settings": {}},
+    }
+    manager.render(config, {"text": "x", "other": 1})
+
+    def hashes(global_settings):
+        return {
+            card_id: manager.card_hash(card_id, card, global_settings)
+            for card_id, card in config.items()
+        }
+
+    before = hashes({"text": "x", "other": 1})
+    after = hashes({"text": "x", "other": 2})
+    assert before == after
+    after = hashes({"text": "y", "other": 1})
+    assert before["a"] == after["a"] and before["b"] != after["b"]
+
+    CountingCard.calls = 0
+    manager.render(config, {"text": "x", "other": 3})
+    assert CountingCard.calls == 0
+
+
+@pytest.mark.parametrize(
+    "read",
+    [
+        len,
+        bool,
+        str,
+        repr,
+        list,
+        reversed,
+        lambda settings: settings | {},
+        lambda settings: {} | settings,
+        lambda settings: settings.setdefault("text"),
+        lambda settings: settings.pop("text", None),
+        lambda settings: settings.update(text="y"),
+    ],
+)
+def test_global_settings_read_all(read):
+    card = GlobalTextCard("a", {"text": "x"})
+    read(card.global_settings)
+    assert card.global_settings_dependencies() is None
+
+
+class EmptyCheckCard(Card):
+    def render(self):
+        return "empty" if not self.global_settings else "settings"
+
+
+def test_global_settings_truthiness():
+    manager = CardManager()
+    manager.register_card_class(EmptyCheckCard)
+    config = {"a": {"card_class": "EmptyCheckCard", "settings": {}}}
+    manager.render(config, {})
+    before = manager.card_hash("a", config["a"], {})
+    assert manager.card_hash("a", config["a"], {"text": "x"}) != before
+    assert manager.render_contents(
+        list(manager.card_objects(config, {"text": "x"}).values())
+    ) == ["settings"]
+
+
+def test_apply_operations():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    config = {
+        "a": {"card_class": "CountingCard", "settings": {"text": "A"}},
+        "b": {"card_class": "CountingCard", "settings": {"text": "B"}},
+    }
+    layouts = {
+        "lg": [
+            {"i": "a", "x": 0, "y": 0, "w": 4, "h": 4},
+            {"i": "b", "x": 4, "y": 0, "w": 4, "h": 2},
+        ]
+    }
+    changes = manager.apply_operations(
+        config,
+        layouts,
+        [
+            {"op": "duplicate", "card_id": "a"},
+            {"op": "delete", "card_id": "b"},
+            {"op": "add", "card_class": "CountingCard", "card_id": "c"},
+            {"op": "update", "card_id": "c", "settings": {"text": "C"}},
+        ],
+    )
+    copy_id = changes.added[0]
+    assert changes.added == [copy_id, "c"]
+    assert set(changes.card_config) == {"a", copy_id, "c"}
+    assert changes.card_config["c"]["settings"] == {"text": "C"}
+    assert [item["i"] for item in changes.card_layouts["lg"]] == ["a", copy_id, "c"]
+    # The new card is placed below the others
+    assert changes.card_layouts["lg"][2]["y"] == 4
+    # The inputs are not modified
+    assert set(config) == {"a", "b"}
+    assert len(layouts["lg"]) == 2
+
+    with pytest.raises(ValueError):
+        manager.apply_operations(config, layouts, [{"op": "delete", "card_id": "x"}])
+    # The patches turn the old values into the new ones
+    assert apply_patch(config, changes.config_patch) == changes.card_config
+    assert apply_patch(layouts, changes.layouts_patch) == changes.card_layouts
+
+
+def test_apply_operations_delete_items():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    config = {
+        card_id: {"card_class": "CountingCard", "settings": {}}
+        for card_id in ("a", "b", "c")
+    }
+    # The stored items may lack the keys the grid fills in
+    layouts = {
+        "lg": [{"i": "a", "x": 0, "y": 0}, {"i": "b", "x": 4}, {"i": "c", "x": 8}],
+        "sm": [{"i": "b"}, {"i": "c", "y": 4}, {"i": "b", "y": 8}],
+    }
+    changes = manager.apply_operations(
+        config, layouts, [{"op": "delete", "card_id": "b"}]
+    )
+    patched = apply_patch(layouts, changes.layouts_patch)
+    assert CardLayouts(patched).to_dict() == changes.card_layouts
+    # Items are deleted by position, and a list repeating a card is sent whole
+    assert patch_operations(changes.layouts_patch) == [
+        ("Delete", ["lg", 1]),
+        ("Assign", ["sm"]),
+    ]
+
+
+def test_apply_operations_packing():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    config = {str(i): {"card_class": "CountingCard", "settings": {}} for i in range(50)}
+    layouts = {
+        "lg": [
+            {"i": str(i), "x": (i % 3) * 4, "y": (i // 3) * 4, "w": 4, "h": 4}
+            for i in range(50)
+        ]
+    }
+    # The copy is placed over card 1, it is moved below it and pushes down the
+    # cards of that column
+    changes = manager.apply_operations(
+        config,
+        layouts,
+        [{"op": "duplicate", "card_id": "0", "layout": {"x": 4, "y": 0}}],
+        grid_cols={"lg": 12},
+    )
+    copy_id = changes.added[0]
+    assert apply_patch(layouts, changes.layouts_patch) == changes.card_layouts
+    operations = patch_operations(changes.layouts_patch)
+    # The new item is appended once, with its packed position
+    assert operations[-1] == ("Append", ["lg"])
+    assert changes.card_layouts["lg"][-1]["i"] == copy_id
+    assert changes.card_layouts["lg"][-1]["y"] == 4
+    # Only the y of the cards below it is assigned
+    moved = [location for _, location in operations[:-1]]
+    assert moved == [["lg", i, "y"] for i in range(4, 50, 3)]
+
+    # An added card deleted in the same batch is not sent
+    changes = manager.apply_operations(
+        config,
+        layouts,
+        [
+            {"op": "add", "card_class": "CountingCard", "card_id": "new"},
+            {"op": "delete", "card_id": "new"},
+        ],
+        grid_cols={"lg": 12},
+    )
+    assert changes.added == []
+    assert patch_operations(changes.layouts_patch) == []
+
+
+def test_compact_state():
+    manager = CardManager()
+    manager.register_card_class(CountingCard)
+    config = {
+        "a": {"card_class": "CountingCard", "settings": {}},
+        "b": {"card_class": "CountingCard", "settings": {}, "id": "b"},
+        "c": {"card_class": "RemovedCard", "settings": {}},
+    }
+    layouts = {
+        "lg": [
+            {"i": "a", "x": 0, "y": 0, "w": 4, "h": 4},
+            {"i": "a", "x": 4, "y": 0, "w": 4, "h": 4},
+            {"i": "c", "x": 8, "y": 0, "w": 4, "h": 4},
+            {"i": "d", "x": 0, "y": 4, "w": 4, "h": 4},
+        ]
+    }
+    new_config, new_layouts, report = manager.compact_state(config, layouts)
+    assert new_config == {
+        "a": {"card_class": "CountingCard", "settings": {}},
+        "b": {"card_class": "CountingCard", "settings": {}},
+    }
+    assert new_layouts == {"lg": [{"i": "a", "x": 0, "y": 0, "w": 4, "h": 4}]}
+    assert report.unknown_cards == ["c"]
+    assert report.orphaned_items == {"lg": ["c", "d"]}
+    assert report.duplicate_items == 1
+    assert report.redundant_ids == 1
+    assert "c" in config
+
+    _, _, report = manager.compact_state(new_config, new_layouts)
+    assert not report.changed
@@ -0,0 +1,26 @@
+import pytest
+
+from cardcanvas.codec import decode_store, encode_store
+
+
+def test_store_round_trip():
+    data = {
+        "card_config": {
+            str(i): {
+                "card_class": "MarkdownCard",
+                "settings": {"text": "# Title\n" * 50},
+            }
+            for i in range(20)
+        },
+        "card_layouts": {
+            "lg": [{"i": str(i), "x": 0, "y": i, "w": 4, "h": 2} for i in range(20)]
+        },
+    }
+    encoded = encode_store(data)
+    assert encoded["format"] == "cardcanvas/deflate"
+    assert len(encoded["data"]) < len(str(data)) / 10
+    assert decode_store(encoded) == data
+    # Uncompressed values saved earlier are read as they are
+    assert decode_store(data) == data
+    with pytest.raises(ValueError):
+        decode_store({**encoded, "version": 99})
@@ -0,0 +1,160 @@
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from cardcanvas import Card, CardManager, DataFrameSource, DataSource, load_frame
+from cardcanvas.data import init_worker, worker_state
+
+
+class ListSource(DataSource):
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+        self.runs = 0
+
+    def run(self, spec):
+        self.runs += 1
+        return [row for row in self.rows if row[spec["column"]] == spec["value"]]
+
+
+class DataCard(Card):
+    def render(self):
+        return len(self.data.query({"column": "kind", "value": "a"}))
+
+
+def test_data_source_shared_by_cards():
+    source = ListSource([{"kind": "a"}, {"kind": "b"}, {"kind": "a"}])
+    manager = CardManager(cache_size=0)
+    manager.register_card_class(DataCard)
+    manager.register_data_source(source)
+    config = {
+        str(index): {"card_class": "DataCard", "settings": {"index": index}}
+        for index in range(10)
+    }
+    assert (
+        manager.render_contents(list(manager.card_objects(config).values())) == [2] * 10
+    )
+    assert source.runs == 1
+    assert source.cache_stats.hits == 9
+
+    # Cards sent to a process pool only refer to the data source
+    card = manager.card_object("0", config)
+    assert len(pickle.dumps(card)) < 1000
+    assert pickle.loads(pickle.dumps(card)).data is source
+
+
+def test_data_source_in_process_pool():
+    manager = CardManager(cache_size=0, executor="process", max_workers=1)
+    manager.register_card_class(DataCard)
+    manager.register_data_source(ListSource([{"kind": "a"}] * 2))
+    config = {str(index): {"card_class": "DataCard"} for index in range(3)}
+    assert (
+        manager.render_contents(list(manager.card_objects(config).values())) == [2] * 3
+    )
+    # The processes are started again with the new data
+    manager.register_data_source(ListSource([{"kind": "a"}] * 5))
+    assert (
+        manager.render_contents(list(manager.card_objects(config).values())) == [5] * 3
+    )
+    manager._executor.shutdown()
+
+
+def test_init_worker():
+    source = ListSource([{"kind": "a"}])
+    source.query({"column": "kind", "value": "a"})
+    init_worker(pickle.loads(pickle.dumps(worker_state([source]))))
+    # In a render process, the source refers to the copy, with an empty cache
+    copy = pickle.loads(pickle.dumps(source))
+    assert copy is not source and copy.rows == source.rows
+    assert len(copy.cache) == 0
+
+
+class PlainCard(Card):
+    data_source = "other"
+
+    def render(self):
+        return "plain"
+
+
+def test_data_source_with_process_pool_passed():
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        manager = CardManager(cache_size=0, executor=executor)
+        manager.register_card_class(DataCard)
+        manager.register_card_class(PlainCard)
+        manager.register_data_source(ListSource([{"kind": "a"}]))
+        config = {
+            "0": {"card_class": "DataCard"},
+            "1": {"card_class": "PlainCard"},
+            "2": {"card_class": "DataCard"},
+        }
+        # Cards using a data source are rendered in this process
+        assert manager.render_contents(list(manager.card_objects(config).values())) == [
+            1,
+            "plain",
+            1,
+        ]
+
+
+def test_data_frame_source():
+    pd = pytest.importorskip("pandas")
+    frame = pd.DataFrame(
+        {"city": ["a", "b", "a", "c"], "age": [20, 30, 40, 50], "n": [1, 2, 3, 4]}
+    )
+    source = DataFrameSource(frame)
+    assert list(source.filter({"age": [25, 45]})["age"]) == [30, 40]
+    grouped = source.groupby("city", "n", "sum", filters={"city": ["a", "b"]})
+    assert grouped.to_dict("list") == {"city": ["a", "b"], "n": [4, 2]}
+    counts = source.value_counts("city", n=1)
+    assert counts.to_dict("list") == {"city": ["a"], "count": [2]}
+    # The filtered data is shared by the queries with the same filters
+    source.groupby("city", "n", "mean", filters={"city": ["a", "b"]})
+    assert source.cache_stats.hits == 1
+    # A column can be filtered twice with a list of pairs
+    both = source.filter([["age", [25, 60]], ["age", [0, 45]]])
+    assert list(both["age"]) == [30, 40]
+
+
+def test_column_info():
+    pd = pytest.importorskip("pandas")
+    frame = pd.DataFrame(
+        {"city": ["b", "a", None, "a"], "age": [20, 30, None, 40], "flag": [True] * 4}
+    )
+    source = DataFrameSource(frame, max_values=2)
+    city = source.column_info["city"]
+    assert city.categorical and not city.numeric
+    assert (city.count, city.cardinality, city.values) == (3, 2, ["a", "b"])
+    age = source.column_info["age"]
+    assert age.numeric and (age.min, age.max) == (20, 40)
+    # More distinct values than max_values are not listed
+    assert age.values is None
+    assert source.column_info["flag"].categorical
+
+
+def test_series():
+    pd = pytest.importorskip("pandas")
+    frame = pd.DataFrame(
+        {"t": range(1000, 0, -1), "v": [float(i % 7) for i in range(1000)]}
+    )
+    source = DataFrameSource(frame)
+    series = source.series("t", "v", 50)
+    assert len(series) == 50 and series["t"].is_monotonic_increasing
+    zoomed = source.series("t", "v", 50, x_range=(100, 200))
+    assert zoomed["t"].min() >= 99 and zoomed["t"].max() <= 201
+
+
+def test_load_frame(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    csv = tmp_path / "data.csv"
+    pd.DataFrame({"city": ["a", "b"], "age": [20, 30]}).to_csv(csv, index=False)
+    cache_dir = tmp_path / "cache"
+    frame = load_frame(csv, cache_dir=cache_dir)
+    assert frame["age"].tolist() == [20, 30]
+    # The next loads map the cached file instead of reading the source
+    csv.write_text("city,age\nc,40\n")
+    assert load_frame(csv, cache_dir=cache_dir)["city"].tolist() == ["a", "b"]
+    assert load_frame(csv, cache_dir=cache_dir, max_age=0)["age"].tolist() == [40]
+    source = DataFrameSource(frame)
+    assert source.column_info["city"].categorical
+    assert source.column_info["age"].numeric and source.column_info["age"].max == 30
@@ -0,0 +1,60 @@
+import pytest
+
+from cardcanvas.figures import (
+    bin_values,
+    bin_values_2d,
+    density_heatmap_figure,
+    downsample,
+    histogram_figure,
+    relayout_x_range,
+    target_points,
+)
+
+np = pytest.importorskip("numpy")
+
+
+def test_bin_values():
+    bins = bin_values([0, 1, 2, 3, float("nan")], nbins=2)
+    assert bins.edges == [0, 1.5, 3]
+    assert bins.counts == [2, 2]
+    assert bins.centers == [0.75, 2.25]
+
+    bins = bin_values(np.array(["b", "a", "b"], dtype=object))
+    assert (bins.labels, bins.counts) == (["a", "b"], [1, 2])
+
+    figure = histogram_figure({"a": bins, "b": bins})
+    assert len(figure.data) == 2
+
+
+def test_bin_values_2d():
+    bins = bin_values_2d([0, 1, 2, 3, np.nan], ["a", "b", "a", "a", "b"], nbinsx=2)
+    assert bins.y.labels == ["a", "b"]
+    # One row per y bin, one column per x bin
+    assert bins.counts == [[1, 2], [1, 0]]
+    assert bins.x.counts == [2, 2]
+    figure = density_heatmap_figure(bins)
+    assert figure.data[0].z is not None
+
+
+def test_downsample():
+    x = np.arange(10_000)
+    y = np.sin(x / 100)
+    y[5000] = 10
+    for method in ("lttb", "minmax"):
+        x_out, y_out = downsample(x, y, 200, method=method)
+        assert 100 <= len(x_out) <= 202
+        assert (x_out[0], x_out[-1]) == (0, 9999)
+        assert np.all(np.diff(x_out) > 0)
+        # The peak is kept
+        assert y_out.max() == 10
+    x_out, _ = downsample(x, y, 10, x_range=(100, 200))
+    assert len(x_out) == 10 and x_out[0] >= 99 and x_out[-1] <= 201
+    with pytest.raises(ValueError):
+        downsample(x, y, 10, method="mean")
+
+
+def test_relayout_x_range():
+    assert relayout_x_range({"xaxis.range[0]": 1, "xaxis.range[1]": 2}) == (1, 2)
+    assert relayout_x_range({"xaxis.autorange": True}) is None
+    assert relayout_x_range({"yaxis.range[0]": 1, "yaxis.range[1]": 2}) is False
+    assert target_points(4, 100) == 400
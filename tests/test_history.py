@@ -0,0 +1,82 @@
+import copy
+
+from cardcanvas import codec
+from cardcanvas.history import History, apply, diff, to_patch
+
+
+def test_diff_and_apply():
+    old = {
+        "config": {"a": {"settings": {"text": "A"}}, "b": {"settings": {}}},
+        "layouts": {"lg": [{"i": "a", "x": 0}, {"i": "b", "x": 4}]},
+    }
+    new = copy.deepcopy(old)
+    new["config"]["a"]["settings"]["text"] = "B"
+    del new["config"]["b"]
+    new["layouts"]["lg"].pop()
+    new["layouts"]["lg"].append({"i": "c", "x": 8})
+    new["layouts"]["lg"].append({"i": "d", "x": 0})
+
+    forward, backward = diff(old, new)
+    assert {"op": "set", "path": ["config", "a", "settings", "text"], "value": "B"} in (
+        forward
+    )
+    assert apply(copy.deepcopy(old), forward) == new
+    assert apply(copy.deepcopy(new), backward) == old
+    assert diff(old, copy.deepcopy(old)) == ([], [])
+    assert to_patch([{"op": "set", "path": [], "value": {}}]) is None
+
+
+def test_history():
+    history = History(max_steps=2)
+    history.record({"a": 1})
+    assert not history.can_undo
+    for value in (2, 3, 4):
+        assert history.record({"a": value})
+    assert not history.record({"a": 4})
+    assert len(history) == 2
+
+    history.undo()
+    assert history.current == {"a": 3}
+    history.undo()
+    assert history.current == {"a": 2}
+    assert history.undo() is None
+    history.redo()
+    assert history.current == {"a": 3}
+    # Recording the state set by undo or redo does not add a step
+    assert not history.record({"a": 3})
+    assert history.can_redo
+
+    history.record({"a": 5})
+    assert not history.can_redo
+    assert history.size > 0
+
+
+def test_record_values():
+    history = History()
+    # A key starts from its previous value, or from its first value without one
+    assert not history.record_values({"global": {}})
+    assert history.record_values(
+        {"config": {"a": 2}, "layouts": {"lg": [1]}},
+        previous={"config": {"a": 1}, "layouts": {"lg": []}},
+    )
+    assert not history.record_values({"config": {"a": 2}})
+    assert len(history) == 1
+    history.undo()
+    assert history.current == {"config": {"a": 1}, "layouts": {"lg": []}, "global": {}}
+
+
+def test_history_size():
+    state = {"config": {str(i): "x" * 100 for i in range(10)}}
+    size = len(codec.dumps(state))
+    history = History(max_bytes=size + 200)
+    history.record(state)
+    assert history.size == size
+    for i in range(5):
+        history.record({"config": {**state["config"], "0": str(i)}})
+    # The current state counts in the budget, so only the last steps are kept
+    assert 0 < len(history) < 5
+    assert history.size <= history.max_bytes
+    # A state larger than the budget is not kept
+    history.record({"config": {**state["config"], "big": "x" * 1000}})
+    assert history.current is None and not history.can_undo
+    assert history.size == 0
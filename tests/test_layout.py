@@ -0,0 +1,57 @@
+from cardcanvas import CardLayouts
+
+
+def test_card_layouts():
+    layouts = CardLayouts(
+        {
+            "lg": [
+                {"i": "a", "x": 0, "y": 0, "w": 4, "h": 4, "minW": 2},
+                {"i": "b", "x": 4, "y": 0, "w": 4, "h": 6},
+            ],
+            "sm": [{"i": "a", "x": 0, "y": 0, "w": 2, "h": 4}],
+        }
+    )
+    assert "a" in layouts and "c" not in layouts
+    assert layouts.get("b", "lg").h == 6
+    assert layouts.get("b", "sm") is None
+    assert layouts.bottom("lg") == 6
+    assert layouts.index("b", "lg") == 1 and layouts.index("b", "sm") is None
+    assert layouts.is_normalized("lg")
+    assert not CardLayouts({"lg": [{"i": "a"}, {"i": "a"}]}).is_normalized("lg")
+
+    layouts.move("a", "lg", x=8, y=2)
+    assert layouts.duplicate("a", "c").keys() == {"lg", "sm"}
+    assert layouts.delete("b").keys() == {"lg"}
+    assert layouts.to_dict() == {
+        "lg": [
+            {"i": "a", "x": 8, "y": 2, "w": 4, "h": 4, "minW": 2},
+            {"i": "c", "x": 8, "y": 2, "w": 4, "h": 4, "minW": 2},
+        ],
+        "sm": [
+            {"i": "a", "x": 0, "y": 0, "w": 2, "h": 4},
+            {"i": "c", "x": 0, "y": 0, "w": 2, "h": 4},
+        ],
+    }
+
+
+def test_pack():
+    layouts = CardLayouts(
+        {
+            "lg": [
+                {"i": "a", "x": 0, "y": 0, "w": 6, "h": 4},
+                {"i": "b", "x": 4, "y": 2, "w": 6, "h": 2},
+                {"i": "c", "x": 10, "y": 10, "w": 2, "h": 2},
+            ],
+            "sm": [{"i": "a", "x": 4, "y": 0, "w": 12, "h": 4}],
+        }
+    )
+    assert layouts.pack_all({"lg": 12, "sm": 6}) == ["lg", "sm"]
+    # b overlapped a and is moved below it, c did not overlap anything
+    assert (layouts.get("b", "lg").x, layouts.get("b", "lg").y) == (4, 4)
+    assert layouts.get("c", "lg").y == 10
+    # a is narrowed to the columns of the breakpoint
+    assert (layouts.get("a", "sm").x, layouts.get("a", "sm").w) == (0, 6)
+
+    layouts.pack("lg", 12, compact=True)
+    assert layouts.get("c", "lg").y == 0
+    assert not layouts.pack("lg", 12, compact=True)
@@ -1,5 +1,10 @@
 from dash import Dash
 from cardcanvas import CardCanvas, Card
+from cardcanvas.helpers import (
+    combine_fingerprints,
+    diff_cards,
+    layouts_fingerprint,
+)
 
 
 class TestCard(Card):
@@ -16,3 +21,31 @@ def test_main():
     dashboard.card_manager.register_card_class(TestCard)
     assert dashboard.card_manager.card_classes == {"TestCard": TestCard}
     assert isinstance(dashboard.app, Dash)
+
+
+def test_diff_cards():
+    previous = [["a", "1"], ["b", "1"], ["c", "1"]]
+    assert diff_cards(previous, {"a": "1", "b": "1", "c": "1"}) == ([], [], [])
+    assert diff_cards(previous, {"a": "1", "c": "2", "d": "1"}) == (
+        [1],
+        [(1, "c")],
+        ["d"],
+    )
+    assert diff_cards(previous, {"c": "1", "a": "1"}) is None
+
+
+def test_fingerprints():
+    hashes = {"a": "1", "b": "2", "c": "3"}
+    combined = combine_fingerprints(hashes)
+    assert combine_fingerprints(dict(reversed(hashes.items()))) == combined
+
+    assert combine_fingerprints({"a": "1", "b": "4", "c": "3"}) != combined
+
+    item_a = {"i": "a", "x": 0, "y": 0, "w": 4, "h": 4}
+    item_b = {"i": "b", "x": 4, "y": 0, "w": 4, "h": 4}
+    assert layouts_fingerprint({"lg": [item_a, item_b]}) == layouts_fingerprint(
+        {"lg": [item_b, item_a]}
+    )
+    assert layouts_fingerprint({"lg": [item_a]}) != layouts_fingerprint(
+        {"lg": [{**item_a, "x": 2}]}
+    )
@@ -0,0 +1,27 @@
+from cardcanvas import Card, CardManager
+from cardcanvas.refresh import BackgroundRefresher
+
+
+class ClockCard(Card):
+    interval = 10_000
+    renders = 0
+
+    def render(self):
+        ClockCard.renders += 1
+        return ClockCard.renders
+
+
+def test_refresher_shares_renders():
+    manager = CardManager()
+    manager.register_card_class(ClockCard)
+    refresher = BackgroundRefresher(manager)
+    config = {"a": {"card_class": "ClockCard", "settings": {}}}
+    # Two viewers of the same card get the same content from one render
+    first = refresher.get(manager.card_objects(config)["a"])
+    second = refresher.get(manager.card_objects(config)["a"])
+    assert first == second == 1
+    assert len(refresher) == 1
+
+    next(iter(refresher._jobs.values())).next_due = 0
+    refresher.refresh()
+    assert refresher.get(manager.card_objects(config)["a"]) == 2
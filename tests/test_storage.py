@@ -0,0 +1,50 @@
+import pytest
+
+from cardcanvas import FileStateStore, MemoryStateStore, SQLiteStateStore
+from cardcanvas.storage import MissingStateError, ServerState
+
+
+@pytest.fixture(params=["memory", "sqlite", "file"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateStore()
+    if request.param == "sqlite":
+        return SQLiteStateStore(tmp_path / "state.db")
+    return FileStateStore(tmp_path / "state")
+
+
+def test_state_store(store):
+    assert store.load("a") is None
+    assert store.save("a", {"x": [1, 2]}) == 1
+    assert store.save("a", {"x": [3]}) == 2
+    assert store.load("a") == {"x": [3]}
+    store.delete("a")
+    assert store.load("a") is None
+
+
+def test_server_state(store):
+    state = ServerState(store)
+    ref = state.write("session", "config", {"card": {"card_class": "A"}})
+    assert ref == {"key": "session:config", "version": 1}
+    assert state.read(ref) == {"card": {"card_class": "A"}}
+    assert ServerState().write("session", "config", {"a": 1}) == {"a": 1}
+
+    with pytest.raises(MissingStateError):
+        state.read({"key": "other:config", "version": 1})
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "file"])
+def test_server_state_prune(kind, tmp_path):
+    if kind == "sqlite":
+        store = SQLiteStateStore(tmp_path / "state.db")
+    else:
+        store = FileStateStore(tmp_path / "state")
+    state = ServerState(store, max_age=0)
+    ref = state.write("session", "config", {"a": 1})
+    assert state.prune() == 1
+    with pytest.raises(MissingStateError):
+        state.read(ref)
+    # Pruning is skipped until the interval passed
+    state.write("session", "config", {"a": 1})
+    assert state.prune() == 0
+    assert ServerState(store).prune() == 0
@@ -0,0 +1,28 @@
+import itertools
+import json
+
+from cardcanvas import Card, CardManager
+from cardcanvas.streaming import StreamHub
+
+
+class CounterCard(Card):
+    interval = 10
+    stream = True
+    counter = itertools.count()
+
+    def render(self):
+        # Changes on every second render only
+        return str(next(self.counter) // 2)
+
+
+def test_stream_pushes_changes_only():
+    manager = CardManager()
+    manager.register_card_class(CounterCard)
+    hub = StreamHub(manager)
+    assert hub.subscribe({"a": {"card_class": "Card"}}) is None
+    token = hub.subscribe({"a": {"card_class": "CounterCard", "settings": {}}})
+    events = hub.stream(token, hub._subscriptions[token])
+    messages = [json.loads(next(events)[len("data: ") :]) for _ in range(2)]
+    assert messages == [{"id": "a", "content": "1"}, {"id": "a", "content": "2"}]
+    events.close()
+    assert token not in hub._subscriptions
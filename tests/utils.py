@@ -0,0 +1,148 @@
+import copy
+import json
+
+
+def apply_patch(value, patch):
+    """Apply a `dash.Patch` to a value, like the browser does."""
+    return apply_patch_operations(value, patch.to_plotly_json()["operations"])
+
+
+def apply_patch_operations(value, operations):
+    value = copy.deepcopy(value)
+    for operation in operations:
+        *path, last = operation["location"] or [None]
+        params = operation["params"]
+        target = value
+        for key in path:
+            target = target[key]
+        name = operation["operation"]
+        if name == "Assign":
+            target[last] = params["value"]
+        elif name == "Delete":
+            del target[last]
+        elif name == "Append":
+            target[last].append(params["value"])
+        elif name == "Extend":
+            target[last].extend(params["value"])
+        elif name == "Insert":
+            target[last].insert(params["index"], params["value"])
+        elif name == "Remove":
+            target[last].remove(params["value"])
+        else:
+            raise NotImplementedError(name)
+    return value
+
+
+def patch_operations(patch):
+    """Return the operations of a `dash.Patch` as (operation, location) pairs."""
+    return [
+        (operation["operation"], operation["location"])
+        for operation in patch.to_plotly_json()["operations"]
+    ]
+
+
+NO_UPDATE = object()
+
+
+def _stringify_id(component_id):
+    if isinstance(component_id, dict):
+        return json.dumps(component_id, sort_keys=True, separators=(",", ":"))
+    return component_id
+
+
+def _dependency(dependency, value):
+    component_id = dependency["id"]
+    prop = dependency["property"]
+    if not component_id.startswith("{"):
+        return {"id": component_id, "property": prop, "value": value}
+    wildcards = json.loads(component_id).values()
+    if ["ALL"] in wildcards:
+        # The value is a list of (id, value) pairs
+        return [{"id": i, "property": prop, "value": v} for i, v in value]
+    # The value of a MATCH dependency is an (id, value) pair
+    return {"id": value[0], "property": prop, "value": value[1]}
+
+
+def run_callback(app, name, inputs, state=(), outputs=None, triggered=0):
+    """Call a callback of `app` through the Dash endpoint, like the browser.
+
+    Args:
+        app: The Dash app.
+        name: The name of the callback function.
+        inputs: The values of the inputs, in order. Wildcard inputs take a list
+            of (id, value) pairs (ALL) or one pair (MATCH).
+        state: The values of the states, like `inputs`.
+        outputs: The ids of the wildcard outputs, by output index: a list of ids
+            for ALL, one id for MATCH.
+        triggered: The index of the input which changed, or its id.
+
+    Returns:
+        list: The value of each output, `NO_UPDATE` if it is not updated. ALL
+            outputs return a list of values.
+    """
+    key, spec = next(
+        (key, spec)
+        for key, spec in app.callback_map.items()
+        if spec["callback"].__name__ == name
+    )
+    outputs = outputs or {}
+    output_list = spec["output"]
+    if not isinstance(output_list, list):
+        output_list = [output_list]
+    output_specs = []
+    for index, output in enumerate(output_list):
+        component_id = output.component_id
+        prop = output.component_property
+        if isinstance(component_id, dict):
+            ids = outputs[index]
+            if isinstance(ids, list):
+                output_specs.append([{"id": i, "property": prop} for i in ids])
+            else:
+                output_specs.append({"id": ids, "property": prop})
+        else:
+            output_specs.append({"id": component_id, "property": prop})
+    input_values = [_dependency(d, v) for d, v in zip(spec["inputs"], inputs)]
+    state_values = [_dependency(d, v) for d, v in zip(spec["state"], state)]
+    if isinstance(triggered, int):
+        changed = input_values[triggered]
+        if isinstance(changed, list):
+            changed = changed[0]
+        triggered = changed["id"]
+        triggered_prop = changed["property"]
+    else:
+        triggered_prop = spec["inputs"][0]["property"]
+    body = {
+        "output": key,
+        "outputs": output_specs if len(output_list) > 1 else output_specs[0],
+        "inputs": input_values,
+        "state": state_values,
+        "changedPropIds": [f"{_stringify_id(triggered)}.{triggered_prop}"],
+    }
+    with app.server.test_client() as client:
+        # Flask would sort the keys, the browser keeps their order
+        result = client.post(
+            "/_dash-update-component",
+            data=json.dumps(body),
+            content_type="application/json",
+        )
+    if result.status_code == 204:
+        return [NO_UPDATE] * len(output_specs)
+    assert result.status_code == 200, result.get_data(as_text=True)
+    response = result.get_json()["response"]
+
+    def value(output_spec):
+        if isinstance(output_spec, list):
+            return [value(item) for item in output_spec]
+        prop = output_spec["property"].split("@")[0]
+        return response.get(_stringify_id(output_spec["id"]), {}).get(prop, NO_UPDATE)
+
+    return [value(output_spec) for output_spec in output_specs]
+
+
+def patch_value(value, update):
+    """Return the new value of a store after a callback returned `update`."""
+    if update is NO_UPDATE:
+        return value
+    if isinstance(update, dict) and "__dash_patch_update" in update:
+        return apply_patch_operations(value, update["operations"])
+    return update